@@ -2,37 +2,44 @@
 For Menhir FX
 author: Angele Sionneau asionneau@artfx.fr
 '''
+import os
 from threading import Thread
-from time import sleep, time
-import json
 import traceback
 
 from Process import Process, Path, Status
-from monitor_utils.config import monitor, mhfx_path
-from monitor_utils.windows import get_current_window, get_entity, does_process_exists, get_pid_by_process_name, is_user_afk
-from monitor_utils.file import get_data
-from monitor_utils.data_management import update_data, push_data, get_processes, push_processes, remove_processes, get_last_process, push_last_process
+from monitor_utils.config import monitor
+from monitor_utils.windows import get_current_window, does_process_exists, get_pid_by_process_name, get_user_idle_seconds
+from monitor_utils.data_management import get_processes, push_processes, remove_processes, get_last_process, push_last_process, processes_batch
 from monitor_utils.mhfx_log import log
+import monitor_utils.clock as clock
+from monitor_utils.metrics import metrics
+from monitor_utils.entity import get_entity
+from monitor_utils.focus import FocusTracker
+from monitor_utils.scheduler import Scheduler
+import monitor_utils.journal as journal
 
 
 class Monitor(object):
     def __init__(self):
         self.thread = None
-        self.wait = monitor.wait_sec
-        self.id = str(id(self))
+        self.scheduler = None
+        self.tracker = None
+        # unique between the DCCs, it names the monitor's processes file
+        self.id = f"{os.getpid()}_{id(self)}"
         self.initialize_variables()
     
     def initialize_variables(self):
         '''
         Set the variables to initial value.
         '''
-        self.cycle_incr = 0
+        self.compact_incr = 0
         self.processes = {}
         self.is_running = False
-        self.last_wait_start = None
+        self.is_afk = False
+        self.last_sample = None
+        self.sample_rest = 0.0
         self.other_session_sec = 0
         self.last_process = None
-        self.wait_rest = 0.0
 
     def start_thread(self):
         '''
@@ -49,7 +56,7 @@ class Monitor(object):
             self.thread.start()
         
         except Exception as e:
-            log(traceback.format_exc())
+            log.error(traceback.format_exc())
     
     def stop_thread(self):
         '''
@@ -59,26 +66,27 @@ class Monitor(object):
             processes = get_processes()
             if len(processes) <= 0:
                 push_last_process({})
-            self.manage_processes_data()
+            self.manage_processes_data(compact=True)
             self.initialize_variables()
-            self.cycle_incr = 0
         except Exception as e:
-            log(traceback.format_exc())
+            log.error(traceback.format_exc())
     
+    @metrics.timed('add_process_seconds', histogram=True)
     def add_process(self, filename: Path, executable: str, pid: int):
         '''
-        Create an object Process and convert it to dict. This dict will be writen in the processes.json file.
+        Create an object Process and convert it to dict. This dict will be writen in the monitor processes file.
         If pid already exists, don't write it and change initial proc infos. 
 
         :param filename: pathlib.Path
         :param executables: str, from config.monitor.executables
+        :return: int, pid of the process, None if it can't be added
         '''
         try:
 
             # If it's a new process
             if pid == -1:
                 # get the pid
-                pid = int(get_pid_by_process_name(executable, self.processes))
+                pid = int(get_pid_by_process_name(executable, get_processes()))
 
             # else it's an existing process
             else:
@@ -98,7 +106,7 @@ class Monitor(object):
                 except:
                     if monitor.debug_mode:
                         log(f"For unknown reason, pid doesn't exist in processes.")
-                    pid = int(get_pid_by_process_name(executable, self.processes)) 
+                    pid = int(get_pid_by_process_name(executable, get_processes())) 
 
 
             # get process of the monitor and update it with new process
@@ -111,111 +119,218 @@ class Monitor(object):
             if monitor.debug_mode :
                 log(f"New process added: {proc.as_dict()}.")
                 log(f"Last process updated: {proc.as_dict()}.")
+            return pid
 
         except:
-            log(traceback.format_exc())
+            log.error(traceback.format_exc())
 
     def run(self):
         '''
-        The action of the monitor thread.
-        Every a certain amount of second : check the foreground window and update the processes accordingly.
-        Every cycle: crite processes data in tracker data.
-        stop the thread if unused or all the processes are closed.
+        The action of the monitor thread, a loop on a deadline scheduler:
+        sample : every monitor_interval_seconds, add the elapsed time to the foreground window.
+            Replaced by the foreground events of a FocusTracker if monitor.event_driven.
+        liveness : every liveness_interval_seconds, check the processes still exist and stop the thread if all are closed.
+        flush : every data_save_interval_seconds, write processes data to tracker data.
+        afk : when the user could become afk or, while afk, every monitor_interval_afk_seconds.
+        The thread sleeps until the nearest deadline.
         '''
-        while self.is_running:
-            try:
-                # wait wait_sec seconds
-                if monitor.debug_mode:
-                    log(f'#################  go wait for {self.wait} sec with monitor {self.id} #################')
-                sleep(self.wait)
-                if monitor.debug_mode:
-                    log(f'################# Monitor : {self.id} waited #################')
+        self.scheduler = Scheduler()
+        self.tracker = self.start_focus_tracker() if monitor.event_driven else None
+        if self.tracker == None:
+            self.last_sample = clock.monotonic()
+            self.scheduler.add('sample', self.sample_foreground, monitor.wait_sec)
+        self.scheduler.add('liveness', self.check_processes, monitor.liveness_interval_sec)
+        self.scheduler.add('flush', self.flush_cycle, monitor.total_cycle)
+        self.scheduler.add('afk', self.check_afk, monitor.wait_sec_afk, delay=0)
+        if metrics.enabled:
+            self.scheduler.add('metrics', metrics.write, monitor.metrics_interval_sec)
 
-                # check if user is AFK
-                if is_user_afk(monitor.user_afk_sec):
+        try:
+            while self.is_running:
+                try:
+                    timeout = self.scheduler.time_until_next()
                     if monitor.debug_mode:
-                        log("user is afk")
-                    self.last_wait_start = time()
-                    if self.wait == monitor.wait_sec:
-                        self.change_last_proc_time(-(monitor.user_afk_sec))
-                    self.wait = monitor.wait_sec_afk
-                else:
-                    self.wait = monitor.wait_sec
-                    # count how many proc are closed
-                    self.processes = get_processes(self.id)
-                    proc_closed = 0
-                    for pid, infos in self.processes.items():
-                        pid = int(pid)
-                        if not does_process_exists(pid):
-                            self.processes[str(pid)]['status'] = Status.OLD.name
-                            proc_closed += 1
-                    # if all proc closed, sppr processes and stop thread
-                    if len(self.processes) <= proc_closed:
-                            if monitor.debug_mode:
-                                log(f'!!!!!!!!!!!!! all the proc are closed for monitor {self.id} !!!!!!!!!!!!!')
-                            remove_processes(self.processes.keys())
-                            self.stop_thread()
-                    # elif monitor no longer has a process, stop thread
-                    elif len(self.processes) == 0:
-                        if monitor.debug_mode:
-                                log(f"Monitor {self.id} no longer has a process. Stopping monitor thread.")
-                        self.stop_thread()
+                        log(f'#################  go wait for {timeout:.3f} sec with monitor {self.id} #################')
+                    if self.tracker != None:
+                        self.tracker.wait(timeout)
                     else:
-                        # get current window
-                        wndw = get_current_window()
-                        window_pid = str(wndw.get('pid'))
-                        if monitor.debug_mode:
-                            log(f"current window : {wndw.get('pid')} - {wndw.get('title')} - {wndw.get('name')}".encode('ascii', 'ignore').decode('ascii'))
-                        
-                        # last_wait_start
-                        if self.last_wait_start == None:
-                            to_add_sec = self.wait
-                        else:
-                            now = time()
-                            delta = now - self.last_wait_start + self.wait_rest
-                            to_add_sec = int(delta)
-                            self.wait_rest = delta - to_add_sec
-                        self.last_wait_start = time()
-
-                        # if current window is monitored, update it
-                        if window_pid in self.processes:
-                            # if right monitor
-                            if self.processes[window_pid].get('monitor_id') == self.id:
-                                # update process 
-                                self.processes[window_pid]['time'] += to_add_sec
-                                self.processes[window_pid]['afk_sec'] = 0
-                                self.processes[window_pid]['status'] = Status.ACTIVE.name
-
-                                # update last process
-                                self.last_process = {window_pid : self.processes[window_pid]}
-                                push_last_process(self.last_process)
-                                if monitor.debug_mode:
-                                    log(f"update this process by adding {to_add_sec} seconds :")
-                                    log({window_pid: self.processes[window_pid]})
-                                    log(f'last process updated')
-
-                                # other session reinitialization
-                                self.other_session_sec = 0
-
-                                # push processes
-                                push_processes(self.processes, self.id)
-                        # else other session add to last session
-                        else :
-                            if monitor.debug_mode:
-                                log(f"current window is not monitored. Add it to last session")
-                            self.change_last_proc_time(to_add_sec)
-                        
-                        # if cycle complete, write processes data to tracker data
-                        self.cycle_incr += to_add_sec
-                        if self.cycle_incr >= monitor.total_cycle and self.is_running == True:
-                            if monitor.debug_mode:
-                                log(f" ~~~~~~~~~~~~~~~~ Cycle complete ~~~~~~~~~~~~~~~~")
-                            self.cycle_incr = 0
-                            self.manage_processes_data()
-
-            except Exception as e:
-                log(f"An exception occurred: {e}")
-                log(traceback.format_exc())
+                        clock.sleep(timeout)
+                    if monitor.debug_mode:
+                        log(f'################# Monitor : {self.id} waited #################')
+                    metrics.inc('wakeups_total')
+
+                    # processes tmp files are written once at the end of the check
+                    with processes_batch():
+                        self.processes = get_processes(self.id)
+                        if self.tracker != None:
+                            self.drain_focus()
+                        self.scheduler.run_pending(lambda: self.is_running)
+
+                except Exception as e:
+                    log.error(f"An exception occurred: {e}")
+                    log.error(traceback.format_exc())
+        finally:
+            if self.tracker != None:
+                self.tracker.stop()
+                self.tracker = None
+            metrics.write()
+
+    def start_focus_tracker(self):
+        '''
+        :return: FocusTracker listening to the foreground changes, None if the backend can't
+        '''
+        tracker = FocusTracker()
+        try:
+            tracker.start()
+            return tracker
+        except:
+            log.error(traceback.format_exc())
+            log("Foreground events unavailable, monitor falls back to sampling.")
+            return None
+
+    def sample_foreground(self):
+        '''
+        Task sample: add the time elapsed since the last sample to the foreground window.
+        '''
+        if self.is_afk:
+            return
+        wndw = get_current_window()
+        window_pid = str(wndw.get('pid'))
+        if monitor.debug_mode:
+            log(f"current window : {wndw.get('pid')} - {wndw.get('title')} - {wndw.get('name')}".encode('ascii', 'ignore').decode('ascii'))
+
+        now = clock.monotonic()
+        delta = now - self.last_sample + self.sample_rest
+        to_add_sec = int(delta)
+        self.sample_rest = delta - to_add_sec
+        self.last_sample = now
+
+        self.add_window_time(window_pid, to_add_sec)
+
+    def drain_focus(self, idle_sec: float = 0):
+        '''
+        Add the focus intervals of the FocusTracker to the windows.
+
+        :param idle_sec: float, last seconds of the intervals the user was afk
+        '''
+        if self.is_afk:
+            self.tracker.discard()
+            return
+        for pid, seconds in self.tracker.drain(idle_sec).items():
+            if seconds > 0:
+                self.add_window_time(str(pid), seconds)
+
+    def check_afk(self):
+        '''
+        Task afk: switch between active and afk, and schedule the next check.
+        Active, the next check is when the user would reach user_afk_sec without input.
+        Afk, the sampling is paused and the user is checked every wait_sec_afk.
+        '''
+        idle_sec = get_user_idle_seconds()
+        if monitor.debug_mode:
+            log(f"Last user input happened {idle_sec} seconds ago. max allowed = {monitor.user_afk_sec}")
+
+        if idle_sec >= monitor.user_afk_sec:
+            if not self.is_afk:
+                if monitor.debug_mode:
+                    log("user is afk")
+                if self.tracker != None:
+                    # the idle time is cut from the focus intervals
+                    self.drain_focus(idle_sec)
+                else:
+                    self.change_last_proc_time(-(monitor.user_afk_sec))
+                self.is_afk = True
+            self.scheduler.reschedule('afk', monitor.wait_sec_afk)
+        else:
+            if self.is_afk:
+                if monitor.debug_mode:
+                    log("user is back")
+                self.is_afk = False
+                if self.tracker != None:
+                    self.tracker.discard()
+                else:
+                    self.last_sample = clock.monotonic()
+                    self.sample_rest = 0.0
+            self.scheduler.reschedule('afk', monitor.user_afk_sec - idle_sec)
+
+    def flush_cycle(self):
+        '''
+        Task flush: write processes data to tracker data, unless the user is afk.
+        '''
+        if self.is_afk:
+            return
+        if monitor.debug_mode:
+            log(f" ~~~~~~~~~~~~~~~~ Cycle complete ~~~~~~~~~~~~~~~~")
+        self.manage_processes_data()
+
+    def check_processes(self):
+        '''
+        Mark the closed processes of the monitor as OLD.
+        If all of them are closed, remove them and stop the thread.
+
+        :return: bool, False if the thread was stopped
+        '''
+        # count how many proc are closed
+        with processes_batch():
+            self.processes = get_processes(self.id)
+            proc_closed = 0
+            for pid, infos in self.processes.items():
+                pid = int(pid)
+                if not does_process_exists(pid):
+                    self.processes[str(pid)]['status'] = Status.OLD.name
+                    proc_closed += 1
+            if proc_closed > 0:
+                # the next wakeup reloads the processes, they must stay OLD
+                push_processes(self.processes, self.id)
+        # if all proc closed, sppr processes and stop thread
+        if len(self.processes) <= proc_closed:
+                if monitor.debug_mode:
+                    log(f'!!!!!!!!!!!!! all the proc are closed for monitor {self.id} !!!!!!!!!!!!!')
+                remove_processes(self.processes.keys())
+                self.stop_thread()
+                return False
+        # elif monitor no longer has a process, stop thread
+        elif len(self.processes) == 0:
+            if monitor.debug_mode:
+                    log(f"Monitor {self.id} no longer has a process. Stopping monitor thread.")
+            self.stop_thread()
+            return False
+        return True
+
+    def add_window_time(self, window_pid: str, to_add_sec: int):
+        '''
+        Add time to the process of the window if the monitor tracks it, else to the last process.
+
+        :param window_pid: str, pid of the window
+        :param to_add_sec: int
+        '''
+        # if current window is monitored, update it
+        if window_pid in self.processes:
+            # if right monitor
+            if self.processes[window_pid].get('monitor_id') == self.id:
+                # update process 
+                self.processes[window_pid]['time'] += to_add_sec
+                self.processes[window_pid]['afk_sec'] = 0
+                self.processes[window_pid]['status'] = Status.ACTIVE.name
+
+                # update last process
+                self.last_process = {window_pid : self.processes[window_pid]}
+                push_last_process(self.last_process)
+                if monitor.debug_mode:
+                    log(f"update this process by adding {to_add_sec} seconds :")
+                    log({window_pid: self.processes[window_pid]})
+                    log(f'last process updated')
+
+                # other session reinitialization
+                self.other_session_sec = 0
+
+                # push processes
+                push_processes(self.processes, self.id)
+        # else other session add to last session
+        else :
+            if monitor.debug_mode:
+                log(f"current window is not monitored. Add it to last session")
+            self.change_last_proc_time(to_add_sec)
     
     def change_last_proc_time(self, amount):
         '''
@@ -245,11 +360,11 @@ class Monitor(object):
                 log("Not right monitor.")
                 self.other_session_sec = 0
         except:
-            log(traceback.format_exc()) 
+            log.error(traceback.format_exc()) 
             
     def saveClosedProcess(self, save=True):
         '''
-        Get all the processes in tmp file processes.json and remove them if they're closed.
+        Get all the processes in the tmp processes files and remove them if they're closed.
         Save their data before removing them if param save is True.
 
         :param save: boolean
@@ -258,8 +373,7 @@ class Monitor(object):
             # get all processes from tmp file
             all_processes = get_processes()
             all_processes_copy = all_processes.copy()
-            data = get_data(mhfx_path.user_data_json)
-            
+            records = []
 
             # For all those processes
             for pid, infos in all_processes_copy.items():
@@ -269,7 +383,7 @@ class Monitor(object):
                     if entity != None and save==True:
                         if monitor.debug_mode:
                             log(f"Write in tracker data, process {pid} infos.")
-                        data = update_data(data, entity, infos.get('time'), infos.get('first'))
+                        records.append(journal.create_record(pid, entity, infos))
 
                     if monitor.debug_mode:
                         log(f"Remove process {pid} from processes.")
@@ -280,13 +394,12 @@ class Monitor(object):
             
             # write tracker data 
             if save == True:
-                js_obj = json.dumps(data)
-                json_obj = json.dumps(data, indent=4)
-                push_data(js_obj, json_obj)
+                journal.append_records(records)
+                journal.compact()
 
         except Exception as e:
-            log(f"An exception occurred: {e}")
-            log(traceback.format_exc())
+            log.error(f"An exception occurred: {e}")
+            log.error(traceback.format_exc())
 
     def reinitialise_last_process(self):
         '''
@@ -298,19 +411,25 @@ class Monitor(object):
             if not does_process_exists(str(next(iter(last.keys())))):
                 push_last_process({})
         except Exception as e:
-            log(traceback.format_exc())
+            log.error(traceback.format_exc())
 
-    def manage_processes_data(self):
+    @metrics.timed('stage_seconds', stage='manage_processes_data')
+    def manage_processes_data(self, compact=False):
         '''
         Execute an action according to the process status.
         Active : Write process data to tracker data.
         Inactive : Manage AFK and write process data to tracker data.
         Old: Manage AFK and remove process data from processes.
+
+        Process data is appended to the journal, which is compacted in the tracker data
+        every monitor.compact_cycle seconds or if param compact is True.
+
+        :param compact: boolean
         '''
         try:
 
-            # get tracker data and processes data
-            data = get_data(mhfx_path.user_data_json)
+            # get processes data
+            records = []
             processes_copy = self.processes.copy()
             
             # actions
@@ -319,14 +438,14 @@ class Monitor(object):
                 if infos.get('status') == Status.ACTIVE.name:
                     entity = get_entity(infos.get('filename'))
                     if entity != None:
-                        data = update_data(data, entity, infos.get('time'), infos.get('first'))
+                        records.append(journal.create_record(pid, entity, infos))
                         self.processes[pid]['status'] = Status.INACTIVE.name
                 # OLD
                 elif infos.get('status') == Status.OLD.name:
                     if not does_process_exists(int(pid)):
                         entity = get_entity(infos.get('filename'))
                         if entity != None:
-                            data = update_data(data, entity, infos.get('time'), infos.get('first'))
+                            records.append(journal.create_record(pid, entity, infos))
                             self.processes.pop(pid)
                 # INACTIVE
                 else:
@@ -334,18 +453,19 @@ class Monitor(object):
                     if self.processes[pid]['afk_sec'] >= monitor.max_afk_cycle:
                         entity = get_entity(infos.get('filename'))
                         if entity != None:
-                            data = update_data(data, entity, infos.get('time'), infos.get('first'))
+                            records.append(journal.create_record(pid, entity, infos))
                             self.processes[pid]['status'] = Status.OLD.name
                 
             # write processes data
             push_processes(self.processes, self.id)
 
             # write tracker data 
-            js_obj = json.dumps(data)
-            json_obj = json.dumps(data, indent=4)
-            push_data(js_obj, json_obj)
+            journal.append_records(records)
+            self.compact_incr += monitor.total_cycle
+            if compact == True or self.compact_incr >= monitor.compact_cycle:
+                self.compact_incr = 0
+                journal.compact()
 
         except Exception as e:
-            log(f"An exception occurred: {e}")
-            log(traceback.format_exc())
-
+            log.error(f"An exception occurred: {e}")
+            log.error(traceback.format_exc())
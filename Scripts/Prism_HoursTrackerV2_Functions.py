@@ -7,7 +7,6 @@
 import os
 import shutil
 import traceback
-from datetime import datetime
 from pathlib import Path
 
 try:
@@ -22,8 +21,13 @@ from PrismUtils.Decorators import err_catcher_plugin as err_catcher
 
 from monitor_utils.config import mhfx_path, mhfx_exe, monitor
 import monitor_utils.file as file
-from Monitor import Monitor
+import monitor_utils.journal as journal
+from monitor_utils.data_management import get_week_data
+from monitor_utils.daemon import get_monitor
 from monitor_utils.mhfx_log import log
+import monitor_utils.clock as clock
+from monitor_utils.metrics import metrics
+from monitor_utils.trace import record_open
 
 class Prism_HoursTrackerV2_Functions(object):
     def __init__(self, core, plugin):
@@ -59,16 +63,17 @@ class Prism_HoursTrackerV2_Functions(object):
                 with open(mhfx_path.user_data_json, 'a') as json_file:
                     json_file.write('{}')
 
-            if not os.path.exists(mhfx_path.user_data_js):
-                open(mhfx_path.user_data_js, 'a').close()
+            if not os.path.exists(mhfx_path.user_report_dir):
+                os.makedirs(mhfx_path.user_report_dir)
             
             if not os.path.exists(mhfx_path.user_config):
                 src = f'R:/Prism/Plugins/{self.prism_version}/HoursTrackerV2/Scripts/templates/config.ini'
                 dst = mhfx_path.user_config
                 shutil.copy(src, dst)
             
-            if not os.path.exists(mhfx_path.user_data_html):
-                src = f'R:/Prism/Plugins/{self.prism_version}/HoursTrackerV2/Scripts/templates/hours.html'
+            # copied again when the plugin comes with a newer page, it must match the report files
+            src = f'R:/Prism/Plugins/{self.prism_version}/HoursTrackerV2/Scripts/templates/hours.html'
+            if not os.path.exists(mhfx_path.user_data_html) or os.path.getmtime(src) > os.path.getmtime(mhfx_path.user_data_html):
                 dst = mhfx_path.user_data_html
                 shutil.copy(src, dst)
 
@@ -77,16 +82,15 @@ class Prism_HoursTrackerV2_Functions(object):
                 dst = mhfx_path.user_data_css
                 shutil.copy(src, dst)
 
-            if not os.path.exists(mhfx_path.user_tmp_processes):
-                with open(mhfx_path.user_tmp_processes, 'a') as json_file:
-                    json_file.write('{}')
+            if not os.path.exists(mhfx_path.user_tmp_processes_dir):
+                os.makedirs(mhfx_path.user_tmp_processes_dir)
 
             if not os.path.exists(mhfx_path.user_tmp_last_proc):
                 with open(mhfx_path.user_tmp_last_proc, 'a') as json_file:
                     json_file.write('{}')
 
-            # Initialise Monitor
-            self.monitor = Monitor()
+            # Initialise Monitor, the one of the tracker daemon if enabled
+            self.monitor = get_monitor()
 
             # replace function openFile
             self.core.plugins.monkeyPatch(self.core.openFile, self.openFile, self, force=True)
@@ -96,7 +100,7 @@ class Prism_HoursTrackerV2_Functions(object):
             # callback
             self.core.callbacks.registerCallback("onFileOpen", self.onFileOpen, plugin=self)
         except Exception as e:
-            log(traceback.format_exc())
+            log.error(traceback.format_exc())
 
 
     # if returns true, the plugin will be loaded by Prism
@@ -184,7 +188,7 @@ class Prism_HoursTrackerV2_Functions(object):
                 # cancel -> do noting
 
         except Exception as e:
-            log(str(e))
+            log.error(str(e))
         
 
 
@@ -227,9 +231,10 @@ class Prism_HoursTrackerV2_Functions(object):
                     return False
             return True
         except Exception as e:
-            log(traceback.format_exc())
+            log.error(traceback.format_exc())
 
 # CALLBACK
+    @metrics.timed('onfileopen_seconds', histogram=True)
     def onFileOpen(self, *args):
         '''
         Executed when the callback "onFileOpen" is called.
@@ -245,15 +250,18 @@ class Prism_HoursTrackerV2_Functions(object):
                 log(f"Prism open file with monitor {self.monitor.id} : {filepath} ")
                 log(f"...from Prism {str(self.core.appPlugin.pluginName)}")
             try:
-                data = file.get_data(mhfx_path.user_data_json)
-                now = datetime.now()
+                # write pending session times before reading tracker data
+                journal.compact()
+                # the week information and the dates, the sessions are only read for a backup
+                data = get_week_data(sessions=False)
+                now = clock.now()
                 week = now.isocalendar()[1]
                 date = now.strftime('%d/%m/%y')
                 # Check if it's a new week, archive and reset data if it is
                 if self.is_new_week(data, week) is True:
                     if monitor.debug_mode:
                         log("New week")
-                    file.backup_data(data)
+                    file.backup_data(get_week_data())
                     file.reset_user_data()
                     self.monitor.saveClosedProcess(False)
                 # Check if it's new day, reset processes data if it's true
@@ -275,8 +283,10 @@ class Prism_HoursTrackerV2_Functions(object):
                     if monitor.debug_mode:
                         log(f"if this extension is a ddc extension, please add it in mhfx_utils.config.mhfx_exe.py")
                 else:
-                    # Add process to monitor
-                    self.monitor.add_process(filepath, exe, pid)
+                    # Add process to monitor, the trace records the pid found for a new DCC
+                    pid = self.monitor.add_process(filepath, exe, pid)
+                    if pid != None:
+                        record_open(filepath, exe, pid)
 
                 if monitor.debug_mode: 
                     log('////////////////////////////////////////////////////////////////////////////////////////')
@@ -286,7 +296,7 @@ class Prism_HoursTrackerV2_Functions(object):
                         self.monitor.start_thread()
 
             except:
-                log(traceback.format_exc())
+                log.error(traceback.format_exc())
 
     def saveForceProcess(self, *args):
         if str(self.core.appPlugin.pluginName) != "Standalone":
@@ -296,4 +306,4 @@ class Prism_HoursTrackerV2_Functions(object):
                     log(f'saveForceProcess for monitor {self.monitor.id}')
                 self.monitor.saveClosedProcess(True)
             except Exception as e:
-                log(str(e))
\ No newline at end of file
+                log.error(str(e))
\ No newline at end of file
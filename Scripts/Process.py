@@ -5,8 +5,8 @@ author: Angele Sionneau asionneau@artfx.fr
 
 from enum import Enum
 from pathlib import Path
-from datetime import datetime
 from monitor_utils.mhfx_log import log
+import monitor_utils.clock as clock
 
 class Status(Enum):
     '''
@@ -30,7 +30,7 @@ class Process(object):
         self.time = 0
         self.status = Status.ACTIVE
         self.afk_sec = 0
-        self.first = datetime.now()
+        self.first = clock.now()
         self.monitor_id = monitor_id
     
     def __str__(self):
@@ -0,0 +1,8 @@
+'''
+For Menhir FX
+
+Benchmarks of the data layer and the monitor, runnable without Windows:
+python -m benchmarks.run --out results.json
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
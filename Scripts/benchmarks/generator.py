@@ -0,0 +1,137 @@
+'''
+For Menhir FX
+
+Generator of synthetic tracker data (hours.json) and processes files.
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import random
+from datetime import datetime, timedelta
+
+DEPARTMENTS = ['model', 'rig', 'surf', 'anim', 'layout', 'fx', 'light', 'comp', 'cloth', 'hair']
+ASSET_TYPES = ['Chars', 'Props', 'Sets', 'Shots']
+EXECUTABLES = {'.ma': ['maya.exe'], '.hip': ['houdini.exe'], '.nk': ['Nuke13.2.exe'], '.spp': ['Adobe Substance 3D Painter.exe']}
+
+
+def make_entity(project_name: str, asset_type: str, asset_name: str, department: str):
+    '''
+    :return: dict, entity as returned by monitor_utils.entity.get_entity
+    '''
+    return {
+        'name': f"P:/{project_name}/03_Production/{asset_type}/{asset_name}/Scenefiles/{department}/{department}/{asset_name}.ma",
+        'department': department,
+        'asset_type': asset_type.lower(),
+        'project_name': project_name,
+        'asset_name': asset_name
+    }
+
+def make_filename(project_name: str, asset_type: str, asset_name: str, department: str, ext: str = '.ma'):
+    '''
+    :return: str, scene filename following mhfx_path.file_template_bonus
+    '''
+    return f"P:/{project_name}/03_Production/{asset_type}/{asset_name}/Scenefiles/{department}/{department}/{asset_name}{ext}"
+
+def generate_entities(projects: int = 10, assets: int = 20, departments: int = 4, seed: int = 0):
+    '''
+    :param projects: int, number of projects
+    :param assets: int, number of assets per project
+    :param departments: int, number of departments per asset, at most len(DEPARTMENTS)
+    :return: list of dict, entities
+    '''
+    rng = random.Random(seed)
+    entities = []
+    for p in range(projects):
+        project_name = f"Project{p:03d}"
+        for a in range(assets):
+            asset_type = rng.choice(ASSET_TYPES)
+            asset_name = f"Asset{a:04d}"
+            for department in rng.sample(DEPARTMENTS, min(departments, len(DEPARTMENTS))):
+                entities.append(make_entity(project_name, asset_type, asset_name, department))
+    return entities
+
+def generate_tracker_data(days: int = 5, projects: int = 10, assets: int = 20, departments: int = 4,
+                          sessions: int = 2000, user_id: str = 'bench_user', start: datetime = None, seed: int = 0):
+    '''
+    Build a hours.json dict (schema version 2) of a week of work.
+
+    :param days: int, 1 to 7
+    :param projects: int, number of projects
+    :param assets: int, number of assets per project
+    :param departments: int, number of departments per asset
+    :param sessions: int, total number of asset sessions, spread on the days
+    :param start: datetime, first day, by default the monday of the current week
+    :return: dict
+    '''
+    rng = random.Random(seed)
+    if start == None:
+        today = datetime.now()
+        start = today - timedelta(days=today.weekday())
+    entities = generate_entities(projects, assets, departments, seed)
+
+    data_days = []
+    for d in range(days):
+        day = start + timedelta(days=d)
+        projects_of_day = {}
+        for _ in range(sessions // days):
+            entity = rng.choice(entities)
+            start_sec = rng.randrange(8 * 3600, 19 * 3600)
+            total = rng.randrange(30, 3 * 3600)
+            project = projects_of_day.setdefault(entity['project_name'], {})
+            ps = project.setdefault((entity['asset_name'], entity['department']), [])
+            ps.append({
+                'start_time': seconds_as_time(start_sec),
+                'last_action_time': seconds_as_time(min(start_sec + total, 86399)),
+                'total_time': seconds_as_time(total),
+                'total_seconds': total
+            })
+
+        data_projects = []
+        for project_name, project_sessions in projects_of_day.items():
+            data_ps = []
+            for (asset_name, department), asset_sessions in project_sessions.items():
+                total = sum(s['total_seconds'] for s in asset_sessions)
+                data_ps.append({
+                    'asset_name': asset_name,
+                    'department': department,
+                    'asset_sessions': asset_sessions,
+                    'total_time': seconds_as_time(total),
+                    'total_seconds': total
+                })
+            data_projects.append({'project_name': project_name, 'project_sessions': data_ps})
+        data_days.append({'date': day.strftime('%d/%m/%y'), 'projects': data_projects})
+
+    year, week, _ = start.isocalendar()
+    return {
+        'days': data_days,
+        'user_id': user_id,
+        'year': str(year),
+        'week': str(week),
+        'week_description': f"{start.strftime('%d/%m/%y')} - {(start + timedelta(days=4)).strftime('%d/%m/%y')}",
+        'version': 2
+    }
+
+def generate_processes(count: int = 4, monitor_id: str = 'bench', first_pid: int = 1000, seed: int = 0):
+    '''
+    Build the content of a processes file.
+
+    :param count: int, number of processes
+    :return: dict pid (str) -> process infos, like Process.as_dict
+    '''
+    rng = random.Random(seed)
+    processes = {}
+    for i in range(count):
+        ext = rng.choice(list(EXECUTABLES))
+        filename = make_filename(f"Project{i % 10:03d}", rng.choice(ASSET_TYPES), f"Asset{i:04d}", rng.choice(DEPARTMENTS), ext)
+        processes[str(first_pid + i)] = {
+            'filename': filename,
+            'executable': str(EXECUTABLES[ext]),
+            'time': rng.randrange(0, 3600),
+            'status': 'ACTIVE',
+            'afk_sec': 0,
+            'first': seconds_as_time(rng.randrange(8 * 3600, 12 * 3600)),
+            'monitor_id': monitor_id
+        }
+    return processes
+
+def seconds_as_time(seconds: int):
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
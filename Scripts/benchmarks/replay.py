@@ -0,0 +1,63 @@
+'''
+For Menhir FX
+
+Replay a trace recorded with monitor_utils.trace on the monitor, with a virtual clock and the fake backend.
+Prints the cost of the replay (cpu, wall, bytes written) and the hours attributed by the monitor.
+The user data goes to a temporary folder, the U: drive is never touched.
+
+python -m benchmarks.replay trace.jsonl --out replay.json
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import os
+import json
+import shutil
+import argparse
+import tempfile
+
+# before the first import of monitor_utils: its paths and backend are chosen at import
+TEMPORARY_DATA_DIR = 'HOURSTRACKER_DATA_DIR' not in os.environ
+if TEMPORARY_DATA_DIR:
+    os.environ['HOURSTRACKER_DATA_DIR'] = tempfile.mkdtemp(prefix='hourstracker_replay_')
+os.environ.setdefault('HOURSTRACKER_BACKEND', 'fake')
+
+from monitor_utils.config import mhfx_path
+os.makedirs(mhfx_path.user_tmp_processes_dir, exist_ok=True)
+
+from monitor_utils.trace import TraceReplayer
+from monitor_utils.mhfx_log import log
+import monitor_utils.config.monitor as monitor
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay a HoursTracker trace at accelerated speed')
+    parser.add_argument('trace', help='trace file recorded with python -m monitor_utils.trace record')
+    parser.add_argument('--event-driven', choices=['on', 'off'], help='override [Monitor] event_driven')
+    parser.add_argument('--storage', choices=['json', 'sqlite', 'days'], help='override [Data] storage')
+    parser.add_argument('--out', help='json file of the report')
+    parser.add_argument('--keep', action='store_true', help='keep the temporary user data folder')
+    args = parser.parse_args(argv)
+
+    event_driven = None if args.event_driven == None else args.event_driven == 'on'
+    if args.storage != None:
+        monitor.storage = args.storage
+    try:
+        report = TraceReplayer(args.trace, event_driven).run()
+        log.flush()
+    finally:
+        if TEMPORARY_DATA_DIR and not args.keep:
+            shutil.rmtree(mhfx_path.user_data_dir, ignore_errors=True)
+
+    print(f"{report['events']} events, {report['virtual_seconds']:.0f} s replayed in {report['wall_seconds']:.2f} s "
+          f"(x{report['speed'] or 0:.0f}), cpu {report['cpu_seconds']:.2f} s, {report['written_bytes']} bytes written")
+    for day, sessions in sorted(report['hours'].items()):
+        for name, seconds in sorted(sessions.items()):
+            print(f"{day}  {name:<60} {seconds / 3600:>6.2f} h")
+    if args.out:
+        with open(args.out, 'w') as out_file:
+            json.dump(report, out_file, indent=4)
+        print(f"Report written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
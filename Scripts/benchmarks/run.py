@@ -0,0 +1,228 @@
+'''
+For Menhir FX
+
+Benchmarks of the data layer and of a monitor cycle, with the fake backend.
+The user data goes to a temporary folder, the U: drive is never touched.
+
+python -m benchmarks.run --sizes small,medium --out results.json
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import os
+import sys
+import json
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime, timedelta
+from time import perf_counter
+
+# before the first import of monitor_utils: its paths and backend are chosen at import
+TEMPORARY_DATA_DIR = 'HOURSTRACKER_DATA_DIR' not in os.environ
+if TEMPORARY_DATA_DIR:
+    os.environ['HOURSTRACKER_DATA_DIR'] = tempfile.mkdtemp(prefix='hourstracker_bench_')
+os.environ.setdefault('HOURSTRACKER_BACKEND', 'fake')
+
+from monitor_utils.config import mhfx_path
+os.makedirs(mhfx_path.user_tmp_processes_dir, exist_ok=True)
+
+from monitor_utils.backends import get_backend
+from monitor_utils.tracker_data import TrackerData
+from monitor_utils.entity import get_entity, resolve_entity
+from monitor_utils.windows import parse_executable
+import monitor_utils.data_management as dm
+from benchmarks.generator import generate_tracker_data, generate_entities, generate_processes, make_filename
+from Monitor import Monitor
+from Process import Status
+
+SIZES = {
+    'small': {'days': 1, 'projects': 5, 'assets': 10, 'departments': 2, 'sessions': 200},
+    'medium': {'days': 5, 'projects': 50, 'assets': 20, 'departments': 4, 'sessions': 2000},
+    'large': {'days': 7, 'projects': 200, 'assets': 40, 'departments': 6, 'sessions': 10000},
+}
+PROCESS_COUNTS = (4, 32)
+
+
+def bench(name: str, func, setup=None, repeat: int = 5, min_time: float = 0.05, **params):
+    '''
+    Time func, called number times per repeat. number is chosen so a repeat lasts at least min_time.
+
+    :param name: str
+    :param func: function without parameter
+    :param setup: function without parameter called before each call, not timed
+    :return: dict, seconds per call
+    '''
+    def run(number):
+        elapsed = 0.0
+        for _ in range(number):
+            if setup != None:
+                setup()
+            start = perf_counter()
+            func()
+            elapsed += perf_counter() - start
+        return elapsed
+
+    number = 1
+    while True:
+        elapsed = run(number)
+        if elapsed >= min_time or number >= 100000:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+
+    timings = [run(number) / number for _ in range(repeat)]
+    result = {
+        'name': name,
+        'params': params,
+        'number': number,
+        'repeat': repeat,
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.mean(timings),
+        'max': max(timings),
+    }
+    print(f"{name:<40} {json.dumps(params):<45} {result['median'] * 1e6:>12.1f} us")
+    return result
+
+def bench_data(size: str, repeat: int):
+    params = SIZES[size]
+    results = []
+    raw = generate_tracker_data(**params)
+    entities = generate_entities(params['projects'], params['assets'], params['departments'])
+    rng = random.Random(1)
+    monday = datetime.strptime(raw['days'][0]['date'], '%d/%m/%y')
+    dates = [monday + timedelta(days=d, hours=15) for d in range(params['days'])]
+    date_strings = [d['date'] for d in raw['days']]
+
+    results.append(bench('tracker_data_load', lambda: TrackerData(raw), repeat=repeat, size=size))
+
+    data = TrackerData(raw)
+    results.append(bench(
+        'update_data', lambda: dm.update_data(data, rng.choice(entities), rng.randrange(3600), '10:00:00', rng.choice(dates)),
+        repeat=repeat, size=size
+    ))
+    results.append(bench(
+        'update_data_dict', lambda: dm.update_data(raw, rng.choice(entities), rng.randrange(3600), '10:00:00', rng.choice(dates)),
+        repeat=repeat, size=size
+    ))
+    results.append(bench(
+        'initialise_data', lambda: dm.initialise_data(data, rng.choice(entities), rng.choice(date_strings), '11:00:00'),
+        repeat=repeat, size=size
+    ))
+    results.append(bench('does_day_exist', lambda: dm.does_day_exist(data, rng.choice(date_strings)), repeat=repeat, size=size))
+    results.append(bench('does_day_exist_dict', lambda: dm.does_day_exist(raw, rng.choice(date_strings)), repeat=repeat, size=size))
+
+    data_dict = data.as_dict()
+    results.append(bench('push_data', lambda: dm.push_data(data_dict), setup=dm.data_store.invalidate, repeat=repeat, size=size))
+    results.append(bench('push_data_unchanged', lambda: dm.push_data(data_dict), repeat=repeat, size=size))
+    return results
+
+def bench_entity(repeat: int):
+    filenames = [make_filename(e['project_name'], 'Chars', e['asset_name'], e['department']) for e in generate_entities(10, 20, 4)]
+    rng = random.Random(2)
+    return [
+        bench('get_entity', lambda: get_entity(rng.choice(filenames)), repeat=repeat),
+        bench('get_entity_uncached', lambda: get_entity(rng.choice(filenames)), setup=resolve_entity.cache_clear, repeat=repeat),
+    ]
+
+def start_fake_processes(processes: dict):
+    backend = get_backend()
+    for pid, infos in processes.items():
+        backend.start_process(int(pid), parse_executable(infos['executable'])[0], title=infos['filename'])
+
+def bench_processes(repeat: int):
+    results = []
+    for count in PROCESS_COUNTS:
+        monitor_id = f'bench_{count}'
+        processes = generate_processes(count, monitor_id, first_pid=10000 * count)
+        start_fake_processes(processes)
+        dm.push_processes(processes, monitor_id)
+        results.append(bench('get_processes', lambda: dm.get_processes(monitor_id), repeat=repeat, processes=count))
+        results.append(bench('get_processes_all', lambda: dm.get_processes(), repeat=repeat, processes=count))
+        results.append(bench('push_processes', lambda: dm.push_processes(processes, monitor_id), repeat=repeat, processes=count))
+        dm.remove_processes(processes.keys())
+    return results
+
+def bench_monitor(size: str, repeat: int):
+    '''
+    A full save cycle: processes -> journal, and the journal compacted in the tracker data.
+    '''
+    params = SIZES[size]
+    results = []
+    for count in PROCESS_COUNTS:
+        dm.push_data(generate_tracker_data(**params))
+        monitor = Monitor()
+        processes = generate_processes(count, monitor.id, first_pid=100000 + 10000 * count)
+        start_fake_processes(processes)
+        dm.push_processes(processes, monitor.id)
+
+        def setup():
+            monitor.processes = dm.get_processes(monitor.id)
+            for infos in monitor.processes.values():
+                infos['status'] = Status.ACTIVE.name
+                infos['time'] += 30
+
+        results.append(bench(
+            'manage_processes_data', monitor.manage_processes_data, setup=setup, repeat=repeat, size=size, processes=count
+        ))
+        results.append(bench(
+            'manage_processes_data_compact', lambda: monitor.manage_processes_data(compact=True), setup=setup,
+            repeat=repeat, size=size, processes=count
+        ))
+        dm.remove_processes(processes.keys())
+    return results
+
+def get_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='HoursTracker benchmarks')
+    parser.add_argument('--sizes', default='small,medium', help=f"comma separated, among {', '.join(SIZES)}")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--out', default='benchmark_results.json', help='json file of the results')
+    parser.add_argument('--keep', action='store_true', help='keep the temporary user data folder')
+    args = parser.parse_args(argv)
+
+    sizes = [s.strip() for s in args.sizes.split(',') if s.strip()]
+    for size in sizes:
+        if size not in SIZES:
+            parser.error(f"unknown size {size}")
+
+    results = []
+    try:
+        for size in sizes:
+            results += bench_data(size, args.repeat)
+        results += bench_entity(args.repeat)
+        results += bench_processes(args.repeat)
+        for size in sizes:
+            results += bench_monitor(size, args.repeat)
+    finally:
+        if TEMPORARY_DATA_DIR and not args.keep:
+            shutil.rmtree(mhfx_path.user_data_dir, ignore_errors=True)
+
+    output = {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'revision': get_revision(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'sizes': {size: SIZES[size] for size in sizes},
+            'unit': 'seconds per call',
+        },
+        'results': results,
+    }
+    with open(args.out, 'w') as out_file:
+        json.dump(output, out_file, indent=4)
+    print(f"Results written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
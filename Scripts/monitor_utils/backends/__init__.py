@@ -0,0 +1,63 @@
+'''
+For Menhir FX
+
+Selection of the platform backend used by monitor_utils.windows.
+The backend is chosen at the first use, from the environment variable HOURSTRACKER_BACKEND
+or the option backend of config.ini: auto, pywin32 or fake.
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import os
+import sys
+from threading import Lock
+
+import monitor_utils.config.monitor as monitor
+
+_backend = None
+_backend_lock = Lock()
+
+
+def get_backend_name():
+    '''
+    :return: str, name of the backend to use
+    '''
+    name = os.environ.get('HOURSTRACKER_BACKEND') or monitor.backend
+    name = name.strip().lower()
+    if name == 'auto':
+        name = 'pywin32' if sys.platform == 'win32' else 'fake'
+    return name
+
+def create_backend(name: str):
+    '''
+    :param name: str, pywin32 or fake
+    :return: Backend
+    '''
+    if name == 'pywin32':
+        # pywin32 is only imported when this backend is used
+        from monitor_utils.backends.pywin32 import Pywin32Backend
+        return Pywin32Backend()
+    if name == 'fake':
+        from monitor_utils.backends.fake import FakeBackend
+        return FakeBackend()
+    raise ValueError(f"Unknown backend {name}, use auto, pywin32 or fake.")
+
+def get_backend():
+    '''
+    :return: Backend, created at the first call
+    '''
+    global _backend
+    if _backend == None:
+        with _backend_lock:
+            if _backend == None:
+                _backend = create_backend(get_backend_name())
+    return _backend
+
+def set_backend(backend):
+    '''
+    Replace the backend, for example by a FakeBackend scripted by a benchmark.
+
+    :param backend: Backend
+    '''
+    global _backend
+    with _backend_lock:
+        _backend = backend
@@ -0,0 +1,67 @@
+'''
+For Menhir FX
+
+Interface of the platform backends: everything the monitor asks to the operating system.
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+
+
+class Backend(object):
+    '''
+    class Backend, the operating system calls used by monitor_utils.windows.
+    '''
+    name = 'base'
+
+    def get_current_window(self):
+        '''
+        :return: dict {'path':str, 'pid':int, 'title':str, 'name':str} of the foreground window
+        '''
+        raise NotImplementedError
+
+    def get_visible_pids(self):
+        '''
+        :return: set of int, pids of the processes with a visible window
+        '''
+        raise NotImplementedError
+
+    def list_processes(self):
+        '''
+        :return: dict pid (int) -> executable name (str) of all the running processes
+        '''
+        raise NotImplementedError
+
+    def get_creation_time(self, pid: int):
+        '''
+        :param pid: int
+        :return: int, creation time of the process, comparable between processes. 0 if unknown.
+        '''
+        raise NotImplementedError
+
+    def get_idle_seconds(self):
+        '''
+        :return: float, seconds since the last user input
+        '''
+        raise NotImplementedError
+
+    def watch_foreground(self, callback):
+        '''
+        Call callback(pid) each time the foreground window changes, from any thread.
+
+        :param callback: function int or None -> None
+        :return: function without parameter that stops the watch
+        '''
+        raise NotImplementedError
+
+    def get_username(self):
+        '''
+        :return: str, name of the logged-in user
+        '''
+        raise NotImplementedError
+
+    def is_network_path(self, path: str):
+        '''
+        :param path: str
+        :return: bool, True if the path is on a network share
+        '''
+        return str(path).replace('\\', '/').startswith('//')
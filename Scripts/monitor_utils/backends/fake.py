@@ -0,0 +1,133 @@
+'''
+For Menhir FX
+
+In-memory backend, scripted by the caller. Used to run and measure the monitor without Windows.
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+from threading import RLock
+
+from monitor_utils.backends.base import Backend
+import monitor_utils.clock as clock
+
+
+class FakeBackend(Backend):
+    '''
+    class FakeBackend, a scriptable operating system:
+
+    backend.start_process(1234, 'maya.exe', title='scene.ma')
+    backend.set_foreground(1234)
+    backend.set_idle(60)
+    backend.set_last_input(clock.monotonic())
+    backend.close_process(1234)
+    '''
+    name = 'fake'
+
+    def __init__(self, username: str = 'fake_user'):
+        self.username = username
+        self.processes = {}
+        self.foreground = None
+        self.idle_seconds = 0.0
+        self.last_input = None
+        self.creation_counter = 0
+        self.foreground_callbacks = []
+        self.lock = RLock()
+
+    # scripting
+    def start_process(self, pid: int, exe: str, title: str = '', visible: bool = True):
+        '''
+        Start a fake process.
+
+        :param pid: int
+        :param exe: str, executable name like maya.exe
+        :param title: str, title of its window
+        :param visible: bool, False for a process without visible window
+        '''
+        with self.lock:
+            self.creation_counter += 1
+            self.processes[int(pid)] = {
+                'exe': exe,
+                'title': title,
+                'visible': visible,
+                'created': self.creation_counter
+            }
+
+    def close_process(self, pid: int):
+        if self.foreground == int(pid):
+            self.set_foreground(None)
+        with self.lock:
+            self.processes.pop(int(pid), None)
+
+    def set_foreground(self, pid):
+        '''
+        Bring a process to the foreground, the watchers are notified like by the Windows event hook.
+
+        :param pid: int or None for a window of no process (desktop)
+        '''
+        with self.lock:
+            pid = int(pid) if pid != None else None
+            changed = pid != self.foreground
+            self.foreground = pid
+            callbacks = list(self.foreground_callbacks)
+        if changed:
+            for callback in callbacks:
+                callback(pid)
+
+    def set_idle(self, seconds: float):
+        '''
+        :param seconds: float, seconds since the last user input
+        '''
+        self.idle_seconds = seconds
+        self.last_input = None
+
+    def set_last_input(self, monotonic_time: float):
+        '''
+        From now on, the idle time follows the clock of the tracker.
+
+        :param monotonic_time: float, clock.monotonic() of the last user input
+        '''
+        self.last_input = monotonic_time
+
+    # backend
+    def get_current_window(self):
+        with self.lock:
+            process = self.processes.get(self.foreground)
+            if process == None:
+                return {'path': None, 'pid': None, 'title': None, 'name': None}
+            return {
+                'path': 'C:\\Program Files\\' + process['exe'],
+                'pid': self.foreground,
+                'title': process['title'],
+                'name': process['exe']
+            }
+
+    def get_visible_pids(self):
+        with self.lock:
+            return set(pid for pid, process in self.processes.items() if process['visible'])
+
+    def list_processes(self):
+        with self.lock:
+            return {pid: process['exe'] for pid, process in self.processes.items()}
+
+    def get_creation_time(self, pid: int):
+        with self.lock:
+            process = self.processes.get(int(pid))
+            return process['created'] if process != None else 0
+
+    def get_idle_seconds(self):
+        if self.last_input != None:
+            return max(clock.monotonic() - self.last_input, 0.0)
+        return self.idle_seconds
+
+    def watch_foreground(self, callback):
+        with self.lock:
+            self.foreground_callbacks.append(callback)
+
+        def stop():
+            with self.lock:
+                if callback in self.foreground_callbacks:
+                    self.foreground_callbacks.remove(callback)
+        return stop
+
+    def get_username(self):
+        return self.username
@@ -0,0 +1,239 @@
+'''
+For Menhir FX
+
+Backend of a Windows workstation, with pywin32 and ctypes.
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import os
+import ctypes
+from ctypes import wintypes
+from functools import lru_cache
+from threading import Event, Thread
+
+import win32gui
+import win32process
+import win32api
+
+from monitor_utils.backends.base import Backend
+
+
+class PROCESSENTRY32W(ctypes.Structure):
+    _fields_ = [
+        ('dwSize', wintypes.DWORD),
+        ('cntUsage', wintypes.DWORD),
+        ('th32ProcessID', wintypes.DWORD),
+        ('th32DefaultHeapID', ctypes.c_void_p),
+        ('th32ModuleID', wintypes.DWORD),
+        ('cntThreads', wintypes.DWORD),
+        ('th32ParentProcessID', wintypes.DWORD),
+        ('pcPriClassBase', ctypes.c_long),
+        ('dwFlags', wintypes.DWORD),
+        ('szExeFile', ctypes.c_wchar * 260),
+    ]
+
+TH32CS_SNAPPROCESS = 0x00000002
+PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+INVALID_HANDLE_VALUE = ctypes.c_void_p(-1).value
+EVENT_SYSTEM_FOREGROUND = 0x0003
+WINEVENT_OUTOFCONTEXT = 0x0000
+WM_QUIT = 0x0012
+DRIVE_REMOTE = 4
+
+WINEVENTPROC = ctypes.WINFUNCTYPE(
+    None, wintypes.HANDLE, wintypes.DWORD, wintypes.HWND, wintypes.LONG, wintypes.LONG, wintypes.DWORD, wintypes.DWORD
+)
+
+@lru_cache(maxsize=1)
+def get_kernel32():
+    '''
+    Own instance of kernel32 with the signatures of the functions used by the backend,
+    so handles aren't truncated on 64 bits.
+    '''
+    kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+    kernel32.CreateToolhelp32Snapshot.argtypes = [wintypes.DWORD, wintypes.DWORD]
+    kernel32.CreateToolhelp32Snapshot.restype = wintypes.HANDLE
+    kernel32.Process32FirstW.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESSENTRY32W)]
+    kernel32.Process32FirstW.restype = wintypes.BOOL
+    kernel32.Process32NextW.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESSENTRY32W)]
+    kernel32.Process32NextW.restype = wintypes.BOOL
+    kernel32.OpenProcess.argtypes = [wintypes.DWORD, wintypes.BOOL, wintypes.DWORD]
+    kernel32.OpenProcess.restype = wintypes.HANDLE
+    kernel32.GetProcessTimes.argtypes = [wintypes.HANDLE] + [ctypes.POINTER(wintypes.FILETIME)] * 4
+    kernel32.GetProcessTimes.restype = wintypes.BOOL
+    kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+    kernel32.CloseHandle.restype = wintypes.BOOL
+    kernel32.GetCurrentThreadId.argtypes = []
+    kernel32.GetCurrentThreadId.restype = wintypes.DWORD
+    kernel32.GetDriveTypeW.argtypes = [wintypes.LPCWSTR]
+    kernel32.GetDriveTypeW.restype = wintypes.UINT
+    return kernel32
+
+@lru_cache(maxsize=1)
+def get_user32():
+    '''
+    Own instance of user32 with the signatures of the event hook functions.
+    '''
+    user32 = ctypes.WinDLL('user32', use_last_error=True)
+    user32.SetWinEventHook.argtypes = [
+        wintypes.DWORD, wintypes.DWORD, wintypes.HMODULE, WINEVENTPROC, wintypes.DWORD, wintypes.DWORD, wintypes.DWORD
+    ]
+    user32.SetWinEventHook.restype = wintypes.HANDLE
+    user32.UnhookWinEvent.argtypes = [wintypes.HANDLE]
+    user32.UnhookWinEvent.restype = wintypes.BOOL
+    user32.GetMessageW.argtypes = [ctypes.POINTER(wintypes.MSG), wintypes.HWND, wintypes.UINT, wintypes.UINT]
+    user32.GetMessageW.restype = wintypes.BOOL
+    user32.TranslateMessage.argtypes = [ctypes.POINTER(wintypes.MSG)]
+    user32.TranslateMessage.restype = wintypes.BOOL
+    user32.DispatchMessageW.argtypes = [ctypes.POINTER(wintypes.MSG)]
+    user32.DispatchMessageW.restype = ctypes.c_ssize_t
+    user32.PostThreadMessageW.argtypes = [wintypes.DWORD, wintypes.UINT, wintypes.WPARAM, wintypes.LPARAM]
+    user32.PostThreadMessageW.restype = wintypes.BOOL
+    return user32
+
+
+class Pywin32Backend(Backend):
+    '''
+    class Pywin32Backend, the backend used on the artists' workstations.
+    '''
+    name = 'pywin32'
+
+    def get_current_window(self):
+        active_window = win32gui.GetForegroundWindow()
+        _, pid = win32process.GetWindowThreadProcessId(active_window)
+
+        MAX_PATH = 260
+        path_buffer = ctypes.create_unicode_buffer(MAX_PATH)
+        h_process = ctypes.windll.kernel32.OpenProcess(1040, False, pid)
+
+        if h_process:
+            ctypes.windll.psapi.GetModuleFileNameExW(h_process, None, path_buffer, MAX_PATH)
+            ctypes.windll.kernel32.CloseHandle(h_process)
+            file_path = path_buffer.value
+        else:
+            return {'path': None, 'pid': None, 'title': None, 'name': None}
+
+        title = win32gui.GetWindowText(active_window)
+        name = file_path.split('\\')[-1]
+
+        return {'path': file_path, 'pid': pid, 'title': title, 'name': name}
+
+    def get_visible_pids(self):
+        def callback(hwnd, pids):
+            '''
+            Callback function for win32gui.EnumWindows. It's called for each window handle and
+            adds the pid of the window to the set if the window is visible.
+            '''
+            if win32gui.IsWindowVisible(hwnd):
+                _, process_id = win32process.GetWindowThreadProcessId(hwnd)
+                pids.add(process_id)
+            return True
+
+        pids = set()
+        win32gui.EnumWindows(callback, pids)
+        return pids
+
+    def list_processes(self):
+        '''
+        Processes are listed with CreateToolhelp32Snapshot, in a few milliseconds.
+        '''
+        kernel32 = get_kernel32()
+        snapshot = kernel32.CreateToolhelp32Snapshot(TH32CS_SNAPPROCESS, 0)
+        if snapshot == INVALID_HANDLE_VALUE:
+            raise ctypes.WinError(ctypes.get_last_error())
+
+        processes = {}
+        try:
+            entry = PROCESSENTRY32W()
+            entry.dwSize = ctypes.sizeof(PROCESSENTRY32W)
+            has_entry = kernel32.Process32FirstW(snapshot, ctypes.byref(entry))
+            while has_entry:
+                processes[entry.th32ProcessID] = entry.szExeFile
+                has_entry = kernel32.Process32NextW(snapshot, ctypes.byref(entry))
+        finally:
+            kernel32.CloseHandle(snapshot)
+        return processes
+
+    def get_creation_time(self, pid: int):
+        '''
+        Creation time as a FILETIME integer.
+        '''
+        creation_time = 0
+        kernel32 = get_kernel32()
+        h_process = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if h_process:
+            creation, exit, kernel, user = wintypes.FILETIME(), wintypes.FILETIME(), wintypes.FILETIME(), wintypes.FILETIME()
+            if kernel32.GetProcessTimes(h_process, ctypes.byref(creation), ctypes.byref(exit), ctypes.byref(kernel), ctypes.byref(user)):
+                creation_time = (creation.dwHighDateTime << 32) | creation.dwLowDateTime
+            kernel32.CloseHandle(h_process)
+        return creation_time
+
+    def get_idle_seconds(self):
+        # Get when the last input event happened
+        last_input_time = win32api.GetLastInputInfo()
+
+        # Get the current time
+        current_time = win32api.GetTickCount()
+
+        return (current_time - last_input_time) / 1000
+
+    def watch_foreground(self, callback):
+        '''
+        The foreground changes come from a SetWinEventHook(EVENT_SYSTEM_FOREGROUND) hook.
+        Out of context hooks are called by the message loop of the thread that set them,
+        so the hook lives in its own thread, blocked in GetMessageW between two events.
+        '''
+        user32 = get_user32()
+        kernel32 = get_kernel32()
+        ready = Event()
+        state = {'thread_id': None, 'error': None}
+
+        def on_event(hook, event, hwnd, id_object, id_child, event_thread, event_time):
+            pid = None
+            if hwnd:
+                _, pid = win32process.GetWindowThreadProcessId(hwnd)
+            callback(pid or None)
+
+        # keep a reference on the ctypes callback as long as the hook exists
+        proc = WINEVENTPROC(on_event)
+
+        def loop():
+            state['thread_id'] = kernel32.GetCurrentThreadId()
+            hook = user32.SetWinEventHook(
+                EVENT_SYSTEM_FOREGROUND, EVENT_SYSTEM_FOREGROUND, None, proc, 0, 0,
+                # the monitor runs in the DCC: the events of its own windows are the ones to track
+                WINEVENT_OUTOFCONTEXT
+            )
+            if not hook:
+                state['error'] = ctypes.WinError(ctypes.get_last_error())
+                ready.set()
+                return
+            ready.set()
+            try:
+                msg = wintypes.MSG()
+                while user32.GetMessageW(ctypes.byref(msg), None, 0, 0) > 0:
+                    user32.TranslateMessage(ctypes.byref(msg))
+                    user32.DispatchMessageW(ctypes.byref(msg))
+            finally:
+                user32.UnhookWinEvent(hook)
+
+        thread = Thread(target=loop, name='HoursTrackerForegroundHook', daemon=True)
+        thread.start()
+        ready.wait()
+        if state['error'] != None:
+            raise state['error']
+
+        def stop():
+            user32.PostThreadMessageW(state['thread_id'], WM_QUIT, 0, 0)
+            thread.join()
+        return stop
+
+    def get_username(self):
+        return win32api.GetUserName()
+
+    def is_network_path(self, path: str):
+        if super().is_network_path(path):
+            return True
+        # a drive letter mapped to a share, like U:
+        drive = os.path.splitdrive(os.path.abspath(path))[0]
+        return drive != '' and get_kernel32().GetDriveTypeW(drive + '\\') == DRIVE_REMOTE
@@ -0,0 +1,365 @@
+'''
+For Menhir FX
+
+Archive of the past weeks, in the backup folder of the user.
+
+hours_archive.gz    one gzip member per week, appended at the week rollover.
+                    A member holds the tracker data and the log of the week: {"hours": {...}, "log": "..."}
+index.json          for each week: offset and size of its member in the archive, digest of the content
+                    and the totals of the week (total_seconds, project_totals, department_totals).
+
+The list of the backups and the totals of old weeks are read from the index only,
+a week is decompressed alone by seeking to its member.
+Each archived week has a js view read by hours.html ({week}_{year}_hours.js).
+A missing view is written again at the next rollover, or on demand:
+
+python -m monitor_utils.backup list
+python -m monitor_utils.backup view <week> <year>
+python -m monitor_utils.backup migrate
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import os
+import re
+import gzip
+import json
+import glob
+import hashlib
+import zlib
+import argparse
+import traceback
+
+from monitor_utils.config import mhfx_path
+from monitor_utils.file import FileLock, get_data, write_to_file
+from monitor_utils.mhfx_log import log
+from monitor_utils.metrics import metrics
+from monitor_utils.tracker_data import TrackerData
+import monitor_utils.clock as clock
+
+INDEX_VERSION = 1
+LEGACY_JSON = re.compile(r'^(\d+)_(\d+)_hours\.json$')
+# views written before the archive hold the json in a string
+LEGACY_VIEW_PREFIX = "var data = '"
+
+
+def get_view_path(week, year):
+    '''
+    :return: str, path of the js view of a week read by hours.html
+    '''
+    return f"{mhfx_path.user_data_backup}{week}_{year}_hours.js"
+
+def week_key(week, year):
+    '''
+    :return: tuple (int year, int week), the order of the weeks
+    '''
+    return (int(year), int(week))
+
+
+class BackupArchive(object):
+    '''
+    class BackupArchive, the weeks appended to one compressed archive file and their index.
+    Writes are done under a FileLock, the index is replaced atomically after the member is written:
+    a crash between both leaves an unused member at the end of the archive, never a wrong index.
+    '''
+    def __init__(self, archive_path: str, index_path: str):
+        self.archive_path = archive_path
+        self.index_path = index_path
+        self.lock_path = archive_path + '.lock'
+
+    def load_index(self):
+        '''
+        Read the index. If it is lost or corrupted, a half-synced file on the network share,
+        it is rebuilt from the members of the archive: {"rebuilt": True} tells add_week to keep the corrupted file.
+        An index that can't be read raises OSError.
+
+        :return: dict, {"version": int, "weeks": [entry]}, newest week first
+        '''
+        if not os.path.exists(self.index_path):
+            if os.path.exists(self.archive_path) and os.path.getsize(self.archive_path) > 0:
+                log.error(f"Backup index {self.index_path} is missing, rebuilt from the archive.")
+                return self.rebuild_index()
+            return {'version': INDEX_VERSION, 'weeks': []}
+        with open(self.index_path, 'r', encoding='utf-8') as index_file:
+            content = index_file.read()
+        try:
+            index = json.loads(content)
+            if not isinstance(index, dict) or not isinstance(index.setdefault('weeks', []), list):
+                raise ValueError('no list of weeks')
+        except ValueError:
+            log.error(f"Backup index {self.index_path} is corrupted, rebuilt from the archive:\n{traceback.format_exc()}")
+            return self.rebuild_index()
+        index.setdefault('version', INDEX_VERSION)
+        return index
+
+    def rebuild_index(self):
+        '''
+        The index read from the members of the archive. A week archived several times is taken from its last member,
+        a member cut by a crash at the end of the archive is ignored.
+
+        :return: dict, {"version": int, "weeks": [entry], "rebuilt": True}
+        '''
+        weeks = {}
+        with open(self.archive_path, 'rb') as archive_file:
+            content = memoryview(archive_file.read())
+        offset = 0
+        while offset < len(content):
+            decompressor = zlib.decompressobj(wbits=31)
+            try:
+                payload = decompressor.decompress(content[offset:])
+            except zlib.error:
+                break
+            if not decompressor.eof:
+                break
+            size = len(content) - offset - len(decompressor.unused_data)
+            try:
+                data = json.loads(payload).get('hours')
+            except (ValueError, AttributeError):
+                data = None
+            if data and data.get('week') and data.get('year'):
+                weeks[week_key(data.get('week'), data.get('year'))] = self.create_entry(data, payload, offset, size)
+            offset += size
+        return {
+            'version': INDEX_VERSION,
+            'weeks': [weeks[key] for key in sorted(weeks, reverse=True)],
+            'rebuilt': True,
+        }
+
+    def entries(self):
+        '''
+        :return: list of dict, index entries, newest week first
+        '''
+        return self.load_index().get('weeks')
+
+    def get_entry(self, week, year, index: dict = None):
+        '''
+        :return: dict, index entry of the week, None if it isn't archived
+        '''
+        index = self.load_index() if index == None else index
+        for entry in index.get('weeks'):
+            if week_key(entry.get('week'), entry.get('year')) == week_key(week, year):
+                return entry
+        return None
+
+    @staticmethod
+    def summarize(data: dict):
+        '''
+        :param data: dict, tracker data of a week
+        :return: dict, totals of the week for the index
+        '''
+        tracker = TrackerData(data)
+        return {
+            'total_seconds': tracker.get_week_total(),
+            'project_totals': dict(tracker.project_totals),
+            'department_totals': dict(tracker.department_totals),
+        }
+
+    def create_entry(self, data: dict, payload: bytes, offset: int, size: int):
+        '''
+        :param data: dict, tracker data of the week
+        :param payload: bytes, content of the member
+        :param offset: int, position of the member in the archive
+        :param size: int, size of the member
+        :return: dict, index entry of the week
+        '''
+        hours = json.dumps(data, separators=(',', ':'))
+        entry = {
+            'week': str(data.get('week')),
+            'year': str(data.get('year')),
+            'week_description': str(data.get('week_description')),
+            'offset': offset,
+            'size': size,
+            'digest': hashlib.blake2b(payload, digest_size=16).hexdigest(),
+            'hours_digest': hashlib.blake2b(hours.encode('utf-8'), digest_size=16).hexdigest(),
+            'archived': round(clock.time()),
+        }
+        entry.update(self.summarize(data))
+        return entry
+
+    def add_week(self, data: dict, log_content: str = ''):
+        '''
+        Archive a week. A week already archived with the same tracker data is not written again,
+        its archived log is kept.
+
+        :param data: dict, tracker data of the week
+        :param log_content: str, log of the week
+        :return: dict, index entry of the week
+        '''
+        week = data.get('week')
+        year = data.get('year')
+        hours = json.dumps(data, separators=(',', ':'))
+        hours_digest = hashlib.blake2b(hours.encode('utf-8'), digest_size=16).hexdigest()
+        payload = json.dumps({'hours': data, 'log': log_content}, separators=(',', ':')).encode('utf-8')
+
+        with FileLock(self.lock_path):
+            index = self.load_index()
+            entry = self.get_entry(week, year, index)
+            if entry != None and entry.get('hours_digest') == hours_digest:
+                log.debug(f"Week {week}_{year} already archived.")
+                return entry
+
+            # mtime 0: the same week always gives the same bytes
+            member = gzip.compress(payload, compresslevel=9, mtime=0)
+            with open(self.archive_path, 'ab') as archive_file:
+                archive_file.seek(0, os.SEEK_END)
+                offset = archive_file.tell()
+                archive_file.write(member)
+                archive_file.flush()
+                os.fsync(archive_file.fileno())
+            if metrics.enabled:
+                metrics.inc('written_bytes_total', len(member), file=os.path.basename(self.archive_path))
+                metrics.inc('writes_total', file=os.path.basename(self.archive_path))
+
+            new_entry = self.create_entry(data, payload, offset, len(member))
+            # a week archived again replaces its entry, its old member is no longer read
+            weeks = [e for e in index.get('weeks') if e is not entry] + [new_entry]
+            weeks.sort(key=lambda e: week_key(e.get('week'), e.get('year')), reverse=True)
+            index['weeks'] = weeks
+            index['version'] = INDEX_VERSION
+            if index.pop('rebuilt', False) and os.path.exists(self.index_path):
+                # the corrupted index is kept for a look, it isn't written over
+                os.replace(self.index_path, f"{self.index_path}.{round(clock.time())}.corrupted")
+            if not write_to_file(json.dumps(index, indent=4), self.index_path):
+                raise OSError(f"Can't write backup index {self.index_path}")
+        log(f"Week {week}_{year} archived: {len(payload)} bytes in {len(member)}.")
+        return new_entry
+
+    def read_week(self, week, year):
+        '''
+        Decompress the member of a week.
+
+        :return: dict, {"hours": dict, "log": str}, None if the week isn't archived
+        '''
+        entry = self.get_entry(week, year)
+        if entry == None:
+            return None
+        with open(self.archive_path, 'rb') as archive_file:
+            archive_file.seek(entry.get('offset'))
+            member = archive_file.read(entry.get('size'))
+        payload = gzip.decompress(member)
+        if hashlib.blake2b(payload, digest_size=16).hexdigest() != entry.get('digest'):
+            raise ValueError(f"Archive of week {week}_{year} is corrupted")
+        return json.loads(payload)
+
+    def get_hours(self, week, year):
+        '''
+        :return: dict, tracker data of an archived week, None if it isn't archived
+        '''
+        content = self.read_week(week, year)
+        return content.get('hours') if content != None else None
+
+    def materialize(self, week, year):
+        '''
+        Write the js view of an archived week, read by hours.html.
+
+        :return: str, path of the view, None if the week isn't archived
+        '''
+        data = self.get_hours(week, year)
+        if data == None:
+            return None
+        path = get_view_path(week, year)
+        write_to_file(f"var data = {json.dumps(data)};\n", path)
+        return path
+
+    def materialize_missing(self):
+        '''
+        Write the js views of the archived weeks that have none, hours.html can open every week of the list.
+
+        :return: int, number of views written
+        '''
+        written = 0
+        for entry in self.entries():
+            if not os.path.exists(get_view_path(entry.get('week'), entry.get('year'))):
+                try:
+                    if self.materialize(entry.get('week'), entry.get('year')) != None:
+                        written += 1
+                except:
+                    log.error(traceback.format_exc())
+        return written
+
+    def migrate_legacy(self):
+        '''
+        Archive the weeks backed up before the archive ({week}_{year}_hours.json and _log.txt copies).
+        The copies are removed once the archived week reads back identical.
+
+        :return: int, number of weeks migrated
+        '''
+        migrated = 0
+        for json_path in sorted(glob.glob(os.path.join(glob.escape(mhfx_path.user_data_backup), '*_hours.json'))):
+            match = LEGACY_JSON.match(os.path.basename(json_path))
+            if match == None:
+                continue
+            week, year = match.groups()
+            try:
+                data = get_data(json_path)
+                if not data:
+                    continue
+                # the week and year of the file name, older files may miss them
+                data.setdefault('week', week)
+                data.setdefault('year', year)
+                log_path = f"{mhfx_path.user_data_backup}{week}_{year}_log.txt"
+                log_content = ''
+                if os.path.exists(log_path):
+                    with open(log_path, 'r', encoding='utf-8', errors='replace') as log_file:
+                        log_content = log_file.read()
+
+                self.add_week(data, log_content)
+                if self.read_week(data.get('week'), data.get('year')) != {'hours': data, 'log': log_content}:
+                    log.error(f"Archive of {json_path} differs, the copy is kept.")
+                    continue
+                os.remove(json_path)
+                if os.path.exists(log_path):
+                    os.remove(log_path)
+                migrated += 1
+            except:
+                log.error(traceback.format_exc())
+        return migrated
+
+    def convert_legacy_views(self):
+        '''
+        Write again the js views that hold the json in a string, as an object literal like materialize:
+        hours.html reads an object, and an apostrophe in the data broke the string.
+
+        :return: int, number of views converted
+        '''
+        converted = 0
+        for path in glob.glob(os.path.join(glob.escape(mhfx_path.user_data_backup), '*_hours.js')):
+            try:
+                with open(path, 'r', encoding='utf-8', errors='replace') as view_file:
+                    if view_file.read(len(LEGACY_VIEW_PREFIX)) != LEGACY_VIEW_PREFIX:
+                        continue
+                    content = view_file.read()
+                data = json.loads(content[:content.rindex("'")])
+                if write_to_file(f"var data = {json.dumps(data)};\n", path):
+                    converted += 1
+            except:
+                log.error(traceback.format_exc())
+        return converted
+
+
+archive = BackupArchive(mhfx_path.user_backup_archive, mhfx_path.user_backup_index)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Archive of the past weeks of HoursTracker')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('list', help='archived weeks and their totals, read from the index')
+    view = sub.add_parser('view', help='write the js view of a week for hours.html')
+    view.add_argument('week')
+    view.add_argument('year')
+    sub.add_parser('migrate', help='archive the backups made before the archive, convert their js views')
+    args = parser.parse_args(argv)
+
+    if args.command == 'list':
+        for entry in archive.entries():
+            hours = entry.get('total_seconds', 0) / 3600
+            print(f"{entry.get('week'):>2}_{entry.get('year')}  {entry.get('week_description'):<25} {hours:>7.2f} h")
+    elif args.command == 'view':
+        path = archive.materialize(args.week, args.year)
+        print(path if path != None else f"Week {args.week}_{args.year} is not archived.")
+    elif args.command == 'migrate':
+        print(f"{archive.migrate_legacy()} weeks migrated, {archive.convert_legacy_views()} views converted.")
+    log.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+'''
+For Menhir FX
+
+The clock of the tracker. Every time read and every sleep of the monitor goes through the current clock,
+so a VirtualClock can run the monitor faster than real time (see monitor_utils.trace).
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import heapq
+import time as system_time
+from datetime import datetime
+from itertools import count
+from threading import RLock
+
+
+class SystemClock(object):
+    '''
+    class SystemClock, the real time.
+    '''
+    def time(self):
+        return system_time.time()
+
+    def monotonic(self):
+        return system_time.monotonic()
+
+    def now(self):
+        return datetime.now()
+
+    def sleep(self, seconds: float):
+        system_time.sleep(seconds)
+
+    def wait(self, event, timeout: float):
+        return event.wait(timeout)
+
+
+class VirtualClock(object):
+    '''
+    class VirtualClock, a clock that only moves when someone sleeps or waits on it.
+
+    Callbacks are scheduled on the virtual time with call_at. A sleep jumps from callback to callback
+    and runs them in the sleeping thread, so a trace of a day replays in a few seconds.
+    A wait on an event stops at the first callback that sets the event.
+    '''
+    def __init__(self, start: float = None):
+        '''
+        :param start: float, epoch of the virtual time 0, by default now
+        '''
+        self.epoch = system_time.time() if start == None else start
+        self.elapsed = 0.0
+        self.timeline = []
+        self.counter = count()
+        self.lock = RLock()
+        self.in_callback = False
+
+    def time(self):
+        return self.epoch + self.elapsed
+
+    def monotonic(self):
+        return self.elapsed
+
+    def now(self):
+        return datetime.fromtimestamp(self.time())
+
+    def call_at(self, elapsed: float, callback):
+        '''
+        Run callback when the virtual time reaches elapsed.
+
+        :param elapsed: float, seconds since the virtual time 0
+        :param callback: function without parameter
+        '''
+        with self.lock:
+            heapq.heappush(self.timeline, (elapsed, next(self.counter), callback))
+
+    def next_call(self):
+        '''
+        :return: float, time of the next callback, None if there is none
+        '''
+        with self.lock:
+            return self.timeline[0][0] if self.timeline else None
+
+    def run_next(self):
+        '''
+        Jump to the next callback and run it.
+
+        :return: bool, False if there is no callback left
+        '''
+        with self.lock:
+            if not self.timeline:
+                return False
+            elapsed, _, callback = heapq.heappop(self.timeline)
+            self.elapsed = max(self.elapsed, elapsed)
+            self._run(callback)
+            return True
+
+    def _run(self, callback):
+        self.in_callback = True
+        try:
+            callback()
+        finally:
+            self.in_callback = False
+
+    def wait(self, event, timeout: float):
+        '''
+        Move the time by timeout seconds, or until a callback sets the event.
+
+        :param event: threading.Event or None
+        :param timeout: float
+        :return: bool, True if the event is set
+        '''
+        with self.lock:
+            target = self.elapsed + max(timeout or 0, 0)
+            # a callback that sleeps only moves the time, the loop below runs the callbacks
+            while not self.in_callback:
+                if event != None and event.is_set():
+                    break
+                if not self.timeline or self.timeline[0][0] > target:
+                    break
+                elapsed, _, callback = heapq.heappop(self.timeline)
+                self.elapsed = max(self.elapsed, elapsed)
+                self._run(callback)
+            if event != None and event.is_set():
+                return True
+            self.elapsed = max(self.elapsed, target)
+            return False
+
+    def sleep(self, seconds: float):
+        self.wait(None, seconds)
+
+
+_clock = SystemClock()
+
+def get_clock():
+    return _clock
+
+def set_clock(clock):
+    '''
+    Replace the clock of the tracker, for example by a VirtualClock.
+
+    :param clock: SystemClock or VirtualClock
+    '''
+    global _clock
+    _clock = clock
+
+# shortcuts on the current clock, safe to import by name
+
+def time():
+    return _clock.time()
+
+def monotonic():
+    return _clock.monotonic()
+
+def now():
+    return _clock.now()
+
+def sleep(seconds: float):
+    _clock.sleep(seconds)
+
+def wait_event(event, timeout: float):
+    return _clock.wait(event, timeout)
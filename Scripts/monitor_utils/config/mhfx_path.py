@@ -3,23 +3,36 @@ For Menhir FX
 author:
 Angele Sionneau - asionneau@artfx.fr
 '''
+import os
 
-user_data_dir = 'U:/mesDocuments/HoursTrackerV2/' # where all the user data will be store. By default U:/mesDocuments
+user_data_dir = os.path.join(os.environ.get('HOURSTRACKER_DATA_DIR', 'U:/mesDocuments/HoursTrackerV2/'), '') # where all the user data will be store. By default U:/mesDocuments, HOURSTRACKER_DATA_DIR to store it elsewhere (build machines)
 user_tmp_dir = user_data_dir + '/tmp' # where the temporary files will be store. 
 
 # all data file path
 user_data_json = user_data_dir + 'hours.json'
-user_data_js = user_data_dir + 'hours.js'
+user_data_db = user_data_dir + 'hours.db' # tracker data of the sqlite storage, hours.json is exported from it
+user_report_dir = user_data_dir + 'report/' # report read by hours.html, a manifest and one file per day
+user_week_dir = user_data_dir + 'week/' # tracker data of the days storage, a header and one file per day
 user_data_html = user_data_dir + 'hours.html'
 user_data_css = user_data_dir + 'style.css'
 user_data_backup = user_data_dir + 'backup/'
+user_backup_archive = user_data_backup + 'hours_archive.gz' # one gzip member per archived week
+user_backup_index = user_data_backup + 'index.json' # offset, size and totals of each archived week
+user_backup_summary = user_data_backup + 'summary.json' # rows of each archived week for the history queries
 user_list_backup_json = user_data_dir + 'backups.json'
 user_list_backup_js = user_data_dir + 'backups.js'
 user_log = user_data_dir + 'log_hourstracker.txt'
 user_config = user_data_dir + 'config.ini'
-user_tmp_processes = user_tmp_dir + '/processes.json'
+user_metrics_dir = user_data_dir + 'metrics/' # one metrics file per process
+user_tmp_processes_dir = user_tmp_dir + '/processes' # one processes file per monitor
 user_tmp_last_proc = user_tmp_dir + '/last_process.json'
+user_tmp_journal = user_tmp_dir + '/journal.jsonl'
+user_tmp_daemon = user_tmp_dir + '/daemon.json' # address of the tracker daemon
+user_tmp_trace = user_tmp_dir + '/trace_recording.json' # trace being recorded, see monitor_utils.trace
 
 # template to get file properties according to the pipe
 file_template = "{letter}/{project_name}/03_Production/{asset_type}/{asset_subtype}/{asset_name}/Scenefiles/{department}/{task}/{file}.{ext}"
 file_template_bonus = "{letter}/{project_name}/03_Production/{asset_type}/{asset_name}/Scenefiles/{department}/{task}/{file}.{ext}"
+
+# templates tried in this order. Add the studio templates here.
+file_templates = [file_template, file_template_bonus]
@@ -33,4 +33,37 @@ except:
     user_afk_sec = 60 * 45 # How many seconds before we consider the user is afk
     wait_sec_afk = 60 * 5 # how many second between 2 check the window in foreground when user is afk
 
-    debug_mode = False
\ No newline at end of file
+    debug_mode = False
+
+def get_setting(getter, section, option, default):
+    '''
+    Read an option added after the first release.
+    A missing or invalid option falls back to its default without resetting the other options.
+
+    :param getter: config.get, config.getint, config.getfloat or config.getboolean
+    :return: the option value
+    '''
+    try:
+        return getter(section, option, fallback=default)
+    except ValueError:
+        return default
+
+compact_cycle = get_setting(config.getint, 'Monitor', 'data_compact_interval_seconds', 60 * 30) # how many second before the journal is written in tracker data
+pretty_json = get_setting(config.getboolean, 'Data', 'pretty_json', False) # write hours.json indented, costs a second serialization
+liveness_cache_sec = get_setting(config.getfloat, 'Monitor', 'liveness_cache_seconds', 2.0) # how many second a snapshot of the visible windows is used to check if processes exist
+process_poll_sec = get_setting(config.getfloat, 'Monitor', 'process_poll_seconds', 0.1) # how many second between 2 snapshots of the processes when looking for a new DCC pid
+entity_cache_size = get_setting(config.getint, 'Monitor', 'entity_cache_size', 256) # how many filenames keep their entity in memory
+backend = get_setting(config.get, 'Monitor', 'backend', 'auto') # operating system backend: auto, pywin32 or fake. Overridden by the HOURSTRACKER_BACKEND environment variable
+event_driven = get_setting(config.getboolean, 'Monitor', 'event_driven', False) # wake on the foreground changes of the operating system instead of every monitor_interval_seconds
+liveness_interval_sec = get_setting(config.getfloat, 'Monitor', 'liveness_interval_seconds', wait_sec) # how many second between 2 checks that the processes still exist
+daemon_enabled = get_setting(config.getboolean, 'Daemon', 'enabled', False) # one tracker daemon shared by all the DCCs of the user instead of a monitor per DCC
+daemon_port = get_setting(config.getint, 'Daemon', 'port', 0) # localhost port of the daemon, 0 for any free port
+daemon_timeout_sec = get_setting(config.getfloat, 'Daemon', 'timeout_seconds', 2.0) # how many second a plugin waits to connect to the daemon
+daemon_heartbeat_sec = get_setting(config.getfloat, 'Daemon', 'heartbeat_seconds', 30.0) # how many second between 2 checks of a plugin that the daemon still runs, a new daemon is elected if it doesn't. 0 to disable
+log_level = get_setting(config.get, 'Debug', 'log_level', 'INFO') # DEBUG, INFO, WARNING or ERROR. DEBUG if debug_mode
+log_max_bytes = get_setting(config.getint, 'Debug', 'log_max_bytes', 1024 * 1024) # size of the log file before it's rotated
+log_backup_count = get_setting(config.getint, 'Debug', 'log_backup_count', 3) # how many rotated log files are kept
+log_flush_sec = get_setting(config.getfloat, 'Debug', 'log_flush_seconds', 1.0) # how many second the log messages are gathered before being written
+metrics_enabled = get_setting(config.getboolean, 'Metrics', 'enabled', False) # measure the monitor hot paths and write them to the metrics folder
+metrics_interval_sec = get_setting(config.getfloat, 'Metrics', 'write_interval_seconds', 60.0) # how many second between 2 writes of the metrics file
+storage = get_setting(config.get, 'Data', 'storage', 'json') # json, sqlite: hours.db is the reference and hours.json is exported from it, or days: one file per day in the week folder, hours.json isn't written
@@ -0,0 +1,402 @@
+'''
+For Menhir FX
+
+Per-user tracking daemon shared by all the Prism instances of the user.
+
+The daemon owns the only Monitor of the user: one sampling loop and one in-memory state,
+whatever the number of DCCs opened. The Prism plugins talk to it over a localhost socket,
+one json message per line, through a DaemonClient that has the interface of a Monitor.
+
+The first plugin that doesn't find a daemon hosts it in a thread of its DCC.
+If that DCC exits, the heartbeat of another plugin elects a new host within heartbeat_seconds,
+the files opened by the plugins are sent again to it and the new daemon adopts the processes
+of the previous one, so their time is still saved.
+The daemon can also run on its own: python -m monitor_utils.daemon
+
+Messages, all with the 'token' of the daemon file:
+{"cmd": "hello"} -> {"ok": true, "monitor_id": str}
+{"cmd": "open", "filename": str, "executable": list, "pid": int} -> {"ok": true, "pid": int}
+{"cmd": "start"} -> {"ok": true}
+{"cmd": "save_closed", "save": bool} -> {"ok": true}
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import os
+import json
+import socket
+import secrets
+import traceback
+import socketserver
+from pathlib import Path
+from threading import Thread, RLock, Event
+
+from monitor_utils.config import mhfx_path
+from monitor_utils.file import FileLock, get_data, write_to_file
+from monitor_utils.data_management import adopt_processes
+from monitor_utils.mhfx_log import log
+import monitor_utils.clock as clock
+import monitor_utils.config.monitor as monitor
+
+HOST = '127.0.0.1'
+
+
+class DaemonError(Exception):
+    pass
+
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    '''
+    One connection of a plugin, answered line by line.
+    '''
+    def handle(self):
+        try:
+            for line in self.rfile:
+                try:
+                    response = self.server.tracker_daemon.handle_message(json.loads(line))
+                except:
+                    log.error(traceback.format_exc())
+                    response = {'ok': False, 'error': 'invalid message'}
+                self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+                self.wfile.flush()
+        except OSError:
+            # the DCC of the plugin exited
+            pass
+
+
+class DaemonServer(socketserver.ThreadingTCPServer):
+    '''
+    Threaded localhost server that keeps its connections to close them on shutdown.
+    '''
+    daemon_threads = True
+    allow_reuse_address = False
+
+    def __init__(self, *args, **kwargs):
+        self.connections = set()
+        self.connections_lock = RLock()
+        super().__init__(*args, **kwargs)
+
+    def process_request(self, request, client_address):
+        with self.connections_lock:
+            self.connections.add(request)
+        super().process_request(request, client_address)
+
+    def shutdown_request(self, request):
+        with self.connections_lock:
+            self.connections.discard(request)
+        super().shutdown_request(request)
+
+    def close_connections(self):
+        with self.connections_lock:
+            connections = list(self.connections)
+        for request in connections:
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class TrackerDaemon(object):
+    '''
+    class TrackerDaemon, the server that owns the Monitor.
+    The messages are handled one at a time, the Monitor isn't shared between threads otherwise.
+    '''
+    def __init__(self, info_path: str = mhfx_path.user_tmp_daemon, tracker_monitor=None):
+        if tracker_monitor == None:
+            from Monitor import Monitor
+            tracker_monitor = Monitor()
+        self.monitor = tracker_monitor
+        self.info_path = info_path
+        self.token = secrets.token_hex(16)
+        self.lock = RLock()
+        self.server = DaemonServer((HOST, monitor.daemon_port), DaemonHandler)
+        self.server.tracker_daemon = self
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def adopt_previous(self):
+        '''
+        Take the processes of the previous daemon of the daemon file, it doesn't answer anymore.
+        '''
+        try:
+            if not os.path.exists(self.info_path):
+                return
+            previous_id = get_data(self.info_path).get('monitor_id')
+            if previous_id == None or previous_id == self.monitor.id:
+                return
+            adopted = adopt_processes(previous_id, self.monitor.id)
+            if len(adopted) > 0:
+                log(f"Tracker daemon adopted the processes {list(adopted)} of monitor {previous_id}")
+                if self.monitor.is_running == False:
+                    self.monitor.start_thread()
+        except:
+            log.error(traceback.format_exc())
+
+    def write_info(self):
+        '''
+        Write the address of the daemon for the plugins, after adopting the processes of the previous daemon.
+        '''
+        self.adopt_previous()
+        info = {'port': self.port, 'pid': os.getpid(), 'token': self.token, 'monitor_id': self.monitor.id}
+        if not write_to_file(json.dumps(info), self.info_path):
+            raise DaemonError(f"Can't write {self.info_path}")
+
+    def start(self):
+        '''
+        Serve in a background thread.
+        '''
+        self.write_info()
+        self.thread = Thread(target=self.server.serve_forever, name='HoursTrackerDaemon', daemon=True)
+        self.thread.start()
+        log.debug(f"Tracker daemon listening on port {self.port} with monitor {self.monitor.id}")
+
+    def serve_forever(self):
+        '''
+        Serve in the current thread, until shutdown().
+        '''
+        self.write_info()
+        log.debug(f"Tracker daemon listening on port {self.port} with monitor {self.monitor.id}")
+        self.server.serve_forever()
+
+    def shutdown(self):
+        '''
+        Stop serving and close the connections of the plugins.
+        '''
+        self.server.shutdown()
+        self.server.server_close()
+        self.server.close_connections()
+
+    def handle_message(self, message: dict):
+        '''
+        :param message: dict
+        :return: dict, the response
+        '''
+        if message.get('token') != self.token:
+            return {'ok': False, 'error': 'invalid token'}
+
+        cmd = message.get('cmd')
+        with self.lock:
+            if cmd == 'hello':
+                return {'ok': True, 'monitor_id': self.monitor.id}
+            elif cmd == 'open':
+                pid = self.monitor.add_process(Path(message.get('filename')), message.get('executable'), int(message.get('pid', -1)))
+                if self.monitor.is_running == False:
+                    self.monitor.start_thread()
+                return {'ok': pid != None, 'pid': pid}
+            elif cmd == 'start':
+                if self.monitor.is_running == False:
+                    self.monitor.start_thread()
+                return {'ok': True}
+            elif cmd == 'save_closed':
+                self.monitor.saveClosedProcess(bool(message.get('save', True)))
+                return {'ok': True}
+        return {'ok': False, 'error': f'unknown command {cmd}'}
+
+
+_hosted_daemon = None
+_hosted_lock = RLock()
+
+def host_daemon(info_path: str = mhfx_path.user_tmp_daemon):
+    '''
+    Start a daemon in this process if no daemon answers.
+    The election is done under a lock on the daemon file, only one DCC hosts the daemon.
+
+    :param info_path: str
+    :return: bool, True if a daemon answers
+    '''
+    global _hosted_daemon
+    with _hosted_lock:
+        with FileLock(info_path + '.lock'):
+            if DaemonClient(info_path).ping():
+                return True
+            if _hosted_daemon != None:
+                _hosted_daemon.shutdown()
+            _hosted_daemon = TrackerDaemon(info_path)
+            _hosted_daemon.start()
+    return True
+
+
+class DaemonClient(object):
+    '''
+    class DaemonClient, the Monitor of a plugin when the daemon is enabled.
+    It has the methods of Monitor used by the plugin and forwards them to the daemon.
+    The opened files are kept to be sent again to a new daemon.
+    '''
+    def __init__(self, info_path: str = mhfx_path.user_tmp_daemon):
+        self.info_path = info_path
+        self.sock = None
+        self.sock_file = None
+        self.token = None
+        self.id = None
+        self.opened = {}
+        self.lock = RLock()
+        self.heartbeat = None
+        self.heartbeat_stop = Event()
+
+    @property
+    def is_running(self):
+        # the daemon starts its monitor when a file is opened
+        return self.sock != None
+
+    def start_heartbeat(self):
+        '''
+        Say hello to the daemon every monitor.daemon_heartbeat_sec in a background thread.
+        If the DCC of the daemon exited, a new daemon is elected and the opened files are sent again to it,
+        without waiting for the next message of the plugin.
+        '''
+        with self.lock:
+            if self.heartbeat != None or monitor.daemon_heartbeat_sec <= 0:
+                return
+            self.heartbeat_stop.clear()
+            self.heartbeat = Thread(target=self._beat, name='HoursTrackerHeartbeat', daemon=True)
+            self.heartbeat.start()
+
+    def stop_heartbeat(self):
+        self.heartbeat_stop.set()
+        self.heartbeat = None
+
+    def _beat(self):
+        while not clock.wait_event(self.heartbeat_stop, monitor.daemon_heartbeat_sec):
+            try:
+                self.request({'cmd': 'hello'})
+            except:
+                log.error(traceback.format_exc())
+
+    def close(self):
+        with self.lock:
+            for f in (self.sock_file, self.sock):
+                try:
+                    if f != None:
+                        f.close()
+                except OSError:
+                    pass
+            self.sock = None
+            self.sock_file = None
+
+    def connect(self):
+        '''
+        Connect to the daemon of the daemon file.
+
+        :return: bool
+        '''
+        with self.lock:
+            self.close()
+            if not os.path.exists(self.info_path):
+                return False
+            info = get_data(self.info_path)
+            try:
+                self.sock = socket.create_connection((HOST, int(info.get('port'))), timeout=monitor.daemon_timeout_sec)
+                # the daemon can look for the pid of a new DCC during wait_sec
+                self.sock.settimeout(monitor.wait_sec + monitor.daemon_timeout_sec)
+                self.sock_file = self.sock.makefile('rwb')
+                self.token = info.get('token')
+                response = self._send({'cmd': 'hello'})
+                if not response.get('ok'):
+                    raise DaemonError(response.get('error'))
+                self.id = response.get('monitor_id')
+                return True
+            except (OSError, ValueError, TypeError, DaemonError):
+                self.close()
+                return False
+
+    def ping(self):
+        '''
+        :return: bool, True if a daemon answers
+        '''
+        answers = self.connect()
+        self.close()
+        return answers
+
+    def _send(self, message: dict):
+        message = dict(message, token=self.token)
+        self.sock_file.write((json.dumps(message) + '\n').encode('utf-8'))
+        self.sock_file.flush()
+        line = self.sock_file.readline()
+        if not line:
+            raise ConnectionError('daemon closed the connection')
+        return json.loads(line)
+
+    def _reconnect(self):
+        if not self.connect():
+            host_daemon(self.info_path)
+            if not self.connect():
+                raise DaemonError("No tracker daemon")
+        # a new daemon doesn't know the files opened by this plugin
+        for filename, (executable, pid) in list(self.opened.items()):
+            response = self._send({'cmd': 'open', 'filename': filename, 'executable': executable, 'pid': pid})
+            if response.get('ok'):
+                self.opened[filename] = (executable, response.get('pid'))
+
+    def request(self, message: dict):
+        '''
+        Send a message to the daemon, reconnect or host a new daemon once if the daemon is gone.
+
+        :param message: dict
+        :return: dict, the response
+        '''
+        with self.lock:
+            try:
+                if self.sock == None:
+                    self._reconnect()
+                return self._send(message)
+            except (OSError, ValueError):
+                log.debug("Tracker daemon gone, reconnecting.")
+                self._reconnect()
+                return self._send(message)
+
+    def add_process(self, filename: Path, executable: list, pid: int):
+        '''
+        Same as Monitor.add_process, done by the daemon.
+        '''
+        try:
+            response = self.request({'cmd': 'open', 'filename': str(filename), 'executable': list(executable), 'pid': pid})
+            if response.get('ok'):
+                self.opened[str(filename)] = (list(executable), response.get('pid'))
+                return response.get('pid')
+        except:
+            log.error(traceback.format_exc())
+
+    def start_thread(self):
+        try:
+            self.request({'cmd': 'start'})
+        except:
+            log.error(traceback.format_exc())
+
+    def saveClosedProcess(self, save=True):
+        '''
+        Same as Monitor.saveClosedProcess, done by the daemon.
+        '''
+        try:
+            self.request({'cmd': 'save_closed', 'save': save})
+        except:
+            log.error(traceback.format_exc())
+
+
+def get_monitor():
+    '''
+    Return the monitor of a plugin: a DaemonClient if the daemon is enabled and reachable, else a Monitor.
+
+    :return: Monitor or DaemonClient
+    '''
+    if monitor.daemon_enabled:
+        try:
+            client = DaemonClient()
+            if client.connect() or (host_daemon() and client.connect()):
+                client.start_heartbeat()
+                return client
+        except:
+            log.error(traceback.format_exc())
+        log("Tracker daemon unavailable, the plugin uses its own monitor.")
+    from Monitor import Monitor
+    return Monitor()
+
+
+if __name__ == '__main__':
+    with FileLock(mhfx_path.user_tmp_daemon + '.lock'):
+        if DaemonClient().ping():
+            raise SystemExit("A tracker daemon is already running.")
+        tracker_daemon = TrackerDaemon()
+        tracker_daemon.write_info()
+    tracker_daemon.serve_forever()
@@ -4,280 +4,361 @@ Elise Vidal - evidal@artfx.fr
 Angele Sionneau - asionneau@artfx.fr
 '''
 import traceback
-import json
-from datetime import datetime, timedelta
+from contextlib import contextmanager
+from datetime import datetime
 
 import monitor_utils.date as dt
 from monitor_utils.windows import get_windows_username, does_process_exists
-import monitor_utils.data_initialise as di
+from monitor_utils.tracker_data import TrackerData
 import monitor_utils.file as file
 import monitor_utils.config.mhfx_path as mhfx_path
 from monitor_utils.mhfx_log import log
+import monitor_utils.clock as clock
+from monitor_utils.metrics import metrics
 import monitor_utils.config.monitor as monitor
+from monitor_utils.persistence import DataStore
+from monitor_utils.sqlite_store import SqliteStore, get_store
+from monitor_utils.partitions import DayPartitions, get_partitions
+from monitor_utils.process_registry import ProcessRegistry, ShardedProcessRegistry
 
-## MODIFY
-def add_project(data: dict, project: dict):
-    '''
-    Append a project in the data in the last day
-
-    :param data: dict
-    :param project: dict
-    :return: dict, data modified
-    '''
-    try:
-        data.get('days')[-1].get('projects').append(project)
-        return data
-    except:
-        log.error(traceback.format_exc())
-
-def add_project_session(data: dict, session: dict, entity: dict):
-    '''
-    Append a project session in the data in the right project
-
-    :param data: dict
-    :param session: dict
-    :return: dict, data modified
-    '''
-    try:
-        projects = data.get('days')[-1].get('projects')
-        for p in projects:
-            if p.get('project_name') == entity.get('project_name'):
-                p.get('project_sessions').append(session)
-
-        return data
-    except:
-        log.error(traceback.format_exc())
- 
-def add_asset_session(data: dict, entity: dict, session: dict):
-    '''
-    Append an asset session in the data in the right project session
-
-    :param data: dict
-    :param entity: dict
-    :param session: dict
-    :return: dict, data modified
-    '''
-    try:
-        projects = data.get('days')[-1].get('projects')
-        for p in projects:
-            if p.get('project_name') == entity.get('project_name'):
-                project_sessions = p.get('project_sessions')
-                for ps in project_sessions:
-                    if ps.get('asset_name') == entity.get('asset_name') and ps.get('department') == entity.get('department'):
-                        ps.get('asset_sessions').append(session)
-
-        return data
-    except:
-        log.error(traceback.format_exc())
+data_store = DataStore(mhfx_path.user_data_json, mhfx_path.user_report_dir, monitor.pretty_json)
+process_registry = ShardedProcessRegistry(mhfx_path.user_tmp_processes_dir)
+last_process_registry = ProcessRegistry(mhfx_path.user_tmp_last_proc)
 
+## MODIFY
 
-def update_data(data: dict, entity: dict, time: int, first: str):
+@metrics.timed('stage_seconds', stage='update_data')
+def update_data(data, entity: dict, time: int, first: str, now: datetime = None):
     '''
     Update tracker data with entity.
 
-    :param data: dict, tracker data
+    :param data: TrackerData, SqliteStore or dict, tracker data
     :param entity: dict, session info
     :param time: int, how many seconds the session was used
     :param first: string, the time %H%M%S the session was opened
-    :return: dict, data modified
+    :param now: datetime, when the session was used. By default now.
+    :return: same type as data, data modified
     '''
+    if isinstance(data, SqliteStore):
+        if now == None:
+            now = clock.now()
+        try:
+            # one transaction: the week information and an upsert of the session
+            with data.transaction() as cursor:
+                data.set_header(*get_week_header(now), cursor=cursor)
+                data.set_session(now.toordinal(), entity, dt.get_time_as_seconds(first), time, dt.get_datetime_as_seconds(now), cursor=cursor)
+            return data
+        except:
+            log.error(traceback.format_exc())
+            return None
+
+    if not isinstance(data, TrackerData):
+        tracker = update_data(TrackerData(data), entity, time, first, now)
+        return tracker.as_dict() if tracker != None else None
 
     # get current time
-    now = datetime.now()
-    date = now.strftime('%d/%m/%y')
-    data = create_data(data, entity, first)
+    if now == None:
+        now = clock.now()
+    data = create_data(data, entity, first, now)
     try:
         # update session
-        days = data.get('days')
-
-        for d in days:
-            if d.get('date') ==  date:
-                project = entity.get('project_name')
-                for p in d.get('projects'):
-                    if p.get('project_name') == project:
-                        for ps in p.get('project_sessions'):
-                            total_time = timedelta(seconds=0)
-                            asset_name = ps.get('asset_name')
-                            department = ps.get('department')
-                            if asset_name == entity.get('asset_name') and department == entity.get('department'):
-                                for s in reversed(ps.get('asset_sessions')):
-                                    if s.get('start_time') == first:
-                                        # update last action time
-                                        s['last_action_time'] = now.strftime('%H:%M:%S')
-                                        # update total_time session
-                                        hours = time // 3600
-                                        minutes = (time % 3600) // 60
-                                        seconds = time % 60
-                                        s['total_time'] = "{:02d}:{:02d}:{:02d}".format(hours, minutes, seconds)
-                                        if monitor.debug_mode:
-                                            log(f"Update tracker data: {date} : {project} : {asset_name}-{department} : {s}")
-                                    
-                                    # update total_time project session
-                                    tt = dt.get_time_as_datetime_obj(s.get('total_time'))
-                                    delta_tt = timedelta(hours=tt.hour, minutes=tt.minute, seconds=tt.second)
-                                    total_time += delta_tt
-                                ps['total_time'] = str(total_time)
-                                if monitor.debug_mode:
-                                    log(f"Total time updated : {asset_name}-{department} : {ps['total_time']}")
-                                break
-                        break
-        return data 
+        ps, s = data.get_or_create_session(now.toordinal(), entity, dt.get_time_as_seconds(first))
+        data.set_session_time(ps, s, time, dt.get_datetime_as_seconds(now))
+        if monitor.debug_mode:
+            log(f"Update tracker data: {dt.get_date_as_string(now)} : {entity.get('project_name')} : {ps.asset_name}-{ps.department} : {s.as_dict()}")
+            log(f"Total time updated : {ps.asset_name}-{ps.department} : {dt.get_seconds_as_time(ps.seconds)}")
+        return data
 
     except Exception as e:
-        log(traceback.format_exc())
+        log.error(traceback.format_exc())
 
-def create_data(data: dict, entity: dict, first: str):
+def create_data(data: TrackerData, entity: dict, first: str, now: datetime = None):
     '''
     Prepare a clean version of the tracker data with the entity session info.
     
-    :param data: dict, tracker data
+    :param data: TrackerData, tracker data
     :param entity: dict, session info
     :param first: string, the time %H%M%S the session was opened
-    :return: dict, data modified
+    :param now: datetime, when the session was used. By default now.
+    :return: TrackerData, data modified
     '''
     try:
-        # Get scene open action relevant data
-        user = get_windows_username()
-        now = datetime.now()
-        date = now.strftime('%d/%m/%y')
-        year = now.isocalendar()[0]
-        week = now.isocalendar()[1]
-        week_description = dt.get_week_definition()
+        if now == None:
+            now = clock.now()
 
         # push entity session in tracker data
-        data = initialise_data(data, entity, date, first)
+        data.get_or_create_session(now.toordinal(), entity, dt.get_time_as_seconds(first))
 
         # Set last datas
-        data['user_id'] = user
-        data['year'] = str(year)
-        data['week'] = str(week)
-        data['week_description'] = week_description
+        data.set_header(*get_week_header(now))
 
         return data
         
     except Exception as e:
-        log(traceback.format_exc())
+        log.error(traceback.format_exc())
 
-def initialise_data(data: dict, entity: dict, date: str, first: str):
+def get_week_header(now: datetime):
+    '''
+    :param now: datetime
+    :return: tuple (user_id, year, week, week_description) of the tracker data
+    '''
+    year, week, _ = now.isocalendar()
+    return get_windows_username(), str(year), str(week), dt.get_week_definition(now)
+
+def initialise_data(data: TrackerData, entity: dict, date: str, first: str):
     '''
     Depending on the entity, will create its data in the right place in the tracker data.
 
-    :param data: dict, tracker data
+    :param data: TrackerData or SqliteStore, tracker data
     :param entity: dict, session entity
     :param date: string, current date
     :param first: string, when the session was opened
-    :return: dict, tracker data modified
+    :return: TrackerData or SqliteStore, tracker data modified
     '''
     try:
-        # if no data, initialise complete data set with entity
-        if data == {}:
-            return di.initialise_data(date, entity, first)
-
-        # if current date don't exist in tracker data, create it with entity
-        if not does_day_exist(data, date):
-            new_day = di.initialise_day(date, entity, first)
-            data.get('days').append(new_day)
+        if isinstance(data, SqliteStore):
+            data.add_session(dt.get_date_as_ordinal(date), entity, dt.get_time_as_seconds(first))
             return data
-        
-        # others situations
-        projects = data.get('days')[-1].get('projects')
-        for p in projects:
-            if p.get('project_name') == entity.get('project_name'):
-                sessions = p.get('project_sessions')
-                for s in sessions:
-                    if s.get('asset_name') == entity.get('asset_name') and s.get('department') == entity.get('department'):
-                        try:
-                            asset_sessions = s.get('asset_sessions')
-                            for a_s in reversed(asset_sessions):
-                                # asset session already exists
-                                if a_s.get('start_time') == first:
-                                    return data
-
-                            # need new asset session
-                            session = di.initialise_asset_session(first)
-                            return add_asset_session(data, entity, session)
-                        except:
-                            # need new asset session
-                            session = di.initialise_asset_session(first)
-                            return add_asset_session(data, entity, session)
-                # entity not found in project sessions
-                session = di.initialise_project_sessions(entity, first)
-                return add_project_session(data, session, entity)
-        # project was not found
-        project = di.initialise_project(entity, first)
-        return add_project(data, project)
+        data.get_or_create_session(dt.get_date_as_ordinal(date), entity, dt.get_time_as_seconds(first))
+        return data
+    except:
+        log.error(traceback.format_exc())
+
+@metrics.timed('stage_seconds', stage='apply_records')
+def apply_records(records: list):
+    '''
+    Write journal records to the tracker data files.
+    Records are applied in order, so the last record of a session wins.
+    With the sqlite storage, they are written to the database in one transaction, then hours.json is exported.
+    With the days storage, only the days of the records are read and written.
+
+    :param records: list of dict, see journal.create_record
+    :return: bool, True if the records were written
+    '''
+    try:
+        store = get_store()
+        if store != None:
+            with store.transaction() as cursor:
+                for record in records:
+                    now = datetime.fromtimestamp(record.get('ts'))
+                    store.set_session(
+                        now.toordinal(), record.get('entity'), dt.get_time_as_seconds(record.get('first')),
+                        record.get('time'), dt.get_datetime_as_seconds(now), cursor=cursor
+                    )
+                if len(records) > 0:
+                    store.set_header(*get_week_header(now), cursor=cursor)
+            return export_data(store)
+
+        partitions = get_partitions()
+        if partitions != None:
+            return apply_records_to_days(partitions, records)
+
+        # the days storage was used before, its week is the reference until hours.json is written
+        previous = DayPartitions(mhfx_path.user_week_dir)
+        switched = previous.exists()
+        data = TrackerData(previous.as_dict() if switched else file.get_data(mhfx_path.user_data_json))
+        for record in records:
+            now = datetime.fromtimestamp(record.get('ts'))
+            data = update_data(data, record.get('entity'), record.get('time'), record.get('first'), now)
+
+        written = push_data(data.as_dict())
+        if written and switched:
+            previous.clear()
+        return written
     except:
-        log(traceback.format_exc())
+        log.error(traceback.format_exc())
+        return False
+
+def apply_records_to_days(partitions: DayPartitions, records: list):
+    '''
+    Write journal records to the partitions of their days, then the report of these days.
+
+    :param partitions: DayPartitions
+    :param records: list of dict, see journal.create_record
+    :return: bool, True if the records were written
+    '''
+    header = partitions.read_header()
+    days = {}
+    for record in records:
+        now = datetime.fromtimestamp(record.get('ts'))
+        date = dt.get_date_as_string(now)
+        data = days.get(date)
+        if data == None:
+            day = partitions.read_day(date)
+            data = TrackerData({'days': [day]} if day else {})
+        data = update_data(data, record.get('entity'), record.get('time'), record.get('first'), now)
+        if data == None:
+            # error logged by update_data, the other records are still written
+            continue
+        days[date] = data
+        header = data.header
+
+    written = True
+    day_contents = {}
+    for date, data in days.items():
+        content = partitions.write_day(data.as_dict().get('days')[0])
+        if content == None:
+            written = False
+            continue
+        day_contents[date] = content
+    if len(records) > 0:
+        written = partitions.write_header(header) and written
+
+    dates = partitions.list_dates()
+    for date in data_store.missing_days(dates):
+        if date not in day_contents:
+            # no report file yet, the week was imported or the report removed
+            day = partitions.read_day(date)
+            if day:
+                day_contents[date] = DataStore.serialize(day)
+    return data_store.flush_days(partitions.read_header(), day_contents, dates) and written
+
+def get_week_data(sessions: bool = True):
+    '''
+    The tracker data of the week in the hours.json schema.
+    With the days storage it is merged from the days, hours.json otherwise.
+
+    :param sessions: bool, False when only the week information and the dates of the days are needed,
+                     the days storage doesn't read the days then
+    :return: dict
+    '''
+    partitions = get_partitions()
+    if partitions != None:
+        return partitions.as_dict(sessions)
+    return file.get_data(mhfx_path.user_data_json)
 
 ## CHECK
 
-def does_day_exist(data: dict, date: str):
+def does_day_exist(data, date: str):
     '''
     Checks if the given date exists in the data
 
-    :param data: dict
+    :param data: TrackerData, SqliteStore or dict
     :param date: string
     :return: bool
     '''
     try:
-        for d in data.get('days'):
-            if d.get('date') == date:
-                return True
+        if isinstance(data, SqliteStore):
+            return data.has_day(dt.get_date_as_ordinal(date))
+        if not isinstance(data, TrackerData):
+            data = TrackerData(data)
+        return data.has_day(dt.get_date_as_ordinal(date))
     except Exception as e:
-        log(traceback.format_exc())
+        log.error(traceback.format_exc())
 
 # WRITE
 
-def push_data(js_obj, json_obj):
+@metrics.timed('stage_seconds', stage='push_data')
+def push_data(data: dict):
     '''
-    Write tracker data to files.
+    Write tracker data to files, if it changed since the last write.
 
-    :param js_obj: json dict, tracker data
-    :param json_obj: json dict, tracker data
+    :param data: dict, tracker data
+    :return: bool, False if the data couldn't be written
     '''
-    try:
-        content = "var data = '{}'".format(js_obj)
-        file.write_to_file(content, mhfx_path.user_data_js)
-        
-        file.write_to_file(json_obj, mhfx_path.user_data_json)
-    except:
-        log(traceback.format_exc())
+    return data_store.flush(data)
+
+@metrics.timed('stage_seconds', stage='export_data')
+def export_data(store: SqliteStore):
+    '''
+    Write hours.json and the report of hours.html from the sqlite storage.
+
+    :param store: SqliteStore
+    :return: bool, False if the data couldn't be written
+    '''
+    if not push_data(store.as_dict()):
+        return False
+    # hours.json matches the database, see get_store
+    store.set_export_digest(data_store.last_digest.hex())
+    return True
 
+@metrics.timed('stage_seconds', stage='push_processes')
 def push_processes(content, monitor_id=-1):
     '''
-    Write list of processes to user's tmp folder.
+    Write list of processes to the monitor's file in user's tmp folder.
+    Closed processes of the monitor (all monitors if monitor_id is -1) are removed.
 
     :param content: dict
     :param monitor_id: int
     '''
     try:
-        data = file.get_data(mhfx_path.user_tmp_processes)
-        data_copy = data.copy()
-        for pid, infos in data_copy.items():
-            if infos.get('monitor_id') == str(monitor_id) or monitor_id == -1:
-                if not does_process_exists(pid):
-                    data.pop(str(pid))
-        data.update(content)
-        json_obj = json.dumps(data, indent=4)
-        file.write_to_file(json_obj, mhfx_path.user_tmp_processes)
+        m_id = str(monitor_id)
+        # processes grouped by monitor
+        groups = {}
+        for pid, infos in content.items():
+            groups.setdefault(infos.get('monitor_id', m_id), {})[str(pid)] = infos
+
+        if m_id == "-1":
+            shard_ids = set(process_registry.shard_ids()) | set(groups)
+        else:
+            shard_ids = set(groups) | {m_id}
+
+        for shard_id in shard_ids:
+            group = groups.get(shard_id, {})
+            check_alive = m_id == "-1" or shard_id == m_id
+
+            def change(data, group=group, check_alive=check_alive):
+                if check_alive:
+                    for pid in list(data):
+                        if pid not in group and not does_process_exists(pid):
+                            data.pop(pid)
+                data.update(group)
+                return data
+
+            process_registry.shard(shard_id).change(change)
     except:
-        log(traceback.format_exc())
+        log.error(traceback.format_exc())
 
 def remove_processes(pids : list):
     '''
-    Remove processes from tmp file processes.json with the pid in pids.
+    Remove processes with the pid in pids from the files of the monitors.
 
     :param pids : list of int or list of str of int
     '''
     try:
-        data = file.get_data(mhfx_path.user_tmp_processes)
-        for pid in pids:
-            data.pop(str(pid))
-        json_obj = json.dumps(data, indent=4)
-        file.write_to_file(json_obj, mhfx_path.user_tmp_processes)
+        pids = set(str(pid) for pid in pids)
+
+        def change(data):
+            for pid in pids:
+                data.pop(pid, None)
+            return data
+
+        for shard_id in process_registry.shard_ids():
+            shard = process_registry.shard(shard_id)
+            if not pids.isdisjoint(shard.read()):
+                shard.change(change)
     except:
-        log(traceback.format_exc())
+        log.error(traceback.format_exc())
 
+def adopt_processes(old_id, new_id):
+    '''
+    Move the processes of the monitor old_id to the monitor new_id,
+    for a tracker daemon that replaces a daemon whose DCC exited.
+
+    :param old_id: str, id of the previous monitor
+    :param new_id: str, id of the new monitor
+    :return: dict, the processes moved
+    '''
+    try:
+        old_id, new_id = str(old_id), str(new_id)
+        adopted = process_registry.shard(old_id).read()
+        if len(adopted) <= 0:
+            return {}
+        for infos in adopted.values():
+            infos['monitor_id'] = new_id
+
+        with processes_batch():
+            process_registry.shard(new_id).change(lambda data: dict(data, **adopted))
+            process_registry.shard(old_id).change(lambda data: {})
+            last = last_process_registry.read()
+            if last != {} and next(iter(last.values())).get('monitor_id') == old_id:
+                push_last_process({pid: dict(infos, monitor_id=new_id) for pid, infos in last.items()})
+        return adopted
+    except:
+        log.error(traceback.format_exc())
+        return {}
+
+@metrics.timed('stage_seconds', stage='get_processes')
 def get_processes(monitor_id=-1):
     '''
     Get the dictionnary of processes written in the user's tmp folder.
@@ -287,22 +368,12 @@ def get_processes(monitor_id=-1):
     :return: dict
     '''
     try:
-        data =  file.get_data(mhfx_path.user_tmp_processes)
-
         if monitor_id == -1:
-            return data
+            return process_registry.read_all()
         else:
-            m_id = str(monitor_id)
-            data_to_return = {}
-
-            if data != {}:
-                for pid, infos in data.items():
-                    if infos.get('monitor_id') == m_id:
-                        data_to_return[pid] = infos
-
-            return data_to_return
+            return process_registry.shard(monitor_id).read()
     except:
-        log(traceback.format_exc())
+        log.error(traceback.format_exc())
 
 def get_last_process(monitor_id=-1):
     '''
@@ -312,7 +383,7 @@ def get_last_process(monitor_id=-1):
     :param monitor_id: int 
     '''
     try:
-        last = file.get_data(mhfx_path.user_tmp_last_proc)
+        last = last_process_registry.read()
         m_id = str(monitor_id)
         if last != {}:
             pid = next(iter(last))
@@ -320,7 +391,7 @@ def get_last_process(monitor_id=-1):
                 return last
         return None
     except:
-        log(traceback.format_exc())
+        log.error(traceback.format_exc())
 
 def push_last_process(last):
     '''
@@ -329,7 +400,15 @@ def push_last_process(last):
     :param last: dict
     '''
     try:
-        json_obj = json.dumps(last, indent=4)
-        file.write_to_file(json_obj, mhfx_path.user_tmp_last_proc)
+        last = {str(pid): dict(infos) for pid, infos in last.items()}
+        last_process_registry.change(lambda data: dict(last))
     except:
-        log(traceback.format_exc())
\ No newline at end of file
+        log.error(traceback.format_exc())
+
+@contextmanager
+def processes_batch():
+    '''
+    Write the processes files and last_process.json once at the end of the with block.
+    '''
+    with process_registry.batch(), last_process_registry.batch():
+        yield
@@ -4,7 +4,9 @@ Elise Vidal - evidal@artfx.fr
 Angele Sionneau - asionneau@artfx.fr
 '''
 
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+
+import monitor_utils.clock as clock
 
 def get_date_as_datetime_obj(date_string):
         '''
@@ -60,14 +62,64 @@ def get_date_delta(newest_date, oldest_date):
         delta = timedelta(hours=newest_date.hour, minutes=newest_date.minute, seconds=newest_date.second) - timedelta(hours=oldest_date.hour, minutes=oldest_date.minute, seconds=oldest_date.second)
         return  delta
 
-def get_week_definition():
+def get_time_as_seconds(time_string):
+    '''
+    Converts a string object representing a duration or a time of the day, like this '%H:%M:%S', to seconds.
+    Unlike strptime, hours can be 24 or more.
+
+    :param time_string: string
+    returns: int
+    '''
+    hours, minutes, seconds = time_string.split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+def get_seconds_as_time(seconds):
+    '''
+    Converts seconds to a string object like this '%H:%M:%S'. Hours can be 24 or more.
+
+    :param seconds: int
+    returns: string
+    '''
+    return "{:02d}:{:02d}:{:02d}".format(seconds // 3600, (seconds % 3600) // 60, seconds % 60)
+
+def get_datetime_as_seconds(datetime_obj):
+    '''
+    Returns the seconds since midnight of a datetime object.
+
+    :param datetime_obj: datetime
+    returns: int
+    '''
+    return datetime_obj.hour * 3600 + datetime_obj.minute * 60 + datetime_obj.second
+
+def get_date_as_ordinal(date_string):
+    '''
+    Converts a string object representing a date, like this %d/%m/%y, to a day number (date.toordinal).
+
+    :param date_string: string
+    returns: int
+    '''
+    day, month, year = date_string.split('/')
+    return date(2000 + int(year), int(month), int(day)).toordinal()
+
+def get_ordinal_as_date_string(ordinal):
+    '''
+    Converts a day number (date.toordinal) to string format %d/%m/%y.
+
+    :param ordinal: int
+    returns: string
+    '''
+    return get_date_as_string(date.fromordinal(ordinal))
+
+def get_week_definition(today=None):
     '''
     Get the week definition of the current week
     format monday %d/%m/%y - wednesday %d/%m/%y
 
+    :param today: datetime, day of the week to define. By default now.
     :return: string
     '''
-    today = datetime.now()
+    if today == None:
+        today = clock.now()
     day_of_week = today.weekday()
 
     to_beginning_of_week = timedelta(days=day_of_week)
@@ -0,0 +1,159 @@
+'''
+For Menhir FX
+
+Convert the filename of a scene to the entity the monitor tracks (project, asset, department).
+The path templates are compiled once at import and the entities are memoized per filename.
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import re
+import traceback
+from functools import lru_cache
+from pathlib import Path
+
+from monitor_utils.config.mhfx_path import file_templates
+import monitor_utils.config.monitor as monitor
+from monitor_utils.mhfx_log import log
+
+FIELD_PATTERN = re.compile(r'{(.*?)}')
+
+
+class PathTemplate(object):
+    '''
+    class PathTemplate, a compiled file template like "{letter}/{project_name}/03_Production/...".
+    prefix is the literal text before the first field, used to dispatch the filenames.
+    '''
+    def __init__(self, template: str):
+        self.template = template
+        self.fields = FIELD_PATTERN.findall(template)
+
+        parts = FIELD_PATTERN.split(template)
+        # parts alternate literal text and field names
+        literals = parts[0::2]
+        self.prefix = literals[0]
+        self.longest_literal = max(literals, key=len)
+
+        regex_pattern = ''
+        for i, part in enumerate(parts):
+            if i % 2 == 0:
+                regex_pattern += re.escape(part)
+            else:
+                regex_pattern += f'(?P<{part}>.*?)'
+        self.regex = re.compile(regex_pattern)
+
+    def match(self, filename: str):
+        '''
+        :param filename: string
+        :return: dict field -> value, or None if the filename doesn't match
+        '''
+        if self.longest_literal not in filename:
+            return None
+        matches = self.regex.match(filename)
+        if matches:
+            return matches.groupdict()
+        return None
+
+
+class TemplateMatcher(object):
+    '''
+    class TemplateMatcher, an ordered list of PathTemplate dispatched by prefix.
+    Only the templates whose prefix starts the filename are tried, in their order.
+    '''
+    def __init__(self, templates: list):
+        self.templates = [PathTemplate(t) for t in templates]
+        self.prefixes = sorted(set(t.prefix for t in self.templates), key=len, reverse=True)
+
+    def match(self, filename: str):
+        '''
+        :param filename: string
+        :return: tuple (PathTemplate, dict) of the first template matching, or (None, None)
+        '''
+        prefixes = set(p for p in self.prefixes if filename.startswith(p))
+        for template in self.templates:
+            if template.prefix in prefixes:
+                data = template.match(filename)
+                if data != None:
+                    return template, data
+        return None, None
+
+template_matcher = TemplateMatcher(file_templates)
+
+@lru_cache(maxsize=32)
+def compile_template(template: str):
+    '''
+    :param template: string
+    :return: PathTemplate
+    '''
+    return PathTemplate(template)
+
+def convert_file_to_data(filename, template):
+    '''
+    Convert a filename to a dict with the fields of the template.
+
+    :param filename: str or Path object
+    :param template: string
+    :return: dict, empty if the filename doesn't match
+    '''
+    try:
+        data = compile_template(template).match(str(filename))
+        return data if data != None else {}
+    except Exception as e:
+        log.error(traceback.format_exc())
+
+def get_entity(filename):
+    '''
+    Convert a filename to a dict with info the monitor needs.
+
+    :param filename: str or Path object
+    :return: dict
+    '''
+    filename = str(filename).replace('\\', '/')
+    entity = resolve_entity(filename)
+    if entity != None:
+        # the cached entity must not be modified by the caller
+        return dict(entity)
+    return None
+
+@lru_cache(maxsize=monitor.entity_cache_size)
+def resolve_entity(filename: str):
+    '''
+    Memoized conversion of a normalized filename to an entity.
+
+    :param filename: string, with / separators
+    :return: dict
+    '''
+    try :
+        template, data = template_matcher.match(filename)
+
+        if template == None:
+            if monitor.debug_mode:
+                log("No template work for this asset")
+            filename_path = Path(filename)
+            data = {
+                'asset_type': 'unknown',
+                'asset_subtype': '',
+                'department': '',
+                'task': '',
+                'asset_name': str(filename_path.name),
+                'project_name': str(filename_path.stem)
+            }
+        elif 'asset_subtype' not in data:
+            data['asset_subtype'] = data.get('asset_type')
+
+        entity ={
+            'name': filename,
+            'department': data.get('task'),
+            'asset_type': data.get('asset_type').lower(),
+            'project_name': data.get('project_name')
+        }
+
+        if "shot" in entity.get('asset_type'):
+            entity['asset_name'] = f"{data.get('asset_subtype')} {data.get('asset_name')}"
+        else:
+            entity['asset_name'] = data.get('asset_name')
+
+        return entity
+
+    except:
+        log.error(traceback.format_exc())
+        log("seems your file can't be convert to object, please verify you're in pipe")
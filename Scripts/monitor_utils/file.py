@@ -4,12 +4,21 @@ Elise Vidal - evidal@artfx.fr
 Angele Sionneau - asionneau@artfx.fr
 '''
 import os
+import glob
+import shutil
 import traceback
 import json
-import shutil
+import tempfile
+import time
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
 
 from monitor_utils.mhfx_log import log
-from monitor_utils.config import mhfx_path
+from monitor_utils.metrics import metrics, prune_metrics_files
+from monitor_utils.config import mhfx_path, monitor
 
 def get_data(path):
     '''
@@ -25,14 +34,14 @@ def get_data(path):
             try:
                 raw_data = json_file.read()
             except Exception as e:
-                log(traceback.format_exc())
-                log(str(e))
+                log.error(traceback.format_exc())
+                log.error(str(e))
             data = json.loads(raw_data)
         
         if data == None:
             data = {} 
     except:
-        log(traceback.format_exc())
+        log.error(traceback.format_exc())
         # If json file empty return empty dict/json object
         data = {}
     
@@ -41,67 +50,223 @@ def get_data(path):
 def write_to_file(content, filename):
     '''
     Writes given content to the given filename.
+    The content is written to a temporary file next to filename, then renamed over it,
+    so a reader never sees a partially written file.
 
-    :param content: dict
+    :param content: str
     :param filename: string
+    :return: bool, True if the file was written
     '''
+    filename = str(filename)
+    tmp_path = None
     try:
-        output_file = open(filename, 'w')
-        output_file.write(content)
-        output_file.close()
+        fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(filename), suffix='.tmp', dir=os.path.dirname(filename) or '.')
+        with os.fdopen(fd, 'w') as output_file:
+            output_file.write(content)
+        replace_file(tmp_path, filename)
+        if metrics.enabled:
+            name = get_metrics_file_label(filename)
+            metrics.inc('written_bytes_total', len(content.encode('utf-8')), file=name)
+            metrics.inc('writes_total', file=name)
+        return True
     except:
-        log(traceback.format_exc())
+        log.error(traceback.format_exc())
+        if tmp_path != None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+def get_metrics_file_label(filename):
+    '''
+    :param filename: string
+    :return: string, the file name, or the folder name for the files of a monitor, a process or a day
+    '''
+    folder = os.path.normpath(os.path.dirname(filename))
+    if folder in (os.path.normpath(mhfx_path.user_tmp_processes_dir), os.path.normpath(mhfx_path.user_metrics_dir), os.path.normpath(mhfx_path.user_report_dir), os.path.normpath(mhfx_path.user_week_dir)):
+        return os.path.basename(folder)
+    return os.path.basename(filename)
+
+def replace_file(src, dst, retries=5):
+    '''
+    Rename src over dst.
+    On Windows the rename fails while another process reads dst, so retry a few times.
+
+    :param src: string
+    :param dst: string
+    :param retries: int
+    '''
+    for attempt in range(retries):
+        try:
+            os.replace(src, dst)
+            return
+        except PermissionError:
+            if attempt == retries - 1:
+                raise
+            time.sleep(0.05 * (attempt + 1))
+
+class FileLock(object):
+    '''
+    class FileLock, a lock shared by all the processes of the machine, on a lock file.
+    Use it as a context manager:
+
+    with FileLock(path + '.lock'):
+        ...
+    '''
+    def __init__(self, path, timeout=10.0):
+        self.path = str(path)
+        self.timeout = timeout
+        self.lock_file = None
+
+    def acquire(self):
+        '''
+        Wait for the lock, at most timeout seconds.
+
+        :return: bool, True if the lock is acquired
+        '''
+        self.lock_file = open(self.path, 'a+')
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                if os.name == 'nt':
+                    self.lock_file.seek(0)
+                    msvcrt.locking(self.lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+                else:
+                    fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except OSError:
+                if time.monotonic() >= deadline:
+                    log(f"Can't lock {self.path} after {self.timeout} sec, continue without lock.")
+                    return False
+                time.sleep(0.01)
+
+    def release(self):
+        try:
+            if os.name == 'nt':
+                self.lock_file.seek(0)
+                msvcrt.locking(self.lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_UN)
+        except OSError:
+            pass
+        finally:
+            self.lock_file.close()
+            self.lock_file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.release()
 
 def backup_data(data):
     """
-    Copies the user's json data to a backup location
-    Fill json backups with new backup location
+    Archives the user's week in the backup archive, with the log of the week.
+    Writes the js view of the week for hours.html, and of the archived weeks without one.
+    Fill json backups with the archived weeks
 
     :param data: dict, data to backup
     """
     try:
+        # imported here, backup.py and history.py use the functions of this module
+        from monitor_utils.backup import archive
+        from monitor_utils.history import history_index
+
         # last week and last year
         week = data.get('week')
         year = data.get('year')
-        week_definition = data.get('week_description')
-
-        # write hours data
-        src = mhfx_path.user_data_json
-        dst = f"{mhfx_path.user_data_backup}{week}_{year}_hours.json"
-        shutil.copy(src, dst)
 
-        src = mhfx_path.user_data_js
-        dst = f"{mhfx_path.user_data_backup}{week}_{year}_hours.js"
-        shutil.copy(src, dst)
+        # messages still in the queue of the logger belong to this week
+        log.flush()
+        # the rotated files then the current one, the log of the week in order
+        log_content = ''
+        for log_path in get_rotated_logs() + [mhfx_path.user_log]:
+            if os.path.exists(log_path):
+                with open(log_path, 'r', encoding='utf-8', errors='replace') as log_file:
+                    log_content += log_file.read()
 
-        src = mhfx_path.user_log
-        dst = f"{mhfx_path.user_data_backup}{week}_{year}_log.txt"
-        shutil.copy(src, dst)
+        # write hours data
+        archive.add_week(data, log_content)
+        archive.materialize(week, year)
+        archive.migrate_legacy()
+        archive.convert_legacy_views()
+        archive.materialize_missing()
+        # summary of the new weeks for the history queries. No process pool in a DCC:
+        # its workers would start sys.executable, the DCC itself
+        history_index.sync(workers=1)
 
-        # write backup data
-        new_bckp = create_backup_info(week, year, week_definition)
-        bckp_info = get_data(mhfx_path.user_list_backup_json)
-        if bckp_info == {}:
-            bckp_info = {"backups":[]}
-        bckp_info.get('backups').insert(0, new_bckp)
+        # write backup data, the list is the index of the archive
+        backups = []
+        for entry in archive.entries():
+            bckp = create_backup_info(entry.get('week'), entry.get('year'), entry.get('week_description'))
+            bckp['total_seconds'] = entry.get('total_seconds')
+            backups.append(bckp)
+        bckp_info = {"backups": backups}
 
         js_obj = json.dumps(bckp_info)
-        content = f"var data = '{js_obj}'"
+        content = f"var data = {js_obj};\n"
         write_to_file(content, mhfx_path.user_list_backup_js)
 
         json_obj = json.dumps(bckp_info, indent=4)
         write_to_file(json_obj, mhfx_path.user_list_backup_json)
 
         write_to_file('', mhfx_path.user_log)
+        remove_rotated_logs()
+    except:
+        log.error(traceback.format_exc())
+
+def get_rotated_logs():
+    """
+    :return: list of str, the files of the log rotated by the logger, log_hourstracker.txt.N, oldest first
+    """
+    rotated = []
+    for path in glob.glob(glob.escape(mhfx_path.user_log) + '.*'):
+        suffix = path[len(mhfx_path.user_log) + 1:]
+        if suffix.isdigit():
+            rotated.append((int(suffix), path))
+    return [path for _, path in sorted(rotated, reverse=True)]
+
+def remove_rotated_logs():
+    """
+    Remove the rotated files of the log, they belong to the archived week.
+    """
+    for path in get_rotated_logs():
+        try:
+            os.remove(path)
+        except OSError:
+            # being rotated by another DCC
+            pass
+
+def query_backups(start=None, end=None, projects=None, assets=None, departments=None, group_by=('project_name',), include_current=False):
+    """
+    Time spent over the archived weeks, read from the summary index of the backups.
+    For example the hours per department on a project over a quarter:
+    query_backups(date(2026, 7, 1), date(2026, 9, 30), projects='ProjA', group_by=('department',))
+
+    :param start: date, first day included, None for no limit
+    :param end: date, last day included, None for no limit
+    :param projects: str or list of str, None for all
+    :param assets: str or list of str, None for all
+    :param departments: str or list of str, None for all
+    :param group_by: tuple of str among year_week, date, project_name, asset_name, department
+    :param include_current: bool, also count the current week
+    :return: dict, {tuple of the group_by values: seconds}
+    """
+    try:
+        from monitor_utils.history import query
+        # in the process, may be called from a DCC, see backup_data
+        return query(start, end, projects, assets, departments, group_by, include_current, workers=1)
+    except ValueError:
+        raise
     except:
-        log(traceback.format_exc())
+        log.error(traceback.format_exc())
+        return {}
 
 def reset_user_data():
     """
     Resets the json, js, and txt files containing the user's data
     """
     try:
-        file_paths = [mhfx_path.user_data_json, mhfx_path.user_data_js, mhfx_path.user_log, mhfx_path.user_tmp_processes, mhfx_path.user_tmp_last_proc]
+        file_paths = [mhfx_path.user_data_json, mhfx_path.user_log, mhfx_path.user_tmp_last_proc]
 
         for file_path in file_paths:
             if os.path.exists(file_path):
@@ -111,8 +276,50 @@ def reset_user_data():
                     file.write("{}")
                 else:
                     file.write('')
+
+        remove_rotated_logs()
+
+        # the journal and the journals claimed by a compaction that didn't finish, their records would come back
+        # at the next compaction. Under the lock of the journal, no record is being appended.
+        # imported here, journal uses the functions of this module
+        from monitor_utils.journal import COMPACTING_EXT
+        with FileLock(mhfx_path.user_tmp_journal + '.lock'):
+            for file_path in glob.glob(f"{glob.escape(mhfx_path.user_tmp_journal)}.*{COMPACTING_EXT}"):
+                os.remove(file_path)
+            with open(mhfx_path.user_tmp_journal, 'w') as file:
+                file.write('')
+
+        # tracker data of the sqlite storage, imported here: sqlite_store reads the json with get_data
+        from monitor_utils.sqlite_store import SqliteStore, get_store
+        store = get_store()
+        if store != None:
+            store.clear()
+        elif os.path.exists(mhfx_path.user_data_db):
+            # the week of a previous use of the sqlite storage, it mustn't come back if the storage is switched again
+            store = SqliteStore(mhfx_path.user_data_db)
+            store.clear()
+            store.close()
+
+        # tracker data of the days storage
+        if os.path.exists(mhfx_path.user_week_dir):
+            shutil.rmtree(mhfx_path.user_week_dir, ignore_errors=True)
+
+        # report of the week
+        for file_path in glob.glob(os.path.join(glob.escape(mhfx_path.user_report_dir), '*.js')):
+            os.remove(file_path)
+
+        # metrics files of the closed DCCs
+        prune_metrics_files()
+
+        # processes files of the monitors and their lock files
+        for file_path in glob.glob(os.path.join(glob.escape(mhfx_path.user_tmp_processes_dir), '*.json*')):
+            try:
+                os.remove(file_path)
+            except OSError:
+                # lock file used by a running monitor
+                pass
     except:
-        log(traceback.format_exc())
+        log.error(traceback.format_exc())
 
 def create_backup_info(week, year, week_definition):
     '''
@@ -132,4 +339,4 @@ def create_backup_info(week, year, week_definition):
 
         return bkp
     except:
-        log(traceback.format_exc())
\ No newline at end of file
+        log.error(traceback.format_exc())
\ No newline at end of file
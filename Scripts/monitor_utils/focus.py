@@ -0,0 +1,112 @@
+'''
+For Menhir FX
+
+Exact focus intervals from the foreground-change notifications of the operating system.
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import traceback
+from threading import Event, Lock
+
+from monitor_utils.windows import get_current_window, watch_foreground
+from monitor_utils.mhfx_log import log
+from monitor_utils.clock import monotonic, wait_event
+
+
+class FocusTracker(object):
+    '''
+    class FocusTracker that records how long each pid had the foreground window.
+    The backend calls on_foreground when the foreground window changes, from any thread.
+    drain() returns the whole seconds spent per pid since the last drain,
+    the fractions of seconds are kept for the next drain.
+    '''
+    def __init__(self, clock=monotonic):
+        self.clock = clock
+        self.lock = Lock()
+        self.wake = Event()
+        self.current_pid = None
+        self.since = None
+        self.seconds = {}
+        self.rests = {}
+        self.stop_watch = None
+
+    def start(self):
+        '''
+        Start to listen to the foreground changes.
+        '''
+        window = get_current_window() or {}
+        with self.lock:
+            self.current_pid = window.get('pid')
+            self.since = self.clock()
+        self.stop_watch = watch_foreground(self.on_foreground)
+
+    def stop(self):
+        '''
+        Stop to listen to the foreground changes.
+        '''
+        try:
+            if self.stop_watch != None:
+                self.stop_watch()
+                self.stop_watch = None
+        except:
+            log.error(traceback.format_exc())
+        self.wake.set()
+
+    def _close_interval(self, end: float):
+        if self.current_pid != None and end > self.since:
+            self.seconds[self.current_pid] = self.seconds.get(self.current_pid, 0.0) + end - self.since
+        self.since = max(end, self.since)
+
+    def on_foreground(self, pid):
+        '''
+        Called by the backend when the foreground window changes.
+
+        :param pid: int or None, pid of the new foreground window
+        '''
+        with self.lock:
+            if pid == self.current_pid:
+                return
+            self._close_interval(self.clock())
+            self.current_pid = pid
+        log.debug(f"Foreground changed to process {pid}")
+        self.wake.set()
+
+    def wait(self, timeout: float):
+        '''
+        Sleep until the foreground changes or timeout seconds.
+
+        :param timeout: float
+        :return: bool, True if woken by a foreground change
+        '''
+        woken = wait_event(self.wake, timeout)
+        self.wake.clear()
+        return woken
+
+    def drain(self, idle_seconds: float = 0):
+        '''
+        Return the time spent per pid since the last drain.
+        The last idle_seconds aren't given to the current pid: the user wasn't there.
+
+        :param idle_seconds: float, seconds since the last user input if the user is afk, else 0
+        :return: dict pid (int) -> whole seconds (int)
+        '''
+        with self.lock:
+            now = self.clock()
+            self._close_interval(now - idle_seconds)
+            self.since = now
+
+            drained = {}
+            for pid, seconds in self.seconds.items():
+                seconds += self.rests.get(pid, 0.0)
+                drained[pid] = int(seconds)
+                self.rests[pid] = seconds - drained[pid]
+            self.seconds = {}
+            return drained
+
+    def discard(self):
+        '''
+        Forget the time spent since the last drain, when the user was afk.
+        '''
+        with self.lock:
+            self.since = self.clock()
+            self.seconds = {}
@@ -0,0 +1,266 @@
+'''
+For Menhir FX
+
+Queries over the archived weeks, answered from a summary index instead of the weekly data.
+
+backup/summary.json     for each archived week: its first and last day, the projects, assets and departments
+                        worked on, and one row per day and project session:
+                        [date, project_name, asset_name, department, seconds]
+
+A query skips the weeks out of its date range or without the asked project, asset or department
+before reading their rows. The index follows the archive: a week archived or archived again
+is summarized alone, from its member of the archive (see HistoryIndex.sync).
+
+from monitor_utils.history import query
+query(start=date(2026, 7, 1), end=date(2026, 9, 30), projects='ProjA', group_by=('department',))
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import os
+import json
+import traceback
+from datetime import date as Date
+from concurrent.futures import ProcessPoolExecutor
+
+from monitor_utils.config import mhfx_path
+from monitor_utils.backup import archive as backup_archive
+from monitor_utils.data_management import get_week_data
+from monitor_utils.file import FileLock, get_data, write_to_file
+from monitor_utils.mhfx_log import log
+from monitor_utils.tracker_data import TrackerData
+
+INDEX_VERSION = 1
+PARALLEL_MIN_WEEKS = 8 # fewer weeks to summarize are done in the process, a pool costs more to start
+GROUP_COLUMNS = ('year_week', 'date', 'project_name', 'asset_name', 'department')
+FILTER_FIELDS = {'project_name': 'projects', 'asset_name': 'assets', 'department': 'departments'}
+
+
+def summarize_week(data: dict, hours_digest: str = None):
+    '''
+    :param data: dict, tracker data of a week
+    :param hours_digest: str, digest of the archived data, to know when the summary is outdated
+    :return: dict, summary of the week
+    '''
+    tracker = TrackerData(data)
+    rows = [[date, project_name, asset_name, department, ps.seconds]
+            for (date, project_name, asset_name, department), ps in tracker.project_sessions.items()]
+    dates = [day.date for day in tracker.days]
+    return {
+        'week': str(data.get('week')),
+        'year': str(data.get('year')),
+        'hours_digest': hours_digest,
+        'first': min(dates) if dates else None,
+        'last': max(dates) if dates else None,
+        'total_seconds': tracker.get_week_total(),
+        'projects': sorted({row[1] for row in rows}),
+        'assets': sorted({row[2] for row in rows}),
+        'departments': sorted({row[3] for row in rows}),
+        'rows': rows,
+    }
+
+def summarize_archived_week(week, year, hours_digest: str):
+    '''
+    Summarize a week from its member of the archive, in a worker process of HistoryIndex.sync.
+
+    :return: dict, summary of the week
+    '''
+    return summarize_week(backup_archive.get_hours(week, year), hours_digest)
+
+def as_set(values):
+    '''
+    :param values: None, str or iterable of str
+    :return: set or None
+    '''
+    if values == None:
+        return None
+    if isinstance(values, str):
+        return {values}
+    return set(values)
+
+def as_ordinal(day):
+    '''
+    :param day: None, int day number, date or datetime
+    :return: int or None
+    '''
+    if day == None or isinstance(day, int):
+        return day
+    return day.toordinal()
+
+
+class HistoryIndex(object):
+    '''
+    class HistoryIndex, the summary index of the archived weeks.
+    The file is read again only when it changed since the last read.
+    '''
+    def __init__(self, path: str, archive):
+        self.path = path
+        self.archive = archive
+        self.lock_path = path + '.lock'
+        self.cache = None
+        self.cache_signature = None
+
+    def signature(self):
+        try:
+            stat = os.stat(self.path)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    def load(self):
+        '''
+        :return: dict, {"version": int, "weeks": {"<year>_<week>": summary}}
+        '''
+        signature = self.signature()
+        if signature == None:
+            return {'version': INDEX_VERSION, 'weeks': {}}
+        if signature != self.cache_signature:
+            index = get_data(self.path)
+            index.setdefault('weeks', {})
+            self.cache = index
+            self.cache_signature = signature
+        return self.cache
+
+    @staticmethod
+    def key(week, year):
+        return f"{int(year)}_{int(week):02d}"
+
+    def sync(self, workers: int = None):
+        '''
+        Summarize the archived weeks missing from the index or archived again since their summary.
+        Many weeks (a first sync after a migration) are decompressed and summarized in a process pool,
+        except with workers 1: in a DCC, the workers would be instances of the DCC.
+
+        :param workers: int, processes of the pool, None for the number of CPUs, 1 for no pool
+        :return: int, number of weeks summarized
+        '''
+        entries = self.archive.entries()
+        index = self.load()
+        outdated = [
+            e for e in entries
+            if index.get('weeks').get(self.key(e.get('week'), e.get('year')), {}).get('hours_digest') != e.get('hours_digest')
+        ]
+        if not outdated:
+            return 0
+
+        with FileLock(self.lock_path):
+            # another process may have written the index since it was read
+            self.cache_signature = None
+            index = self.load()
+            weeks = dict(index.get('weeks'))
+            outdated = [
+                e for e in outdated
+                if weeks.get(self.key(e.get('week'), e.get('year')), {}).get('hours_digest') != e.get('hours_digest')
+            ]
+            count = 0
+            for entry, summary in self.summarize_entries(outdated, workers):
+                if summary != None:
+                    weeks[self.key(entry.get('week'), entry.get('year'))] = summary
+                    count += 1
+            # weeks no longer in the archive
+            archived = {self.key(e.get('week'), e.get('year')) for e in entries}
+            weeks = {key: summary for key, summary in weeks.items() if key in archived}
+            write_to_file(json.dumps({'version': INDEX_VERSION, 'weeks': weeks}, separators=(',', ':')), self.path)
+        log.debug(f"History index: {count} weeks summarized.")
+        return count
+
+    def summarize_entries(self, entries: list, workers: int = None):
+        '''
+        :param entries: list of dict, index entries of the archive
+        :param workers: int, see sync
+        :return: list of tuple (entry, summary), summary None if the week couldn't be read
+        '''
+        results = []
+        if len(entries) >= PARALLEL_MIN_WEEKS and workers != 1 and self.archive is backup_archive:
+            try:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    futures = [(e, pool.submit(summarize_archived_week, e.get('week'), e.get('year'), e.get('hours_digest'))) for e in entries]
+                    for entry, future in futures:
+                        try:
+                            results.append((entry, future.result()))
+                        except:
+                            log.error(traceback.format_exc())
+                            results.append((entry, None))
+                return results
+            except OSError:
+                # no process pool on this machine, summarize in the process
+                log.error(traceback.format_exc())
+                results = []
+
+        for entry in entries:
+            try:
+                data = self.archive.get_hours(entry.get('week'), entry.get('year'))
+                results.append((entry, summarize_week(data, entry.get('hours_digest'))))
+            except:
+                log.error(traceback.format_exc())
+                results.append((entry, None))
+        return results
+
+    @staticmethod
+    def matches(summary: dict, start: int, end: int, filters: dict):
+        '''
+        :return: bool, False if the week has no row for the query
+        '''
+        if summary.get('first') == None:
+            return False
+        if start != None and summary.get('last') < start:
+            return False
+        if end != None and summary.get('first') > end:
+            return False
+        for field, values in filters.items():
+            if values != None and values.isdisjoint(summary.get(FILTER_FIELDS[field])):
+                return False
+        return True
+
+    def query(self, start=None, end=None, projects=None, assets=None, departments=None,
+              group_by: tuple = ('project_name',), include_current: bool = False, workers: int = None):
+        '''
+        Time spent in the archived weeks, grouped.
+
+        :param start: date or int day number, first day included, None for no limit
+        :param end: date or int day number, last day included, None for no limit
+        :param projects: str or list of str, None for all
+        :param assets: str or list of str, None for all
+        :param departments: str or list of str, None for all
+        :param group_by: tuple of str among year_week, date, project_name, asset_name, department
+        :param include_current: bool, also count the current week
+        :param workers: int, processes to summarize the weeks missing from the index, see sync
+        :return: dict, {tuple of the group_by values: seconds}
+        '''
+        for column in group_by:
+            if column not in GROUP_COLUMNS:
+                raise ValueError(f"group by {column}, columns must be among {GROUP_COLUMNS}")
+        start = as_ordinal(start)
+        end = as_ordinal(end)
+        filters = {'project_name': as_set(projects), 'asset_name': as_set(assets), 'department': as_set(departments)}
+
+        self.sync(workers)
+        summaries = list(self.load().get('weeks').values())
+        if include_current:
+            current = get_week_data()
+            if current.get('days'):
+                summaries.append(summarize_week(current))
+
+        totals = {}
+        for summary in summaries:
+            if not self.matches(summary, start, end, filters):
+                continue
+            year_week = self.key(summary.get('week'), summary.get('year'))
+            for date, project_name, asset_name, department, seconds in summary.get('rows'):
+                if (start != None and date < start) or (end != None and date > end):
+                    continue
+                row = {'year_week': year_week, 'date': date, 'project_name': project_name, 'asset_name': asset_name, 'department': department}
+                if any(values != None and row[field] not in values for field, values in filters.items()):
+                    continue
+                key = tuple(Date.fromordinal(date).isoformat() if column == 'date' else row[column] for column in group_by)
+                totals[key] = totals.get(key, 0) + seconds
+        return totals
+
+
+history_index = HistoryIndex(mhfx_path.user_backup_summary, backup_archive)
+
+def query(start=None, end=None, projects=None, assets=None, departments=None, group_by: tuple = ('project_name',),
+          include_current: bool = False, workers: int = None):
+    '''
+    Time spent in the archived weeks, see HistoryIndex.query.
+    '''
+    return history_index.query(start, end, projects, assets, departments, group_by, include_current, workers)
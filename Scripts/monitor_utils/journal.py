@@ -0,0 +1,133 @@
+'''
+For Menhir FX
+
+Append-only journal of the session times.
+Each save cycle appends one small record per session to the journal instead of rewriting hours.json.
+The journal is periodically compacted into hours.json.
+The monitors of all the DCCs append to the same journal, under its lock file (journal.jsonl.lock):
+appends of concurrent processes can interleave on a network share.
+
+A record holds the total time of the session (not a delta) at a given moment,
+keyed by pid, entity and start time. Replaying a record twice gives the same result,
+so a crash between writing hours.json and clearing the journal loses nothing.
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import os
+import glob
+import json
+import uuid
+import traceback
+
+from monitor_utils.config import mhfx_path
+from monitor_utils.data_management import apply_records
+from monitor_utils.file import FileLock
+from monitor_utils.mhfx_log import log
+import monitor_utils.clock as clock
+
+COMPACTING_EXT = '.compacting'
+
+
+def create_record(pid, entity: dict, infos: dict):
+    '''
+    Create a journal record of a process.
+
+    :param pid: str or int
+    :param entity: dict, entity of the process filename
+    :param infos: dict, process infos from the processes files
+    :return: dict
+    '''
+    return {
+        'ts': round(clock.time(), 3),
+        'pid': str(pid),
+        'entity': {
+            'project_name': entity.get('project_name'),
+            'asset_name': entity.get('asset_name'),
+            'department': entity.get('department')
+        },
+        'first': infos.get('first'),
+        'time': infos.get('time')
+    }
+
+def append_records(records: list, path=mhfx_path.user_tmp_journal):
+    '''
+    Append records at the end of the journal, one json object per line.
+
+    :param records: list of dict
+    :param path: string
+    '''
+    if len(records) <= 0:
+        return
+    try:
+        content = ''.join(json.dumps(r, separators=(',', ':')) + '\n' for r in records)
+        with FileLock(path + '.lock'):
+            with open(path, 'a') as journal_file:
+                journal_file.write(content)
+        log.debug(f"{len(records)} records appended to journal.")
+    except:
+        log.error(traceback.format_exc())
+
+def read_records(path):
+    '''
+    Read all the valid records of a journal file.
+    A line torn by a crash during the write is ignored.
+
+    :param path: string
+    :return: list of dict
+    '''
+    records = []
+    try:
+        with open(path, 'r') as journal_file:
+            for line in journal_file:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    log(f"Ignore torn record in journal {path}: {line}")
+    except FileNotFoundError:
+        pass
+    except:
+        log.error(traceback.format_exc())
+    return records
+
+def claim_journal(path=mhfx_path.user_tmp_journal):
+    '''
+    Rename the journal so the records appended from now on go to a new journal.
+    Also return the journals claimed by a compaction that didn't finish.
+
+    :param path: string
+    :return: list of string, claimed journal paths, oldest first
+    '''
+    if os.path.exists(path):
+        try:
+            # no append in progress: a record appended to the claimed journal after it's read would be lost
+            with FileLock(path + '.lock'):
+                os.replace(path, f"{path}.{uuid.uuid4().hex}{COMPACTING_EXT}")
+        except OSError:
+            # the journal is being written by another monitor, compact it next time
+            log.debug(f"Journal {path} busy, not claimed.")
+    claimed = glob.glob(f"{glob.escape(path)}.*{COMPACTING_EXT}")
+    return sorted(claimed, key=os.path.getmtime)
+
+def compact(path=mhfx_path.user_tmp_journal):
+    '''
+    Write all the journal records to the tracker data and clear the journal.
+    The journal is kept if the tracker data can't be written.
+
+    :param path: string
+    '''
+    try:
+        # one compaction at a time, hours.json is read, modified and written
+        with FileLock(mhfx_path.user_data_json + '.lock'):
+            claimed = claim_journal(path)
+            records = []
+            for claimed_path in claimed:
+                records.extend(read_records(claimed_path))
+
+            if len(records) > 0 and not apply_records(records):
+                return
+
+            for claimed_path in claimed:
+                os.remove(claimed_path)
+        log.debug(f"Journal compacted: {len(records)} records from {len(claimed)} files.")
+    except:
+        log.error(traceback.format_exc())
@@ -0,0 +1,261 @@
+'''
+For Menhir FX
+
+Timers, counters and histograms of the monitor hot paths,
+written to a metrics file in the Prometheus text exposition format.
+
+Disabled by default ([Metrics] enabled in config.ini): a disabled timer is a shared no-op object
+and a disabled counter returns at the first line, so the instrumentation can stay in the hot paths.
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import os
+import atexit
+import socket
+import traceback
+from bisect import bisect_left
+from functools import wraps
+from threading import Lock
+from time import perf_counter
+
+from monitor_utils.config import mhfx_path
+from monitor_utils.backends import get_backend
+from monitor_utils.mhfx_log import log
+import monitor_utils.config.monitor as monitor
+import monitor_utils.clock as clock
+
+PREFIX = 'hourstracker_'
+# seconds, from a cached call to a network drive hiccup
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class NullTimer(object):
+    '''
+    class NullTimer, the timer of disabled metrics.
+    '''
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+NULL_TIMER = NullTimer()
+
+
+class Timer(object):
+    '''
+    class Timer, a with block measured in a summary or a histogram.
+    '''
+    __slots__ = ('metrics', 'name', 'labels', 'histogram', 'start')
+
+    def __init__(self, metrics, name: str, labels: tuple, histogram: bool):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.histogram = histogram
+        self.start = None
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        elapsed = perf_counter() - self.start
+        if self.histogram:
+            self.metrics._observe(self.name, self.labels, elapsed)
+        else:
+            self.metrics._summary(self.name, self.labels, elapsed)
+        return False
+
+
+class Metrics(object):
+    '''
+    class Metrics, the registry of the process.
+    Metric names are given without the hourstracker_ prefix, labels as keyword arguments:
+
+    metrics.inc('written_bytes_total', 120, file='hours.json')
+    with metrics.timer('stage_seconds', stage='get_current_window'):
+        ...
+    @metrics.timed('add_process_seconds', histogram=True)
+    '''
+    def __init__(self, enabled: bool = False, buckets: tuple = DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self.lock = Lock()
+        self.start_time = clock.time()
+        self.counters = {}
+        self.summaries = {}
+        self.histograms = {}
+
+    @staticmethod
+    def _labels(labels: dict):
+        return tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        '''
+        Add value to a counter.
+        '''
+        if not self.enabled:
+            return
+        key = (name, self._labels(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def timer(self, name: str, histogram: bool = False, **labels):
+        '''
+        :param name: str
+        :param histogram: bool, True for a latency histogram, else a summary (count and sum)
+        :return: context manager measuring its with block
+        '''
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self, name, self._labels(labels), histogram)
+
+    def observe(self, name: str, value: float, **labels):
+        '''
+        Add a value to a histogram.
+        '''
+        if self.enabled:
+            self._observe(name, self._labels(labels), value)
+
+    def timed(self, name: str, histogram: bool = False, **labels):
+        '''
+        Decorator measuring each call of the function.
+        '''
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with Timer(self, name, self._labels(labels), histogram):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _summary(self, name: str, labels: tuple, value: float):
+        key = (name, labels)
+        with self.lock:
+            count, total = self.summaries.get(key, (0, 0.0))
+            self.summaries[key] = (count + 1, total + value)
+
+    def _observe(self, name: str, labels: tuple, value: float):
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram == None:
+                # one count per bucket, the last one is +Inf, then the sum
+                histogram = [[0] * (len(self.buckets) + 1), 0.0]
+                self.histograms[key] = histogram
+            histogram[0][bisect_left(self.buckets, value)] += 1
+            histogram[1] += value
+
+    @staticmethod
+    def _format_labels(labels, extra: tuple = ()):
+        labels = tuple(labels) + extra
+        if not labels:
+            return ''
+        values = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels)
+        return '{' + values + '}'
+
+    def exposition(self):
+        '''
+        :return: str, the metrics in the Prometheus text exposition format
+        '''
+        with self.lock:
+            counters = dict(self.counters)
+            summaries = dict(self.summaries)
+            histograms = {key: ([c for c in h[0]], h[1]) for key, h in self.histograms.items()}
+
+        lines = [
+            f'# TYPE {PREFIX}info gauge',
+            f'{PREFIX}info{self._format_labels((("host", socket.gethostname()), ("pid", os.getpid())))} 1',
+            f'# TYPE {PREFIX}start_time_seconds gauge',
+            f'{PREFIX}start_time_seconds {self.start_time:.3f}',
+        ]
+
+        def grouped(metrics: dict):
+            names = {}
+            for (name, labels), value in sorted(metrics.items()):
+                names.setdefault(name, []).append((labels, value))
+            return names.items()
+
+        for name, series in grouped(counters):
+            lines.append(f'# TYPE {PREFIX}{name} counter')
+            for labels, value in series:
+                lines.append(f'{PREFIX}{name}{self._format_labels(labels)} {value}')
+
+        for name, series in grouped(summaries):
+            lines.append(f'# TYPE {PREFIX}{name} summary')
+            for labels, (count, total) in series:
+                lines.append(f'{PREFIX}{name}_sum{self._format_labels(labels)} {total:.6f}')
+                lines.append(f'{PREFIX}{name}_count{self._format_labels(labels)} {count}')
+
+        for name, series in grouped(histograms):
+            lines.append(f'# TYPE {PREFIX}{name} histogram')
+            for labels, (counts, total) in series:
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += count
+                    lines.append(f'{PREFIX}{name}_bucket{self._format_labels(labels, (("le", bound),))} {cumulative}')
+                lines.append(f'{PREFIX}{name}_sum{self._format_labels(labels)} {total:.6f}')
+                lines.append(f'{PREFIX}{name}_count{self._format_labels(labels)} {cumulative}')
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str = None):
+        '''
+        Write the metrics file, by default <user_data_dir>/metrics/<pid>.prom.
+
+        :param path: str
+        :return: bool
+        '''
+        if not self.enabled:
+            return False
+        # imported here, file.py counts the bytes it writes in the metrics
+        from monitor_utils.file import write_to_file
+        try:
+            if path == None:
+                os.makedirs(mhfx_path.user_metrics_dir, exist_ok=True)
+                path = get_metrics_path(os.getpid())
+            return write_to_file(self.exposition(), path)
+        except:
+            log.error(traceback.format_exc())
+            return False
+
+
+def get_metrics_path(pid: int):
+    '''
+    :return: str, path of the metrics file of a process
+    '''
+    return os.path.join(mhfx_path.user_metrics_dir, f'{pid}.prom')
+
+def remove_metrics_file():
+    '''
+    Remove the metrics file of this process when it exits, its pid will be given to another process.
+    '''
+    try:
+        path = get_metrics_path(os.getpid())
+        if os.path.exists(path):
+            os.remove(path)
+    except OSError:
+        log.error(traceback.format_exc())
+
+def prune_metrics_files():
+    '''
+    Remove the metrics files of the processes that no longer run, a DCC killed doesn't remove its file.
+    '''
+    try:
+        if not os.path.isdir(mhfx_path.user_metrics_dir):
+            return
+        running = set(get_backend().list_processes())
+        for name in os.listdir(mhfx_path.user_metrics_dir):
+            pid, ext = os.path.splitext(name)
+            if ext == '.prom' and pid.isdigit() and int(pid) not in running:
+                os.remove(os.path.join(mhfx_path.user_metrics_dir, name))
+    except:
+        log.error(traceback.format_exc())
+
+
+metrics = Metrics(enabled=monitor.metrics_enabled)
+if metrics.enabled:
+    atexit.register(remove_metrics_file)
@@ -3,22 +3,163 @@ authors:
 Elise Vidal - evidal@artfx.fr
 Angele Sionneau - asionneau@artfx.fr
 '''
+import os
 import json
+import queue
+import atexit
+import time
 from datetime import datetime
+from threading import Thread, Event, Lock
+
 from monitor_utils.config.mhfx_path import user_log
+import monitor_utils.config.monitor as monitor
+import monitor_utils.clock as clock
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVEL_NAMES = {DEBUG: 'DEBUG', INFO: 'INFO', WARNING: 'WARNING', ERROR: 'ERROR'}
 
-def log(error_message):
+def get_level(name: str):
+    '''
+    :param name: str, DEBUG, INFO, WARNING or ERROR
+    :return: int, INFO if the name is unknown
     '''
-    Write error message to log file
+    for level, level_name in LEVEL_NAMES.items():
+        if level_name == str(name).upper():
+            return level
+    return INFO
 
-    :param error_message: str or dict
+
+class Logger(object):
     '''
-    date = datetime.now().strftime('%d/%m/%y')
-    time = datetime.now().strftime('%H:%M:%S')
+    class Logger that writes the log file from a background thread.
+
+    A call only checks the level and puts the message in a queue, it never waits for the disk:
+    the log file is on the network drive. The writer thread formats the messages
+    and appends them in one write every flush_sec. The file is rotated when it reaches max_bytes,
+    backup_count old files are kept (log_hourstracker.txt.1, .2, ...).
+
+    log("message") logs at INFO, log.debug / log.info / log.warning / log.error at their level.
+    '''
+    def __init__(self, path: str, level: int = INFO, max_bytes: int = 1024 * 1024, backup_count: int = 3, flush_sec: float = 1.0):
+        self.path = path
+        self.level = level
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_sec = flush_sec
+        self.queue = queue.SimpleQueue()
+        self.thread = None
+        self.thread_pid = None
+        self.start_lock = Lock()
+
+    def __call__(self, message, level: int = INFO):
+        if level >= self.level:
+            self.queue.put((clock.time(), level, message))
+            if self.thread_pid != os.getpid():
+                self._start_writer()
+
+    def debug(self, message):
+        self(message, DEBUG)
+
+    def info(self, message):
+        self(message, INFO)
+
+    def warning(self, message):
+        self(message, WARNING)
+
+    def error(self, message):
+        self(message, ERROR)
+
+    def is_enabled_for(self, level: int):
+        return level >= self.level
+
+    def _start_writer(self):
+        with self.start_lock:
+            # a forked process doesn't have the writer thread of its parent
+            if self.thread_pid != os.getpid():
+                self.thread = Thread(target=self._run, name='HoursTrackerLog', daemon=True)
+                self.thread_pid = os.getpid()
+                self.thread.start()
+
+    def flush(self, timeout: float = 5.0):
+        '''
+        Wait until the messages logged before the call are written.
+
+        :param timeout: float
+        :return: bool, False if the writer didn't finish in time
+        '''
+        if self.thread_pid != os.getpid():
+            return True
+        done = Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            # gather the messages of the next flush_sec in the same write
+            deadline = time.monotonic() + self.flush_sec
+            while not isinstance(batch[-1], Event):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            records = [item for item in batch if not isinstance(item, Event)]
+            if records:
+                self._write(records)
+            for item in batch:
+                if isinstance(item, Event):
+                    item.set()
+
+    @staticmethod
+    def format(record: tuple):
+        timestamp, level, message = record
+        if isinstance(message, dict):
+            message = json.dumps(message, indent=4)
+        date = datetime.fromtimestamp(timestamp)
+        return f"\n{date.strftime('%d/%m/%y, %H:%M:%S')} [{LEVEL_NAMES.get(level, level)}] : {message}"
+
+    def _write(self, records: list):
+        try:
+            content = ''.join(self.format(record) for record in records)
+            self._rotate(len(content.encode('utf-8')))
+            with open(self.path, 'a', encoding='utf-8', errors='replace') as logfile:
+                logfile.write(content)
+        except Exception:
+            # nowhere to log the error, the messages are lost
+            pass
+
+    def _rotate(self, incoming: int):
+        try:
+            if os.path.getsize(self.path) + incoming <= self.max_bytes:
+                return
+        except OSError:
+            return
+        try:
+            if self.backup_count <= 0:
+                open(self.path, 'w').close()
+                return
+            for i in range(self.backup_count - 1, 0, -1):
+                src = f"{self.path}.{i}"
+                if os.path.exists(src):
+                    os.replace(src, f"{self.path}.{i + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        except OSError:
+            # another DCC rotated or uses the file, try again at the next write
+            pass
 
-    if isinstance(error_message, dict):
-        error_message = json.dumps(error_message, indent=4)
 
-    log_message = '\n' + date + ", " + time + " : " + error_message
-    with open(user_log, 'a') as logfile:
-        logfile.write(log_message)
+log = Logger(
+    user_log,
+    level=DEBUG if monitor.debug_mode else get_level(monitor.log_level),
+    max_bytes=monitor.log_max_bytes,
+    backup_count=monitor.log_backup_count,
+    flush_sec=monitor.log_flush_sec
+)
+atexit.register(log.flush)
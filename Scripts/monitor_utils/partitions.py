@@ -0,0 +1,165 @@
+'''
+For Menhir FX
+
+Tracker data of the week partitioned by day, chosen with [Data] storage = days in config.ini.
+
+week/header.json        the week information: user_id, year, week, week_description
+week/day_261012.json    one day of the hours.json schema: {"date": "12/10/26", "projects": [...], ...}
+
+A compaction of the journal reads and writes the partitions of the days of its records only,
+usually today. The week in the hours.json schema (get_week_data) is merged from the partitions
+when it's needed: backups, reports, new week and new day checks.
+hours.json isn't written with this storage.
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import os
+import re
+import glob
+import json
+import shutil
+import traceback
+
+from monitor_utils.config import mhfx_path
+from monitor_utils.file import get_data, write_to_file
+from monitor_utils.mhfx_log import log
+from monitor_utils.tracker_data import TrackerData
+import monitor_utils.config.monitor as monitor
+
+HEADER_FILE = 'header.json'
+HEADER_KEYS = ('user_id', 'year', 'week', 'week_description')
+DAY_FILE = re.compile(r'^day_(\d\d)(\d\d)(\d\d)\.json$')
+
+
+class DayPartitions(object):
+    '''
+    class DayPartitions, the week in a folder: a header file and one file per day.
+    The header is written only when it changed. Writes are done under the lock of the compaction.
+    '''
+    def __init__(self, week_dir: str):
+        self.week_dir = week_dir
+        self.header_path = os.path.join(week_dir, HEADER_FILE)
+
+    @staticmethod
+    def day_filename(date: str):
+        '''
+        :param date: str, '%d/%m/%y'
+        :return: str, day_yymmdd.json
+        '''
+        day, month, year = date.split('/')
+        return f"day_{year}{month}{day}.json"
+
+    def exists(self):
+        return os.path.exists(self.header_path)
+
+    def read_header(self):
+        '''
+        :return: dict, the week information, empty if there is no week
+        '''
+        # small, read again each time: another monitor may have started a new week
+        return get_data(self.header_path) if self.exists() else {}
+
+    def write_header(self, header: dict):
+        '''
+        :param header: dict, the week information, other keys are ignored
+        :return: bool, False if the header couldn't be written
+        '''
+        header = {key: header.get(key) for key in HEADER_KEYS if key in header}
+        if header == self.read_header():
+            return True
+        os.makedirs(self.week_dir, exist_ok=True)
+        return write_to_file(json.dumps(header, separators=(',', ':')), self.header_path)
+
+    def list_dates(self):
+        '''
+        :return: list of str, the dates '%d/%m/%y' of the days of the week, oldest first
+        '''
+        dates = []
+        for path in sorted(glob.glob(os.path.join(glob.escape(self.week_dir), 'day_*.json'))):
+            match = DAY_FILE.match(os.path.basename(path))
+            if match != None:
+                year, month, day = match.groups()
+                dates.append(f"{day}/{month}/{year}")
+        return dates
+
+    def read_day(self, date: str):
+        '''
+        :param date: str, '%d/%m/%y'
+        :return: dict, the day in the hours.json schema, None if the week has no such day
+        '''
+        path = os.path.join(self.week_dir, self.day_filename(date))
+        if not os.path.exists(path):
+            return None
+        return get_data(path)
+
+    def write_day(self, day: dict):
+        '''
+        :param day: dict, the day in the hours.json schema
+        :return: str, the day serialized, None if it couldn't be written
+        '''
+        content = json.dumps(day, separators=(',', ':'))
+        os.makedirs(self.week_dir, exist_ok=True)
+        if not write_to_file(content, os.path.join(self.week_dir, self.day_filename(day.get('date')))):
+            return None
+        return content
+
+    def as_dict(self, sessions: bool = True):
+        '''
+        The week merged from the partitions.
+
+        :param sessions: bool, False for the dates of the days only, without reading their files
+        :return: dict, the data in the hours.json schema, empty if there is no week
+        '''
+        header = self.read_header()
+        if not header:
+            return {}
+        if not sessions:
+            data = {'days': [{'date': date} for date in self.list_dates()]}
+            data.update(header)
+            return data
+        data = {'days': [day for day in (self.read_day(date) for date in self.list_dates()) if day]}
+        data.update(header)
+        # the totals of the week are computed from the days
+        return TrackerData(data).as_dict()
+
+    def import_data(self, data: dict):
+        '''
+        Write the partitions of a hours.json dict.
+
+        :param data: dict
+        :return: bool, False if a file couldn't be written
+        '''
+        written = True
+        for day in TrackerData(data).as_dict().get('days', []):
+            written = self.write_day(day) != None and written
+        return self.write_header(data) and written
+
+    def clear(self):
+        '''
+        Remove the week.
+        '''
+        if os.path.exists(self.week_dir):
+            shutil.rmtree(self.week_dir, ignore_errors=True)
+
+
+_partitions = None
+
+def get_partitions():
+    '''
+    :return: DayPartitions of the user, None if the storage isn't days
+    '''
+    global _partitions
+    if monitor.storage != 'days':
+        return None
+    if _partitions == None:
+        partitions = DayPartitions(mhfx_path.user_week_dir)
+        try:
+            if not partitions.exists() and os.path.exists(mhfx_path.user_data_json):
+                # first use of the days storage, start from the json data
+                data = get_data(mhfx_path.user_data_json)
+                if data.get('days'):
+                    partitions.import_data(data)
+        except:
+            log.error(traceback.format_exc())
+        _partitions = partitions
+    return _partitions
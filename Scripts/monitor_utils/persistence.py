@@ -0,0 +1,227 @@
+'''
+For Menhir FX
+
+Persistence of the tracker data file hours.json and of the report read by hours.html.
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import os
+import json
+import hashlib
+import traceback
+
+from monitor_utils.file import write_to_file
+from monitor_utils.mhfx_log import log
+
+MANIFEST_FILE = 'manifest.js'
+MANIFEST_PREFIX = 'var hoursReport = '
+MANIFEST_SUFFIX = ';\n'
+
+
+class DataStore(object):
+    '''
+    class DataStore that writes the tracker data to its json file and to the report read by hours.html.
+    The data is serialized once, both are derived from that serialization
+    and they are only rewritten when the data changed since the last flush,
+    or when the json file was modified by someone else.
+
+    The report is split: a small manifest (week infos, list of days) and one file per day,
+    so a save of today only rewrites the manifest and the file of today.
+    Both are javascript object literals, loaded by hours.html with script tags:
+
+    report/manifest.js      var hoursReport = {"manifest": {..., "days": [{"date", "file", "digest"}]}, "days": {}};
+    report/day_261012.js    hoursReport.days["12/10/26"] = {"date": "12/10/26", "projects": [...]};
+    '''
+    def __init__(self, json_path: str, report_dir: str, pretty: bool = False):
+        self.json_path = json_path
+        self.report_dir = report_dir
+        self.manifest_path = os.path.join(report_dir, MANIFEST_FILE)
+        self.pretty = pretty
+        self.last_digest = None
+        self.last_signature = None
+        # digest of each day file of the report, by date
+        self.day_digests = {}
+
+    @staticmethod
+    def serialize(data: dict):
+        '''
+        :param data: dict
+        :return: string, compact json
+        '''
+        return json.dumps(data, separators=(',', ':'))
+
+    @staticmethod
+    def content_digest(content: str):
+        return hashlib.blake2b(content.encode('utf-8'), digest_size=16).digest()
+
+    @staticmethod
+    def day_filename(date: str):
+        '''
+        :param date: str, '%d/%m/%y'
+        :return: str, day_yymmdd.js
+        '''
+        day, month, year = date.split('/')
+        return f"day_{year}{month}{day}.js"
+
+    def file_signature(self):
+        '''
+        :return: tuple (mtime, size) of the json file or None if it doesn't exist
+        '''
+        try:
+            stat = os.stat(self.json_path)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    def flush(self, data: dict):
+        '''
+        Write the data to the json file and the report if it changed since the last flush.
+
+        :param data: dict, tracker data
+        :return: bool, False if a file couldn't be written
+        '''
+        try:
+            days = data.get('days', [])
+            header = {key: value for key, value in data.items() if key != 'days'}
+            day_contents = [self.serialize(day) for day in days]
+            header_content = self.serialize(header)
+            # same text as serialize(data), the days are serialized once for the json and the report
+            content = '{"days":[' + ','.join(day_contents) + ']' + (',' + header_content[1:] if header else '}')
+            digest = self.content_digest(content)
+            signature = self.file_signature()
+            if digest == self.last_digest and signature == self.last_signature:
+                log.debug("Tracker data unchanged, nothing to write.")
+                return True
+
+            if signature != self.last_signature:
+                # another process wrote the files, its manifest tells which days are up to date
+                self.day_digests = self.read_manifest_digests()
+
+            # pretty json is the only case that needs a second serialization
+            json_content = json.dumps(data, indent=4) if self.pretty else content
+
+            written = self.write_report(header, days, day_contents)
+            written = write_to_file(json_content, self.json_path) and written
+            if written:
+                self.last_digest = digest
+                self.last_signature = self.file_signature()
+            return written
+        except:
+            log.error(traceback.format_exc())
+            return False
+
+    def write_report(self, header: dict, days: list, day_contents: list):
+        '''
+        Write the files of the days that changed and the manifest, remove the files of the days that are gone.
+
+        :param header: dict, tracker data without the days
+        :param days: list of dict
+        :param day_contents: list of str, the days serialized
+        :return: bool, False if a file couldn't be written
+        '''
+        os.makedirs(self.report_dir, exist_ok=True)
+        written = True
+        digests = {}
+        entries = []
+        for day, day_content in zip(days, day_contents):
+            date = day.get('date')
+            digest = self.write_day_report(date, day_content)
+            # written again at the next flush
+            written = written and digest != None
+            digests[date] = digest
+            entries.append({'date': date, 'file': self.day_filename(date), 'digest': digest})
+
+        written = self.write_manifest(header, entries) and written
+
+        for date in set(self.day_digests) - set(digests):
+            try:
+                os.remove(os.path.join(self.report_dir, self.day_filename(date)))
+            except OSError:
+                pass
+        self.day_digests = digests
+        return written
+
+    def write_day_report(self, date: str, day_content: str):
+        '''
+        Write the file of a day if it changed since it was written.
+
+        :param date: str, '%d/%m/%y'
+        :param day_content: str, the day serialized
+        :return: str, digest of the day, None if the file couldn't be written
+        '''
+        filename = self.day_filename(date)
+        digest = self.content_digest(day_content)[:8].hex()
+        if self.day_digests.get(date) != digest:
+            log.debug(f"Report of {date} changed, write {filename}")
+            if not write_to_file(f"hoursReport.days[{json.dumps(date)}] = {day_content};\n", os.path.join(self.report_dir, filename)):
+                return None
+        return digest
+
+    def write_manifest(self, header: dict, entries: list):
+        '''
+        :param header: dict, tracker data without the days
+        :param entries: list of dict, {"date", "file", "digest"} of each day
+        :return: bool, False if the manifest couldn't be written
+        '''
+        manifest = dict(header)
+        manifest['days'] = entries
+        manifest_content = f'{MANIFEST_PREFIX}{{"manifest":{self.serialize(manifest)},"days":{{}}}}{MANIFEST_SUFFIX}'
+        return write_to_file(manifest_content, self.manifest_path)
+
+    def flush_days(self, header: dict, day_contents: dict, dates: list):
+        '''
+        Write the report of some days of the week and the manifest, without hours.json.
+        Used by the days storage (see monitor_utils.partitions), which writes the days one by one:
+        the other days keep their file, see missing_days for the days without one.
+
+        :param header: dict, the week information
+        :param day_contents: dict, {date: the day serialized} of the days written
+        :param dates: list of str, all the dates of the week, oldest first
+        :return: bool, False if a file couldn't be written
+        '''
+        try:
+            os.makedirs(self.report_dir, exist_ok=True)
+            # another monitor may have written days since the last flush, its manifest is the reference
+            self.day_digests = self.read_manifest_digests()
+            written = True
+            for date, day_content in day_contents.items():
+                digest = self.write_day_report(date, day_content)
+                written = written and digest != None
+                self.day_digests[date] = digest
+            entries = [{'date': date, 'file': self.day_filename(date), 'digest': self.day_digests.get(date)} for date in dates]
+            written = self.write_manifest(header, entries) and written
+            # hours.json isn't written, the next flush writes everything
+            self.last_digest = None
+            return written
+        except:
+            log.error(traceback.format_exc())
+            return False
+
+    def missing_days(self, dates: list):
+        '''
+        :param dates: list of str, dates of the week
+        :return: list of str, the dates without a file in the report
+        '''
+        digests = self.read_manifest_digests()
+        return [date for date in dates if digests.get(date) == None]
+
+    def read_manifest_digests(self):
+        '''
+        :return: dict, digest of each day file listed in the manifest, by date
+        '''
+        try:
+            with open(self.manifest_path, 'r') as manifest_file:
+                content = manifest_file.read()
+            if not content.startswith(MANIFEST_PREFIX) or not content.endswith(MANIFEST_SUFFIX):
+                return {}
+            report = json.loads(content[len(MANIFEST_PREFIX):-len(MANIFEST_SUFFIX)])
+            return {day.get('date'): day.get('digest') for day in report.get('manifest', {}).get('days', [])}
+        except (OSError, ValueError):
+            return {}
+
+    def invalidate(self):
+        '''
+        Forget the last flushed content, the next flush will write the files.
+        '''
+        self.last_digest = None
+        self.day_digests = {}
@@ -0,0 +1,192 @@
+'''
+For Menhir FX
+
+Cached access to the json tmp files shared by all the monitors (processes files, last_process.json).
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import os
+import json
+import traceback
+from threading import RLock
+from contextlib import contextmanager
+
+from monitor_utils.file import FileLock, get_data, write_to_file
+from monitor_utils.mhfx_log import log
+
+
+class ProcessRegistry(object):
+    '''
+    class ProcessRegistry that keeps the content of a json tmp file in memory.
+
+    Reads only parse the file when its (mtime, size, inode) changed on disk.
+    Writes are changes (functions dict -> dict) applied to the cache. They are written
+    to the file under a cross-process lock, on the latest content of the file,
+    so the monitors of other DCCs can't lose each other's updates.
+    Inside a batch() the writes are delayed and written once at the end of the batch.
+    If delete_empty is True, the file is removed instead of written when its content is empty.
+    '''
+    def __init__(self, path: str, delete_empty: bool = False):
+        self.path = str(path)
+        self.lock_path = self.path + '.lock'
+        self.delete_empty = delete_empty
+        self.cache = {}
+        self.loaded = False
+        self.signature = None
+        self.pending = []
+        self.batch_depth = 0
+        self.thread_lock = RLock()
+
+    def file_signature(self):
+        '''
+        :return: tuple (mtime, size, inode) of the file or None if it doesn't exist
+        '''
+        try:
+            stat = os.stat(self.path)
+            return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        except OSError:
+            return None
+
+    def _refresh(self):
+        signature = self.file_signature()
+        if signature != self.signature or not self.loaded:
+            self.cache = get_data(self.path) if signature != None else {}
+            self.loaded = True
+            self.signature = signature
+            for change in self.pending:
+                self.cache = change(self.cache)
+
+    def read(self):
+        '''
+        Return a copy of the file content, with the pending changes.
+
+        :return: dict
+        '''
+        with self.thread_lock:
+            self._refresh()
+            return {key: dict(value) if isinstance(value, dict) else value for key, value in self.cache.items()}
+
+    def change(self, change):
+        '''
+        Apply a change to the file content.
+
+        :param change: function dict -> dict, must give the same result when applied again
+        '''
+        with self.thread_lock:
+            self._refresh()
+            self.cache = change(self.cache)
+            self.pending.append(change)
+            if self.batch_depth == 0:
+                self.flush()
+
+    def flush(self):
+        '''
+        Write the pending changes to the file.
+        '''
+        with self.thread_lock:
+            if len(self.pending) <= 0:
+                return
+            try:
+                with FileLock(self.lock_path):
+                    # another monitor wrote the file: apply our changes on its content
+                    if self.file_signature() != self.signature:
+                        self.loaded = False
+                        self._refresh()
+                    if self.delete_empty and self.cache == {}:
+                        if os.path.exists(self.path):
+                            os.remove(self.path)
+                        self.signature = None
+                        self.pending = []
+                    elif write_to_file(json.dumps(self.cache, indent=4), self.path):
+                        self.signature = self.file_signature()
+                        self.pending = []
+            except:
+                log.error(traceback.format_exc())
+
+    @contextmanager
+    def batch(self):
+        '''
+        Delay the writes until the end of the with block.
+        '''
+        with self.thread_lock:
+            self.batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self.thread_lock:
+                self.batch_depth -= 1
+                if self.batch_depth == 0:
+                    self.flush()
+
+
+class ShardedProcessRegistry(object):
+    '''
+    class ShardedProcessRegistry that stores the processes in one file per monitor: <directory>/<monitor_id>.json.
+    A monitor only reads and writes its own shard, so its cost doesn't depend on the other monitors.
+    read_all() merges all the shards, parsing only the shards that changed on disk.
+    '''
+    EXT = '.json'
+
+    def __init__(self, directory: str):
+        self.directory = str(directory)
+        self.shards = {}
+        self.batch_depth = 0
+        self.thread_lock = RLock()
+
+    def shard(self, shard_id):
+        '''
+        :param shard_id: str, monitor id
+        :return: ProcessRegistry of the shard
+        '''
+        shard_id = str(shard_id)
+        with self.thread_lock:
+            registry = self.shards.get(shard_id)
+            if registry == None:
+                registry = ProcessRegistry(os.path.join(self.directory, shard_id + self.EXT), delete_empty=True)
+                registry.batch_depth = self.batch_depth
+                self.shards[shard_id] = registry
+            return registry
+
+    def shard_ids(self):
+        '''
+        :return: list of str, ids of the shards on disk and of the shards with pending writes
+        '''
+        ids = set()
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.name.endswith(self.EXT):
+                        ids.add(entry.name[:-len(self.EXT)])
+        except FileNotFoundError:
+            pass
+        with self.thread_lock:
+            ids.update(shard_id for shard_id, registry in self.shards.items() if len(registry.pending) > 0)
+        return sorted(ids)
+
+    def read_all(self):
+        '''
+        :return: dict, processes of all the shards
+        '''
+        data = {}
+        for shard_id in self.shard_ids():
+            data.update(self.shard(shard_id).read())
+        return data
+
+    @contextmanager
+    def batch(self):
+        '''
+        Delay the writes of all the shards until the end of the with block.
+        '''
+        with self.thread_lock:
+            self.batch_depth += 1
+            for registry in self.shards.values():
+                registry.batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self.thread_lock:
+                self.batch_depth -= 1
+                for registry in self.shards.values():
+                    registry.batch_depth = max(registry.batch_depth - 1, 0)
+                    if registry.batch_depth == 0:
+                        registry.flush()
@@ -0,0 +1,117 @@
+'''
+For Menhir FX
+
+Report of the time spent, from the command line, over the current week and the archived weeks.
+The archived weeks are read from the summary index of the backups (see monitor_utils.history),
+the weeks not summarized yet are decompressed and summarized in a process pool.
+
+python -m monitor_utils.report --by project
+python -m monitor_utils.report --from 01/07/26 --to 30/09/26 --project ProjA --by department --format csv
+python -m monitor_utils.report --weeks 4 --by week --by project --format json
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import sys
+import csv
+import json
+import argparse
+from datetime import timedelta
+
+from monitor_utils.history import query
+from monitor_utils.mhfx_log import log
+import monitor_utils.date as dt
+import monitor_utils.clock as clock
+
+# name of the aggregation on the command line: column of the summary index
+GROUP_BY = {
+    'day': 'date',
+    'week': 'year_week',
+    'project': 'project_name',
+    'asset': 'asset_name',
+    'department': 'department',
+}
+
+
+def get_rows(totals: dict, group_by: list):
+    '''
+    :param totals: dict, {tuple of the group_by values: seconds}
+    :param group_by: list of str, names of the aggregations
+    :return: list of dict, one row per group, sorted by the group values
+    '''
+    rows = []
+    for key in sorted(totals):
+        row = dict(zip(group_by, key))
+        row['seconds'] = totals[key]
+        row['hours'] = dt.get_seconds_as_time(totals[key])
+        rows.append(row)
+    return rows
+
+def print_table(rows: list, group_by: list, out=sys.stdout):
+    '''
+    :param rows: list of dict, see get_rows
+    :param group_by: list of str
+    '''
+    columns = group_by + ['hours']
+    total = dt.get_seconds_as_time(sum(row['seconds'] for row in rows))
+    widths = [max([len(column)] + [len(str(row[column])) for row in rows] + ([len(total)] if column == 'hours' else [])) for column in columns]
+    out.write('  '.join(column.ljust(width) for column, width in zip(columns, widths)) + '\n')
+    out.write('  '.join('-' * width for width in widths) + '\n')
+    for row in rows:
+        out.write('  '.join(str(row[column]).ljust(width) for column, width in zip(columns, widths)) + '\n')
+    out.write('  '.join('-' * width for width in widths) + '\n')
+    out.write('  '.join(('total' if i == 0 else total if column == 'hours' else '').ljust(width)
+                        for i, (column, width) in enumerate(zip(columns, widths))) + '\n')
+
+def print_csv(rows: list, group_by: list, out=sys.stdout):
+    '''
+    :param rows: list of dict, see get_rows
+    :param group_by: list of str
+    '''
+    writer = csv.DictWriter(out, fieldnames=group_by + ['seconds', 'hours'], lineterminator='\n')
+    writer.writeheader()
+    writer.writerows(rows)
+
+def print_json(rows: list, group_by: list, out=sys.stdout):
+    '''
+    :param rows: list of dict, see get_rows
+    :param group_by: list of str
+    '''
+    json.dump(rows, out, indent=4)
+    out.write('\n')
+
+
+FORMATS = {'table': print_table, 'csv': print_csv, 'json': print_json}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time spent tracked by HoursTracker')
+    parser.add_argument('--from', dest='start', help='first day included, dd/mm/yy')
+    parser.add_argument('--to', dest='end', help='last day included, dd/mm/yy')
+    parser.add_argument('--weeks', type=int, help='the last weeks only, the current week included, ignored with --from')
+    parser.add_argument('--by', action='append', choices=list(GROUP_BY), help='aggregation, repeat it to combine (default project)')
+    parser.add_argument('--project', action='append', help='only this project, can be repeated')
+    parser.add_argument('--asset', action='append', help='only this asset, can be repeated')
+    parser.add_argument('--department', action='append', help='only this department, can be repeated')
+    parser.add_argument('--format', choices=list(FORMATS), default='table')
+    parser.add_argument('--no-current', action='store_true', help='archived weeks only, without the current week')
+    parser.add_argument('--workers', type=int, help='processes to summarize the weeks not indexed yet (default the number of CPUs)')
+    args = parser.parse_args(argv)
+
+    group_by = args.by or ['project']
+    try:
+        start = dt.get_date_as_ordinal(args.start) if args.start else None
+        end = dt.get_date_as_ordinal(args.end) if args.end else None
+    except ValueError:
+        parser.error('dates are dd/mm/yy')
+    if start == None and args.weeks:
+        today = clock.now().date()
+        start = (today - timedelta(days=today.weekday(), weeks=args.weeks - 1)).toordinal()
+
+    totals = query(start, end, args.project, args.asset, args.department,
+                   tuple(GROUP_BY[name] for name in group_by), not args.no_current, args.workers)
+    FORMATS[args.format](get_rows(totals, group_by), group_by)
+    log.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+'''
+For Menhir FX
+
+Deadline scheduler of the monitor thread: each task has its own cadence,
+the thread sleeps until the nearest deadline.
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import heapq
+import traceback
+from itertools import count
+
+from monitor_utils.mhfx_log import log
+from monitor_utils.clock import monotonic
+from monitor_utils.metrics import metrics
+
+
+class Task(object):
+    '''
+    class Task, an action run at a deadline.
+    interval is the cadence in seconds, None for a task run once.
+    '''
+    __slots__ = ('name', 'action', 'interval', 'deadline', 'seq')
+
+    def __init__(self, name: str, action, interval: float = None):
+        self.name = name
+        self.action = action
+        self.interval = interval
+        self.deadline = None
+        self.seq = None
+
+
+class Scheduler(object):
+    '''
+    class Scheduler, a heap of task deadlines.
+
+    A periodic task is rescheduled on its previous deadline plus its interval, not on the time it ran,
+    so the cadence doesn't drift with the time the thread needs to wake up.
+    Deadlines missed by more than an interval (computer asleep) are skipped, not run in a burst.
+    A task can reschedule or remove any task, itself included, while it runs.
+    '''
+    def __init__(self, clock=monotonic):
+        self.clock = clock
+        self.heap = []
+        self.tasks = {}
+        self.counter = count()
+
+    def _push(self, task: Task, deadline: float):
+        task.deadline = deadline
+        task.seq = next(self.counter)
+        # the old heap entries of the task are ignored thanks to seq
+        heapq.heappush(self.heap, (deadline, task.seq, task))
+
+    def add(self, name: str, action, interval: float = None, delay: float = None):
+        '''
+        Add a task, or replace the task with the same name.
+
+        :param name: str
+        :param action: function without parameter
+        :param interval: float, seconds between two runs, None to run once
+        :param delay: float, seconds before the first run, by default interval
+        '''
+        self.remove(name)
+        task = Task(name, action, interval)
+        self.tasks[name] = task
+        self._push(task, self.clock() + (interval if delay == None else delay))
+
+    def reschedule(self, name: str, delay: float):
+        '''
+        Move the next run of a task.
+
+        :param name: str
+        :param delay: float, seconds from now
+        '''
+        task = self.tasks.get(name)
+        if task != None:
+            self._push(task, self.clock() + delay)
+
+    def remove(self, name: str):
+        '''
+        :param name: str
+        '''
+        task = self.tasks.pop(name, None)
+        if task != None:
+            task.seq = None
+
+    def has_task(self, name: str):
+        return name in self.tasks
+
+    def _discard_stale(self):
+        while self.heap and self.heap[0][2].seq != self.heap[0][1]:
+            heapq.heappop(self.heap)
+
+    def next_deadline(self):
+        '''
+        :return: float, nearest deadline on the clock, None without task
+        '''
+        self._discard_stale()
+        return self.heap[0][0] if self.heap else None
+
+    def time_until_next(self):
+        '''
+        :return: float, seconds until the nearest deadline, None without task
+        '''
+        deadline = self.next_deadline()
+        if deadline == None:
+            return None
+        return max(deadline - self.clock(), 0)
+
+    def run_pending(self, keep_running=None):
+        '''
+        Run the tasks whose deadline is reached, in deadline order.
+
+        :param keep_running: function without parameter returning False to stop before the next task
+        :return: int, number of tasks run
+        '''
+        ran = 0
+        now = self.clock()
+        while True:
+            if keep_running != None and not keep_running():
+                break
+            deadline = self.next_deadline()
+            if deadline == None or deadline > now:
+                break
+            _, _, task = heapq.heappop(self.heap)
+
+            if task.interval == None:
+                self.tasks.pop(task.name, None)
+                task.seq = None
+            else:
+                next_deadline = deadline + task.interval
+                if next_deadline <= now:
+                    missed = int((now - next_deadline) // task.interval) + 1
+                    next_deadline += missed * task.interval
+                self._push(task, next_deadline)
+
+            log.debug(f"Run task {task.name}, {now - deadline:.3f} sec late.")
+            try:
+                with metrics.timer('task_seconds', task=task.name):
+                    task.action()
+            except:
+                log.error(traceback.format_exc())
+            ran += 1
+        return ran
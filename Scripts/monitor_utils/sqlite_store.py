@@ -0,0 +1,378 @@
+'''
+For Menhir FX
+
+SQLite storage of the tracker data, chosen with [Data] storage = sqlite in config.ini.
+
+The database (hours.db) is the reference. hours.json and the report of hours.html
+are exported from it after each compaction of the journal, so the page, the backups
+and the new day / new week checks of the plugin read the same files as with the json storage.
+
+An asset session is one row, written with a single UPSERT. The triggers create its day, project
+and project session, keep the total of the project session up to date and add its delta
+to the rollups of the totals table (project, department, day and week), read with get_total.
+Rows are read in insertion order (rowid), the export keeps the order of the days and projects.
+
+The digest of the last hours.json exported is kept in the export table. If hours.json doesn't match it
+when the store is opened, it was written by the json storage since: it is imported again.
+
+The database is in WAL mode on a local disk. WAL isn't supported on a network share,
+the default U: drive, the rollback journal is used there.
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import os
+import sqlite3
+import traceback
+from contextlib import contextmanager
+from threading import Lock
+
+from monitor_utils.config import mhfx_path
+from monitor_utils.backends import get_backend
+from monitor_utils.file import get_data
+from monitor_utils.persistence import DataStore
+from monitor_utils.mhfx_log import log
+from monitor_utils.tracker_data import TrackerData
+import monitor_utils.config.monitor as monitor
+
+SCHEMA_VERSION = 3 # 2: totals table, 3: export table
+SESSION_COLUMNS = ('date', 'project_name', 'asset_name', 'department')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS week (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS days (
+    date INTEGER PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS projects (
+    date INTEGER NOT NULL,
+    project_name TEXT NOT NULL,
+    UNIQUE (date, project_name)
+);
+CREATE TABLE IF NOT EXISTS project_sessions (
+    date INTEGER NOT NULL,
+    project_name TEXT NOT NULL,
+    asset_name TEXT NOT NULL,
+    department TEXT NOT NULL,
+    seconds INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (date, project_name, asset_name, department)
+);
+CREATE TABLE IF NOT EXISTS asset_sessions (
+    date INTEGER NOT NULL,
+    project_name TEXT NOT NULL,
+    asset_name TEXT NOT NULL,
+    department TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    last INTEGER,
+    seconds INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (date, project_name, asset_name, department, start)
+);
+CREATE TABLE IF NOT EXISTS export (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS totals (
+    level TEXT NOT NULL,
+    date INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    seconds INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (level, date, name)
+);
+CREATE INDEX IF NOT EXISTS project_sessions_project ON project_sessions (project_name, date);
+CREATE INDEX IF NOT EXISTS project_sessions_asset ON project_sessions (asset_name, department);
+CREATE INDEX IF NOT EXISTS project_sessions_department ON project_sessions (department, date);
+
+CREATE TRIGGER IF NOT EXISTS asset_session_parents BEFORE INSERT ON asset_sessions
+BEGIN
+    INSERT OR IGNORE INTO days (date) VALUES (NEW.date);
+    INSERT OR IGNORE INTO projects (date, project_name) VALUES (NEW.date, NEW.project_name);
+    INSERT OR IGNORE INTO project_sessions (date, project_name, asset_name, department)
+        VALUES (NEW.date, NEW.project_name, NEW.asset_name, NEW.department);
+END;
+CREATE TRIGGER IF NOT EXISTS asset_session_inserted AFTER INSERT ON asset_sessions
+BEGIN
+    UPDATE project_sessions SET seconds = seconds + NEW.seconds
+    WHERE date = NEW.date AND project_name = NEW.project_name AND asset_name = NEW.asset_name AND department = NEW.department;
+END;
+CREATE TRIGGER IF NOT EXISTS asset_session_updated AFTER UPDATE OF seconds ON asset_sessions
+BEGIN
+    UPDATE project_sessions SET seconds = seconds + NEW.seconds - OLD.seconds
+    WHERE date = NEW.date AND project_name = NEW.project_name AND asset_name = NEW.asset_name AND department = NEW.department;
+END;
+CREATE TRIGGER IF NOT EXISTS project_session_rollup AFTER UPDATE OF seconds ON project_sessions
+BEGIN
+    INSERT INTO totals (level, date, name, seconds) VALUES
+        ('project', NEW.date, NEW.project_name, NEW.seconds - OLD.seconds),
+        ('project', 0, NEW.project_name, NEW.seconds - OLD.seconds),
+        ('department', NEW.date, NEW.department, NEW.seconds - OLD.seconds),
+        ('department', 0, NEW.department, NEW.seconds - OLD.seconds),
+        ('day', NEW.date, '', NEW.seconds - OLD.seconds),
+        ('week', 0, '', NEW.seconds - OLD.seconds)
+    ON CONFLICT (level, date, name) DO UPDATE SET seconds = seconds + excluded.seconds;
+END;
+'''
+
+UPSERT_SESSION = '''
+INSERT INTO asset_sessions (date, project_name, asset_name, department, start, last, seconds)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (date, project_name, asset_name, department, start)
+DO UPDATE SET last = excluded.last, seconds = excluded.seconds
+'''
+
+# the rollups computed from the project sessions, for a database created before the totals table.
+# date 0 is the whole week, name '' the day and week levels
+REBUILD_TOTALS = (
+    "INSERT INTO totals SELECT 'project', date, project_name, SUM(seconds) FROM project_sessions GROUP BY date, project_name",
+    "INSERT INTO totals SELECT 'project', 0, project_name, SUM(seconds) FROM project_sessions GROUP BY project_name",
+    "INSERT INTO totals SELECT 'department', date, department, SUM(seconds) FROM project_sessions GROUP BY date, department",
+    "INSERT INTO totals SELECT 'department', 0, department, SUM(seconds) FROM project_sessions GROUP BY department",
+    "INSERT INTO totals SELECT 'day', date, '', SUM(seconds) FROM project_sessions GROUP BY date",
+    "INSERT INTO totals SELECT 'week', 0, '', SUM(seconds) FROM project_sessions HAVING COUNT(*) > 0",
+)
+TOTAL_LEVELS = ('project', 'department', 'day', 'week')
+
+INSERT_SESSION = '''
+INSERT INTO asset_sessions (date, project_name, asset_name, department, start)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (date, project_name, asset_name, department, start) DO NOTHING
+'''
+
+
+class SqliteStore(object):
+    '''
+    class SqliteStore, the tracker data in a SQLite database.
+    One connection per process, shared by its threads. Writes are done in immediate transactions,
+    two monitors writing at the same time wait for each other instead of overwriting each other.
+    '''
+    def __init__(self, path: str, timeout: float = 10.0):
+        self.path = str(path)
+        self.timeout = timeout
+        self.connection = None
+        self.lock = Lock()
+
+    def connect(self):
+        if self.connection == None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            # the shared memory of WAL doesn't work over the network
+            journal_mode = 'DELETE' if get_backend().is_network_path(self.path) else 'WAL'
+            connection.execute(f'PRAGMA journal_mode={journal_mode}')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            version = connection.execute('PRAGMA user_version').fetchone()[0]
+            connection.executescript(SCHEMA)
+            if 0 < version < 2:
+                connection.execute('BEGIN IMMEDIATE')
+                connection.execute('DELETE FROM totals')
+                for sql in REBUILD_TOTALS:
+                    connection.execute(sql)
+                connection.execute('COMMIT')
+            connection.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+            self.connection = connection
+        return self.connection
+
+    def close(self):
+        with self.lock:
+            if self.connection != None:
+                self.connection.close()
+                self.connection = None
+
+    @contextmanager
+    def transaction(self):
+        '''
+        with store.transaction() as cursor: the statements are committed together, or not at all.
+        '''
+        with self.lock:
+            cursor = self.connect().cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                yield cursor
+            except:
+                cursor.execute('ROLLBACK')
+                raise
+            cursor.execute('COMMIT')
+
+    def query(self, sql: str, parameters: tuple = ()):
+        '''
+        :return: list of tuple
+        '''
+        with self.lock:
+            return self.connect().execute(sql, parameters).fetchall()
+
+    @staticmethod
+    def session_row(date: int, entity: dict):
+        return (date, entity.get('project_name'), entity.get('asset_name'), entity.get('department'))
+
+    def set_session(self, date: int, entity: dict, start: int, seconds: int, last: int, cursor=None):
+        '''
+        Set the time spent in an asset session, create it if needed.
+
+        :param date: int, day number
+        :param entity: dict
+        :param start: int, seconds since midnight when the session was opened
+        :param seconds: int, time spent in the session
+        :param last: int, seconds since midnight of the last action
+        :param cursor: cursor of a transaction, by default the statement is its own transaction
+        '''
+        parameters = self.session_row(date, entity) + (start, last, seconds)
+        if cursor != None:
+            cursor.execute(UPSERT_SESSION, parameters)
+            return
+        with self.transaction() as cursor:
+            cursor.execute(UPSERT_SESSION, parameters)
+
+    def add_session(self, date: int, entity: dict, start: int, cursor=None):
+        '''
+        Create an asset session if it doesn't exist.
+        '''
+        parameters = self.session_row(date, entity) + (start,)
+        if cursor != None:
+            cursor.execute(INSERT_SESSION, parameters)
+            return
+        with self.transaction() as cursor:
+            cursor.execute(INSERT_SESSION, parameters)
+
+    def set_header(self, user_id: str, year: str, week: str, week_description: str, cursor=None):
+        '''
+        Set the week information of the data.
+        '''
+        rows = [('user_id', user_id), ('year', year), ('week', week), ('week_description', week_description)]
+        sql = 'INSERT INTO week (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value'
+        if cursor != None:
+            cursor.executemany(sql, rows)
+            return
+        with self.transaction() as cursor:
+            cursor.executemany(sql, rows)
+
+    def has_day(self, date: int):
+        return len(self.query('SELECT 1 FROM days WHERE date = ?', (date,))) > 0
+
+    def is_empty(self):
+        return len(self.query('SELECT 1 FROM asset_sessions LIMIT 1')) == 0
+
+    def totals(self, by: tuple = ('project_name',), date: int = None):
+        '''
+        Time spent grouped by columns of the project sessions, read from the indexes.
+
+        :param by: tuple of str among date, project_name, asset_name, department
+        :param date: int, day number, None for the whole week
+        :return: dict, {tuple of the by values: seconds}
+        '''
+        columns = [c for c in by if c in SESSION_COLUMNS]
+        if len(columns) != len(by) or not columns:
+            raise ValueError(f"totals by {by}, columns must be among {SESSION_COLUMNS}")
+        names = ', '.join(columns)
+        where = '' if date == None else 'WHERE date = ?'
+        rows = self.query(
+            f'SELECT {names}, SUM(seconds) FROM project_sessions {where} GROUP BY {names}', () if date == None else (date,)
+        )
+        return {tuple(row[:-1]): row[-1] for row in rows}
+
+    def get_total(self, level: str, name: str = '', date: int = None):
+        '''
+        Read a rollup, one row of the primary key.
+
+        :param level: str, project, department, day or week
+        :param name: str, project_name or department, '' for day and week
+        :param date: int, day number, None for the week
+        :return: int, seconds
+        '''
+        if level not in TOTAL_LEVELS:
+            raise ValueError(f"total of {level}, level must be among {TOTAL_LEVELS}")
+        rows = self.query(
+            'SELECT seconds FROM totals WHERE level = ? AND date = ? AND name = ?', (level, 0 if date == None else date, name)
+        )
+        return rows[0][0] if rows else 0
+
+    def get_export_digest(self):
+        '''
+        :return: str, digest of the tracker data of the last hours.json exported, None if there is none
+        '''
+        rows = self.query("SELECT value FROM export WHERE key = 'digest'")
+        return rows[0][0] if rows else None
+
+    def set_export_digest(self, digest: str):
+        '''
+        :param digest: str, digest of the tracker data of hours.json, see DataStore.content_digest
+        '''
+        if digest == self.get_export_digest():
+            return
+        with self.transaction() as cursor:
+            cursor.execute(
+                "INSERT INTO export (key, value) VALUES ('digest', ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value", (digest,)
+            )
+
+    def clear(self):
+        '''
+        Remove all the data, for a new week.
+        '''
+        with self.transaction() as cursor:
+            for table in ('asset_sessions', 'project_sessions', 'projects', 'days', 'week', 'totals', 'export'):
+                cursor.execute(f'DELETE FROM {table}')
+
+    def import_data(self, data: dict):
+        '''
+        Replace the data by a hours.json dict.
+
+        :param data: dict
+        '''
+        tracker = TrackerData(data)
+        with self.transaction() as cursor:
+            for table in ('asset_sessions', 'project_sessions', 'projects', 'days', 'week', 'totals'):
+                cursor.execute(f'DELETE FROM {table}')
+            cursor.executemany(
+                'INSERT INTO week (key, value) VALUES (?, ?)', [(k, str(v)) for k, v in tracker.header.items()]
+            )
+            for day in tracker.days:
+                for project in day.projects:
+                    for ps in project.project_sessions:
+                        entity = {'project_name': project.project_name, 'asset_name': ps.asset_name, 'department': ps.department}
+                        for session in ps.asset_sessions:
+                            cursor.execute(UPSERT_SESSION, self.session_row(day.date, entity) + (session.start, session.last, session.seconds))
+
+    def as_tracker_data(self):
+        '''
+        :return: TrackerData, the whole data in memory
+        '''
+        tracker = TrackerData()
+        for key, value in self.query('SELECT key, value FROM week'):
+            tracker.header[key] = value
+        rows = self.query(
+            'SELECT date, project_name, asset_name, department, start, last, seconds FROM asset_sessions ORDER BY rowid'
+        )
+        for date, project_name, asset_name, department, start, last, seconds in rows:
+            entity = {'project_name': project_name, 'asset_name': asset_name, 'department': department}
+            ps, session = tracker.get_or_create_session(date, entity, start)
+            tracker.set_session_time(ps, session, seconds, last)
+        return tracker
+
+    def as_dict(self):
+        '''
+        :return: dict, the data in the hours.json schema
+        '''
+        return self.as_tracker_data().as_dict()
+
+
+_store = None
+
+def get_store():
+    '''
+    :return: SqliteStore of the user, None if the storage is json
+    '''
+    global _store
+    if monitor.storage != 'sqlite':
+        return None
+    if _store == None:
+        store = SqliteStore(mhfx_path.user_data_db)
+        try:
+            store.connect()
+            if os.path.exists(mhfx_path.user_data_json):
+                data = get_data(mhfx_path.user_data_json)
+                digest = DataStore.content_digest(DataStore.serialize(data)).hex()
+                if digest != store.get_export_digest():
+                    # first use of the sqlite storage, or hours.json written by the json storage since the last export
+                    store.import_data(data)
+                    store.set_export_digest(digest)
+        except:
+            log.error(traceback.format_exc())
+        _store = store
+    return _store
@@ -0,0 +1,484 @@
+'''
+For Menhir FX
+
+Studio rollup of the time spent by the whole team, from the data folders of the artists.
+
+python -m monitor_utils.studio scan studio.db "//server/users/*/mesDocuments/HoursTrackerV2/"
+python -m monitor_utils.studio report studio.db --by user --by project --from 01/09/26
+
+A scan lists the tracker files of each data folder: hours.json (current week), the week folder
+(current week of the days storage, see monitor_utils.partitions), backup/index.json
+(the archived weeks, see monitor_utils.backup) and the backups made before the archive
+({week}_{year}_hours.json). A file is read again only when its mtime or size changed since the last
+scan (files table, the manifest). The folders with changed files are read in a process pool,
+the rows are merged in the studio database by the scanning process only.
+
+An archived week is decompressed only when its digest changed, or taken from the summary index
+of the artist (backup/summary.json) when it is up to date. The same week can be found in several
+files (hours.json not reset yet after its backup): the archive wins over the old backups,
+which win over the current week. The current week is taken from the most recent of hours.json
+and the week folder, an artist may have changed of storage during the week.
+
+The artist of a folder is resolved once, from the user_id of its tracker files: hours.json is reset
+at the rollover, the archive still has it. The folder path stands for the artist until a file has a user_id,
+the rows of the folder are then moved to the user_id.
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import os
+import re
+import glob
+import time
+import sqlite3
+import argparse
+import traceback
+from datetime import date as Date
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+
+from monitor_utils.backup import BackupArchive
+from monitor_utils.file import get_data
+from monitor_utils.history import summarize_week
+from monitor_utils.partitions import DayPartitions
+from monitor_utils.mhfx_log import log
+from monitor_utils.report import FORMATS, get_rows
+import monitor_utils.date as dt
+import monitor_utils.clock as clock
+
+SCHEMA_VERSION = 1
+PARALLEL_MIN_FOLDERS = 4 # fewer folders to read are done in the process, a pool costs more to start
+LEGACY_JSON = re.compile(r'^(\d+)_(\d+)_hours\.json$')
+# the week found in several files is taken from the file of highest priority
+SOURCE_PRIORITY = {'current': 0, 'days': 0, 'legacy': 1, 'archive': 2}
+HOURS_COLUMNS = ('user', 'year_week', 'date', 'project_name', 'asset_name', 'department')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    user_dir TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS users (
+    user_dir TEXT PRIMARY KEY,
+    user TEXT NOT NULL,
+    scanned INTEGER
+);
+CREATE TABLE IF NOT EXISTS weeks (
+    user TEXT NOT NULL,
+    year_week TEXT NOT NULL,
+    user_dir TEXT NOT NULL,
+    source TEXT NOT NULL,
+    hours_digest TEXT,
+    seconds INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user, year_week)
+);
+CREATE TABLE IF NOT EXISTS hours (
+    user TEXT NOT NULL,
+    date INTEGER NOT NULL,
+    project_name TEXT NOT NULL,
+    asset_name TEXT NOT NULL,
+    department TEXT NOT NULL,
+    year_week TEXT NOT NULL,
+    seconds INTEGER NOT NULL,
+    PRIMARY KEY (user, project_name, asset_name, department, date)
+);
+CREATE INDEX IF NOT EXISTS hours_week ON hours (user, year_week);
+CREATE INDEX IF NOT EXISTS hours_date ON hours (date);
+CREATE INDEX IF NOT EXISTS files_user_dir ON files (user_dir);
+CREATE INDEX IF NOT EXISTS weeks_user_dir ON weeks (user_dir);
+'''
+
+
+def week_key(week, year):
+    '''
+    :return: str, "<year>_<week>", the order of the weeks
+    '''
+    return f"{int(year)}_{int(week):02d}"
+
+def list_files(user_dir: str):
+    '''
+    :param user_dir: str, data folder of an artist
+    :return: list of tuple (path, kind), kind among current, days, archive, legacy
+    '''
+    files = []
+    current = os.path.join(user_dir, 'hours.json')
+    if os.path.exists(current):
+        files.append((current, 'current'))
+    week_dir = os.path.join(user_dir, 'week')
+    if os.path.exists(os.path.join(week_dir, 'header.json')):
+        for path in sorted(glob.glob(os.path.join(glob.escape(week_dir), '*.json'))):
+            files.append((path, 'days'))
+    backup_dir = os.path.join(user_dir, 'backup')
+    index = os.path.join(backup_dir, 'index.json')
+    if os.path.exists(index):
+        files.append((index, 'archive'))
+    for path in sorted(glob.glob(os.path.join(glob.escape(backup_dir), '*_hours.json'))):
+        if LEGACY_JSON.match(os.path.basename(path)):
+            files.append((path, 'legacy'))
+    return files
+
+def read_user_id(path: str, kind: str):
+    '''
+    :param path: str, tracker file of an artist
+    :param kind: str, current, days, archive or legacy
+    :return: str, the user_id of the file, None if it has none
+    '''
+    if kind == 'days':
+        if os.path.basename(path) != 'header.json':
+            return None
+        return DayPartitions(os.path.dirname(path)).read_header().get('user_id')
+    if kind == 'archive':
+        archive = BackupArchive(os.path.join(os.path.dirname(path), 'hours_archive.gz'), path)
+        # the newest week, the older ones have the same user_id
+        for entry in archive.entries():
+            hours = archive.get_hours(entry.get('week'), entry.get('year'))
+            if hours and hours.get('user_id'):
+                return hours.get('user_id')
+        return None
+    return get_data(path).get('user_id')
+
+def resolve_user(user_dir: str, default: str):
+    '''
+    The artist of a data folder, the first user_id found in its tracker files.
+
+    :param user_dir: str, data folder of an artist
+    :param default: str, the artist if no file has a user_id
+    :return: str
+    '''
+    for path, kind in list_files(user_dir):
+        try:
+            user_id = read_user_id(path, kind)
+            if user_id:
+                return user_id
+        except:
+            log.error(f"Studio scan of {path} failed:\n{traceback.format_exc()}")
+    return default
+
+def summarize_file(path: str, kind: str, user: str, archive_digests: dict):
+    '''
+    :param path: str, tracker file of an artist, the week folder for the days kind
+    :param kind: str, current, days, archive or legacy
+    :param user: str, the artist of the folder
+    :param archive_digests: dict, {year_week: hours_digest} of the archived weeks already in the studio database
+    :return: list of dict, {user, year_week, source, hours_digest, rows} for each week of the file that changed
+    '''
+    weeks = []
+    if kind == 'archive':
+        user_dir = os.path.dirname(os.path.dirname(path))
+        archive = BackupArchive(os.path.join(user_dir, 'backup', 'hours_archive.gz'), path)
+        summary_path = os.path.join(user_dir, 'backup', 'summary.json')
+        summaries = get_data(summary_path).get('weeks', {}) if os.path.exists(summary_path) else {}
+        for entry in archive.entries():
+            key = week_key(entry.get('week'), entry.get('year'))
+            hours_digest = entry.get('hours_digest')
+            if archive_digests.get(key) == hours_digest:
+                continue
+            summary = summaries.get(key)
+            if summary == None or summary.get('hours_digest') != hours_digest:
+                summary = summarize_week(archive.get_hours(entry.get('week'), entry.get('year')), hours_digest)
+            weeks.append({'user': user, 'year_week': key, 'source': kind, 'hours_digest': hours_digest, 'rows': summary.get('rows')})
+        return weeks
+
+    data = DayPartitions(path).as_dict() if kind == 'days' else get_data(path)
+    if not data.get('days'):
+        return weeks
+    if kind == 'legacy':
+        # the week and year of the file name, older files may miss them
+        week, year = LEGACY_JSON.match(os.path.basename(path)).groups()
+        data.setdefault('week', week)
+        data.setdefault('year', year)
+    summary = summarize_week(data)
+    weeks.append({
+        'user': user,
+        'year_week': week_key(data.get('week'), data.get('year')),
+        'source': kind,
+        'hours_digest': None,
+        'rows': summary.get('rows'),
+    })
+    return weeks
+
+def scan_user(task: tuple):
+    '''
+    Read the changed files of a data folder, in a worker process of StudioStore.scan.
+
+    :param task: tuple (user_dir, user, files, archive_digests), files a list of (path, kind, mtime_ns, size)
+    :return: dict, {user_dir, user, weeks, files}, files the list of the files read without error
+    '''
+    user_dir, user, files, archive_digests = task
+    if user == os.path.normpath(user_dir):
+        # no user_id found yet
+        user = resolve_user(user_dir, user)
+    result = {'user_dir': user_dir, 'user': user, 'weeks': [], 'files': []}
+    # the files of the week folder are read together
+    sources = {}
+    for path, kind, mtime_ns, size in files:
+        source = os.path.dirname(path) if kind == 'days' else path
+        sources.setdefault((source, kind), []).append((path, mtime_ns, size))
+    # the most recent source wins a tie of priority
+    order = sorted(sources, key=lambda s: (SOURCE_PRIORITY[s[1]], max(f[1] for f in sources[s])))
+    for source, kind in order:
+        try:
+            weeks = summarize_file(source, kind, user, archive_digests)
+            result['weeks'].extend(weeks)
+            result['files'].extend(sources[(source, kind)])
+        except:
+            log.error(f"Studio scan of {source} failed:\n{traceback.format_exc()}")
+    return result
+
+
+class StudioStore(object):
+    '''
+    class StudioStore, the time spent by the artists in a SQLite database (WAL mode),
+    one row per user, project, asset, department and day.
+    Only the scanning process writes it, the reports can read it at the same time.
+    '''
+    def __init__(self, path: str, timeout: float = 30.0):
+        self.path = str(path)
+        self.timeout = timeout
+        self.connection = None
+
+    def connect(self):
+        if self.connection == None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SCHEMA)
+            connection.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+            self.connection = connection
+        return self.connection
+
+    def close(self):
+        if self.connection != None:
+            self.connection.close()
+            self.connection = None
+
+    @contextmanager
+    def transaction(self):
+        '''
+        with store.transaction() as cursor: the statements are committed together, or not at all.
+        '''
+        cursor = self.connect().cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            yield cursor
+        except:
+            cursor.execute('ROLLBACK')
+            raise
+        cursor.execute('COMMIT')
+
+    def query(self, sql: str, parameters: tuple = ()):
+        '''
+        :return: list of tuple
+        '''
+        return self.connect().execute(sql, parameters).fetchall()
+
+    def get_tasks(self, user_dirs: list):
+        '''
+        Compare the tracker files of the folders with the manifest.
+
+        :param user_dirs: list of str, data folders of the artists
+        :return: tuple (tasks, gone), the tasks of scan_user for the folders with changed files,
+                 gone the files of the manifest that no longer exist
+        '''
+        manifest = {path: (user_dir, mtime_ns, size) for path, user_dir, mtime_ns, size in self.query('SELECT path, user_dir, mtime_ns, size FROM files')}
+        users = dict(self.query('SELECT user_dir, user FROM users'))
+        tasks = []
+        seen = set()
+        for user_dir in user_dirs:
+            changed = []
+            for path, kind in list_files(user_dir):
+                seen.add(path)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                known = manifest.get(path)
+                if known == None or known[1:] != (stat.st_mtime_ns, stat.st_size):
+                    changed.append((path, kind, stat.st_mtime_ns, stat.st_size))
+            if not changed:
+                continue
+            archive_digests = dict(self.query(
+                "SELECT year_week, hours_digest FROM weeks WHERE user_dir = ? AND source = 'archive'", (user_dir,)
+            ))
+            tasks.append((user_dir, users.get(user_dir, os.path.normpath(user_dir)), changed, archive_digests))
+        scanned_dirs = set(user_dirs)
+        gone = [path for path, (user_dir, _, _) in manifest.items() if user_dir in scanned_dirs and path not in seen]
+        return tasks, gone
+
+    def rekey_user(self, user_dir: str, user: str, cursor):
+        '''
+        Move the weeks of a folder written under another user to the user of the folder.
+        A week already known for the user is kept if its source has a higher or the same priority.
+
+        :param user_dir: str, data folder of an artist
+        :param user: str, the artist of the folder
+        :param cursor: cursor of a transaction
+        '''
+        moved = cursor.execute(
+            'SELECT user, year_week, source FROM weeks WHERE user_dir = ? AND user != ?', (user_dir, user)
+        ).fetchall()
+        for old_user, year_week, source in moved:
+            known = cursor.execute('SELECT source FROM weeks WHERE user = ? AND year_week = ?', (user, year_week)).fetchone()
+            if known != None:
+                dropped = old_user if SOURCE_PRIORITY[known[0]] >= SOURCE_PRIORITY[source] else user
+                cursor.execute('DELETE FROM hours WHERE user = ? AND year_week = ?', (dropped, year_week))
+                cursor.execute('DELETE FROM weeks WHERE user = ? AND year_week = ?', (dropped, year_week))
+                if dropped == old_user:
+                    continue
+            cursor.execute('UPDATE hours SET user = ? WHERE user = ? AND year_week = ?', (user, old_user, year_week))
+            cursor.execute('UPDATE weeks SET user = ? WHERE user = ? AND year_week = ?', (user, old_user, year_week))
+        if moved:
+            log.debug(f"Studio scan: {len(moved)} weeks of {user_dir} moved to {user}.")
+
+    def merge(self, result: dict, cursor):
+        '''
+        Write the weeks read by scan_user. A week replaces the rows of the same user and week,
+        unless they come from a file of higher priority.
+
+        :param result: dict, see scan_user
+        :param cursor: cursor of a transaction
+        :return: int, number of weeks written
+        '''
+        self.rekey_user(result.get('user_dir'), result.get('user'), cursor)
+        count = 0
+        for week in result.get('weeks'):
+            user = week.get('user')
+            year_week = week.get('year_week')
+            known = cursor.execute('SELECT source FROM weeks WHERE user = ? AND year_week = ?', (user, year_week)).fetchone()
+            if known != None and SOURCE_PRIORITY[known[0]] > SOURCE_PRIORITY[week.get('source')]:
+                continue
+            cursor.execute('DELETE FROM hours WHERE user = ? AND year_week = ?', (user, year_week))
+            cursor.executemany(
+                'INSERT INTO hours (user, date, project_name, asset_name, department, year_week, seconds) VALUES (?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (user, project_name, asset_name, department, date) DO UPDATE SET seconds = seconds + excluded.seconds',
+                [(user, date, project_name, asset_name, department, year_week, seconds)
+                 for date, project_name, asset_name, department, seconds in week.get('rows')]
+            )
+            cursor.execute(
+                'INSERT OR REPLACE INTO weeks (user, year_week, user_dir, source, hours_digest, seconds) VALUES (?, ?, ?, ?, ?, ?)',
+                (user, year_week, result.get('user_dir'), week.get('source'), week.get('hours_digest'), sum(row[-1] for row in week.get('rows')))
+            )
+            count += 1
+        cursor.execute(
+            'INSERT OR REPLACE INTO users (user_dir, user, scanned) VALUES (?, ?, ?)',
+            (result.get('user_dir'), result.get('user'), round(clock.time()))
+        )
+        cursor.executemany(
+            'INSERT OR REPLACE INTO files (path, user_dir, mtime_ns, size) VALUES (?, ?, ?, ?)',
+            [(path, result.get('user_dir'), mtime_ns, size) for path, mtime_ns, size in result.get('files')]
+        )
+        return count
+
+    def scan(self, user_dirs: list, workers: int = None):
+        '''
+        Read the tracker files changed since the last scan and merge them.
+
+        :param user_dirs: list of str, data folders of the artists
+        :param workers: int, processes of the pool, None for the number of CPUs, 1 for no pool
+        :return: dict, {folders, files, weeks}, what was read and written
+        '''
+        user_dirs = [os.path.join(user_dir, '') for user_dir in user_dirs]
+        tasks, gone = self.get_tasks(user_dirs)
+        stats = {'folders': len(tasks), 'files': 0, 'weeks': 0}
+
+        def merge_results(results):
+            with self.transaction() as cursor:
+                for result in results:
+                    stats['weeks'] += self.merge(result, cursor)
+                    stats['files'] += len(result.get('files'))
+                cursor.executemany('DELETE FROM files WHERE path = ?', [(path,) for path in gone])
+
+        if len(tasks) >= PARALLEL_MIN_FOLDERS and workers != 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                # a folder is small, chunks spare the round trips with the workers
+                merge_results(list(pool.map(scan_user, tasks, chunksize=max(1, len(tasks) // (4 * (workers or os.cpu_count() or 1))))))
+        else:
+            merge_results([scan_user(task) for task in tasks])
+
+        log.debug(f"Studio scan: {stats['folders']} folders, {stats['files']} files, {stats['weeks']} weeks merged.")
+        return stats
+
+    def totals(self, group_by: tuple = ('user',), start: int = None, end: int = None,
+               users=None, projects=None, assets=None, departments=None):
+        '''
+        Time spent grouped by columns of the hours table.
+
+        :param group_by: tuple of str among user, year_week, date, project_name, asset_name, department
+        :param start: int, day number, first day included, None for no limit
+        :param end: int, day number, last day included, None for no limit
+        :param users: list of str, None for all, same for projects, assets and departments
+        :return: dict, {tuple of the group_by values: seconds}, the dates as yyyy-mm-dd
+        '''
+        for column in group_by:
+            if column not in HOURS_COLUMNS:
+                raise ValueError(f"group by {column}, columns must be among {HOURS_COLUMNS}")
+        conditions = []
+        parameters = []
+        if start != None:
+            conditions.append('date >= ?')
+            parameters.append(start)
+        if end != None:
+            conditions.append('date <= ?')
+            parameters.append(end)
+        for column, values in (('user', users), ('project_name', projects), ('asset_name', assets), ('department', departments)):
+            if values:
+                conditions.append(f"{column} IN ({', '.join('?' * len(values))})")
+                parameters.extend(values)
+        names = ', '.join(group_by)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        rows = self.query(f'SELECT {names}, SUM(seconds) FROM hours {where} GROUP BY {names}', tuple(parameters))
+        date_index = group_by.index('date') if 'date' in group_by else None
+        totals = {}
+        for row in rows:
+            key = list(row[:-1])
+            if date_index != None:
+                key[date_index] = Date.fromordinal(key[date_index]).isoformat()
+            totals[tuple(key)] = row[-1]
+        return totals
+
+
+def main(argv=None):
+    group_names = {'user': 'user', 'day': 'date', 'week': 'year_week', 'project': 'project_name',
+                   'asset': 'asset_name', 'department': 'department'}
+    parser = argparse.ArgumentParser(description='Time spent by the team, gathered from the HoursTracker folders of the artists')
+    sub = parser.add_subparsers(dest='command', required=True)
+    scan = sub.add_parser('scan', help='read the files changed since the last scan')
+    scan.add_argument('store', help='studio database')
+    scan.add_argument('folders', nargs='+', help='data folders of the artists, glob patterns accepted')
+    scan.add_argument('--workers', type=int, help='processes reading the folders (default the number of CPUs)')
+    report = sub.add_parser('report', help='print the time spent')
+    report.add_argument('store', help='studio database')
+    report.add_argument('--from', dest='start', help='first day included, dd/mm/yy')
+    report.add_argument('--to', dest='end', help='last day included, dd/mm/yy')
+    report.add_argument('--by', action='append', choices=list(group_names), help='aggregation, repeat it to combine (default user)')
+    report.add_argument('--user', action='append', help='only this user, can be repeated')
+    report.add_argument('--project', action='append', help='only this project, can be repeated')
+    report.add_argument('--asset', action='append', help='only this asset, can be repeated')
+    report.add_argument('--department', action='append', help='only this department, can be repeated')
+    report.add_argument('--format', choices=list(FORMATS), default='table')
+    args = parser.parse_args(argv)
+
+    store = StudioStore(args.store)
+    if args.command == 'scan':
+        user_dirs = sorted({path for pattern in args.folders for path in glob.glob(pattern) if os.path.isdir(path)})
+        start = time.perf_counter()
+        stats = store.scan(user_dirs, args.workers)
+        print(f"{len(user_dirs)} folders, {stats['folders']} with changes: {stats['files']} files read, "
+              f"{stats['weeks']} weeks merged in {time.perf_counter() - start:.2f} s")
+    elif args.command == 'report':
+        group_by = args.by or ['user']
+        try:
+            start = dt.get_date_as_ordinal(args.start) if args.start else None
+            end = dt.get_date_as_ordinal(args.end) if args.end else None
+        except ValueError:
+            parser.error('dates are dd/mm/yy')
+        totals = store.totals(tuple(group_names[name] for name in group_by), start, end,
+                              args.user, args.project, args.asset, args.department)
+        FORMATS[args.format](get_rows(totals, group_by), group_by)
+    store.close()
+    log.flush()
+
+
+if __name__ == '__main__':
+    main()
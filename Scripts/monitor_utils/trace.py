@@ -0,0 +1,299 @@
+'''
+For Menhir FX
+
+Record the activity of a workstation in a trace file and replay it on the monitor with a virtual clock.
+
+Trace file, one json per line. The first line is the header:
+{"trace": 1, "start": epoch, "host": str, "user": str}
+then one event per line, t in seconds since the start:
+[t, "start", pid, exe]               a process with a window started
+[t, "close", pid]                    a process closed
+[t, "focus", pid]                    the foreground window changed, pid null for no process
+[t, "input"]                         the user used the mouse or the keyboard
+[t, "open", filename, [exe], pid]    Prism opened a scene
+
+Record on a workstation: python -m monitor_utils.trace record trace.jsonl
+While a recording runs, the plugins add their "open" events to it.
+Replay anywhere: python -m benchmarks.replay trace.jsonl
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import os
+import json
+import socket
+import argparse
+import traceback
+from datetime import datetime
+from pathlib import Path
+from threading import Thread, Event
+from time import perf_counter, process_time
+
+from monitor_utils.config import mhfx_path
+from monitor_utils.backends import get_backend, set_backend
+from monitor_utils.file import get_data, write_to_file
+from monitor_utils.mhfx_log import log
+import monitor_utils.clock as clock
+import monitor_utils.config.monitor as monitor
+
+TRACE_VERSION = 1
+OPENS_EXT = '.opens'
+
+
+def read_trace(path: str):
+    '''
+    :param path: str
+    :return: tuple (dict header, list of events sorted by time)
+    '''
+    header = {}
+    events = []
+    with open(path, 'r', encoding='utf-8') as trace_file:
+        for i, line in enumerate(trace_file):
+            line = line.strip()
+            if not line:
+                continue
+            if i == 0:
+                header = json.loads(line)
+                continue
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                # last line of a recording that was killed
+                pass
+    events.sort(key=lambda event: event[0])
+    return header, events
+
+def record_open(filename, executable: list, pid: int):
+    '''
+    Add an "open" event to the running recording, if any.
+    Called by the plugin when Prism opens a scene.
+
+    :param filename: str or Path
+    :param executable: list of str
+    :param pid: int
+    '''
+    try:
+        if not os.path.exists(mhfx_path.user_tmp_trace):
+            return
+        info = get_data(mhfx_path.user_tmp_trace)
+        event = [round(clock.time() - info.get('start'), 2), 'open', str(filename), list(executable), pid]
+        with open(info.get('path') + OPENS_EXT, 'a', encoding='utf-8') as opens_file:
+            opens_file.write(json.dumps(event) + '\n')
+    except:
+        log.error(traceback.format_exc())
+
+
+class TraceRecorder(object):
+    '''
+    class TraceRecorder that polls the backend and writes the changes to a trace file.
+    The user inputs are recorded with a resolution of input_resolution seconds, enough for AFK thresholds of minutes.
+    '''
+    def __init__(self, path: str, interval: float = 1.0, input_resolution: float = 10.0):
+        self.path = str(path)
+        self.interval = interval
+        self.input_resolution = input_resolution
+        self.start_time = None
+        self.trace_file = None
+        self.processes = {}
+        self.foreground = None
+        self.last_input = None
+        self.stop_event = Event()
+        self.thread = None
+
+    def elapsed(self):
+        return round(clock.time() - self.start_time, 2)
+
+    def write(self, *event):
+        self.trace_file.write(json.dumps([self.elapsed()] + list(event)) + '\n')
+
+    def start(self):
+        '''
+        Write the header and the processes already running, then poll in a thread.
+        '''
+        self.start_time = clock.time()
+        self.trace_file = open(self.path, 'w', encoding='utf-8')
+        header = {'trace': TRACE_VERSION, 'start': self.start_time, 'host': socket.gethostname(), 'user': get_backend().get_username()}
+        self.trace_file.write(json.dumps(header) + '\n')
+        write_to_file(json.dumps({'path': os.path.abspath(self.path), 'start': self.start_time}), mhfx_path.user_tmp_trace)
+        self.poll()
+        self.thread = Thread(target=self.run, name='HoursTrackerTrace', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.poll()
+            except:
+                log.error(traceback.format_exc())
+
+    def poll(self):
+        '''
+        Write the events since the previous poll.
+        '''
+        backend = get_backend()
+        visible = backend.get_visible_pids()
+        running = backend.list_processes()
+        processes = {pid: running[pid] for pid in visible if pid in running}
+
+        for pid, exe in processes.items():
+            if self.processes.get(pid) != exe:
+                self.write('start', pid, exe)
+        for pid in self.processes:
+            if pid not in processes:
+                self.write('close', pid)
+        self.processes = processes
+
+        foreground = (backend.get_current_window() or {}).get('pid')
+        if foreground != self.foreground:
+            self.write('focus', foreground)
+            self.foreground = foreground
+
+        last_input = clock.time() - backend.get_idle_seconds()
+        if self.last_input == None or last_input - self.last_input >= self.input_resolution:
+            self.trace_file.write(json.dumps([round(last_input - self.start_time, 2), 'input']) + '\n')
+            self.last_input = last_input
+        self.trace_file.flush()
+
+    def stop(self):
+        '''
+        Stop polling and add the "open" events of the plugins to the trace.
+        '''
+        self.stop_event.set()
+        if self.thread != None:
+            self.thread.join()
+        try:
+            if os.path.exists(mhfx_path.user_tmp_trace):
+                os.remove(mhfx_path.user_tmp_trace)
+            opens_path = self.path + OPENS_EXT
+            if os.path.exists(opens_path):
+                with open(opens_path, 'r', encoding='utf-8') as opens_file:
+                    self.trace_file.write(opens_file.read())
+                os.remove(opens_path)
+        finally:
+            self.trace_file.close()
+
+
+class TraceReplayer(object):
+    '''
+    class TraceReplayer that runs a Monitor on a trace, with a VirtualClock and a FakeBackend.
+    The monitor runs in the calling thread, the events are applied when the virtual time reaches them.
+    Run it with HOURSTRACKER_DATA_DIR on a temporary folder: the monitor writes its data files.
+    '''
+    def __init__(self, path: str, event_driven: bool = None):
+        self.path = str(path)
+        self.header, self.events = read_trace(self.path)
+        self.event_driven = event_driven
+        self.monitor = None
+        self.backend = None
+        self.finished = False
+        self.start_requested = False
+
+    def apply(self, event: list):
+        kind = event[1]
+        if kind == 'start':
+            self.backend.start_process(event[2], event[3])
+        elif kind == 'close':
+            self.backend.close_process(event[2])
+        elif kind == 'focus':
+            self.backend.set_foreground(event[2])
+        elif kind == 'input':
+            self.backend.set_last_input(event[0])
+        elif kind == 'open':
+            self.monitor.add_process(Path(event[2]), event[3], int(event[4]))
+            self.start_requested = True
+
+    def stop(self):
+        self.finished = True
+        self.monitor.is_running = False
+
+    def run(self):
+        '''
+        :return: dict, report of the replay
+        '''
+        # imported here, Monitor imports the whole monitor_utils package
+        from Monitor import Monitor
+        from monitor_utils.backends.fake import FakeBackend
+        from monitor_utils.metrics import metrics
+        from monitor_utils.tracker_data import TrackerData
+        from monitor_utils.data_management import get_week_data
+        import monitor_utils.journal as journal
+
+        virtual_clock = clock.VirtualClock(self.header.get('start'))
+        previous_clock = clock.get_clock()
+        clock.set_clock(virtual_clock)
+        self.backend = FakeBackend(self.header.get('user', 'replay_user'))
+        self.backend.set_last_input(0.0)
+        set_backend(self.backend)
+        if self.event_driven != None:
+            monitor.event_driven = self.event_driven
+        metrics_enabled = metrics.enabled
+        metrics.enabled = True
+        bytes_before = self.written_bytes(metrics)
+
+        try:
+            self.monitor = Monitor()
+            for event in self.events:
+                virtual_clock.call_at(event[0], lambda event=event: self.apply(event))
+            end = (self.events[-1][0] if self.events else 0) + monitor.total_cycle
+            virtual_clock.call_at(end, self.stop)
+
+            wall_start = perf_counter()
+            cpu_start = process_time()
+            while not self.finished:
+                if self.start_requested and not self.monitor.is_running:
+                    self.start_requested = False
+                    self.monitor.is_running = True
+                    self.monitor.run()
+                elif not virtual_clock.run_next():
+                    break
+            self.monitor.stop_thread()
+            journal.compact()
+            wall = perf_counter() - wall_start
+            cpu = process_time() - cpu_start
+
+            data = TrackerData(get_week_data())
+            hours = {}
+            for (date, project_name, asset_name, department), ps in data.project_sessions.items():
+                day = hours.setdefault(datetime.fromordinal(date).strftime('%d/%m/%y'), {})
+                day[f"{project_name}/{asset_name}/{department}"] = ps.seconds
+
+            return {
+                'trace': self.path,
+                'events': len(self.events),
+                'event_driven': monitor.event_driven,
+                'virtual_seconds': virtual_clock.monotonic(),
+                'wall_seconds': wall,
+                'cpu_seconds': cpu,
+                'speed': virtual_clock.monotonic() / wall if wall > 0 else None,
+                'written_bytes': self.written_bytes(metrics) - bytes_before,
+                'total_seconds': data.get_week_total(),
+                'hours': hours,
+            }
+        finally:
+            metrics.enabled = metrics_enabled
+            clock.set_clock(previous_clock)
+
+    @staticmethod
+    def written_bytes(metrics):
+        return sum(value for (name, _), value in metrics.counters.items() if name == 'written_bytes_total')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Record the activity of this workstation in a trace file.')
+    parser.add_argument('command', choices=['record'])
+    parser.add_argument('path', help='trace file to write')
+    parser.add_argument('--interval', type=float, default=1.0, help='seconds between two polls')
+    args = parser.parse_args(argv)
+
+    recorder = TraceRecorder(args.path, args.interval)
+    recorder.start()
+    print(f"Recording to {args.path}, Ctrl+C to stop.")
+    try:
+        while recorder.thread.is_alive():
+            recorder.thread.join(1)
+    except KeyboardInterrupt:
+        pass
+    recorder.stop()
+
+
+if __name__ == '__main__':
+    main()
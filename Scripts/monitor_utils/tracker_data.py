@@ -0,0 +1,352 @@
+'''
+For Menhir FX
+
+In-memory model of the tracker data (hours.json) with hash indexes on
+days, projects, project sessions and asset sessions.
+
+Times are kept as integer seconds and dates as day numbers (date.toordinal).
+The '%d/%m/%y' and '%H:%M:%S' strings of hours.json are only generated by as_dict().
+
+The totals of the project sessions, projects, departments, days and of the week are rollups:
+a change of the time of an asset session adds its delta to its ancestors only,
+so every total is read without summing the sessions.
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import monitor_utils.date as dt
+
+SCHEMA_VERSION = 3 # 1: times as strings only, 2: times also as 'total_seconds', 3: totals of the projects, departments, days and week
+
+
+class AssetSession(object):
+    '''
+    class AssetSession that represents one opening of an asset.
+    start and last are seconds since midnight, seconds is the time spent.
+    '''
+    __slots__ = ('start', 'last', 'seconds')
+
+    def __init__(self, start: int, last: int = None, seconds: int = 0):
+        self.start = start
+        self.last = start if last == None else last
+        self.seconds = seconds
+
+    def as_dict(self):
+        return {
+            'start_time': dt.get_seconds_as_time(self.start),
+            'last_action_time': dt.get_seconds_as_time(self.last),
+            'total_time': dt.get_seconds_as_time(self.seconds),
+            'total_seconds': self.seconds
+        }
+
+
+class ProjectSession(object):
+    '''
+    class ProjectSession that represents the work of a day on an asset in a department.
+    '''
+    __slots__ = ('asset_name', 'department', 'asset_sessions', 'seconds', 'project')
+
+    def __init__(self, asset_name: str, department: str, project=None):
+        self.asset_name = asset_name
+        self.department = department
+        self.asset_sessions = []
+        self.seconds = 0
+        self.project = project
+
+    def as_dict(self):
+        return {
+            'asset_name': self.asset_name,
+            'department': self.department,
+            'asset_sessions': [s.as_dict() for s in self.asset_sessions],
+            'total_time': dt.get_seconds_as_time(self.seconds),
+            'total_seconds': self.seconds
+        }
+
+
+class Project(object):
+    '''
+    class Project that represents the work of a day on a project.
+    '''
+    __slots__ = ('project_name', 'project_sessions', 'seconds', 'day')
+
+    def __init__(self, project_name: str, day=None):
+        self.project_name = project_name
+        self.project_sessions = []
+        self.seconds = 0
+        self.day = day
+
+    def as_dict(self):
+        return {
+            'project_name': self.project_name,
+            'project_sessions': [ps.as_dict() for ps in self.project_sessions],
+            'total_seconds': self.seconds
+        }
+
+
+class Day(object):
+    '''
+    class Day that represents a day of work. date is a day number (date.toordinal).
+    '''
+    __slots__ = ('date', 'projects', 'seconds', 'departments')
+
+    def __init__(self, date: int):
+        self.date = date
+        self.projects = []
+        self.seconds = 0
+        self.departments = {}
+
+    def as_dict(self):
+        return {
+            'date': dt.get_ordinal_as_date_string(self.date),
+            'projects': [p.as_dict() for p in self.projects],
+            'total_seconds': self.seconds,
+            'department_totals': dict(self.departments)
+        }
+
+
+class TrackerData(object):
+    '''
+    class TrackerData that holds the tracker data and keeps indexes on it.
+    as_dict() returns the hours.json schema.
+
+    Index keys:
+    days : date
+    projects : (date, project_name)
+    project sessions : (date, project_name, asset_name, department)
+    asset sessions : (date, project_name, asset_name, department, start_time)
+
+    Totals of the week: seconds, project_totals by project_name, department_totals by department.
+    The totals in a hours.json are not read, they are rebuilt from the asset sessions.
+    '''
+    def __init__(self, data: dict = None):
+        self.days = []
+        self.header = {}
+        self.day_index = {}
+        self.projects = {}
+        self.project_sessions = {}
+        self.asset_sessions = {}
+        self.seconds = 0
+        self.project_totals = {}
+        self.department_totals = {}
+        if data:
+            self.load(data)
+
+    def load(self, data: dict):
+        '''
+        Load a hours.json dict. Files of all schema versions are accepted.
+
+        :param data: dict
+        '''
+        for key in ('user_id', 'year', 'week', 'week_description'):
+            if key in data:
+                self.header[key] = data.get(key)
+
+        for d in data.get('days', []):
+            day = self._add_day(dt.get_date_as_ordinal(d.get('date')))
+            for p in d.get('projects', []):
+                project = self._add_project(day, p.get('project_name'))
+                for ps_data in p.get('project_sessions', []):
+                    ps = self._add_project_session(day.date, project, ps_data.get('asset_name'), ps_data.get('department'))
+                    for s in ps_data.get('asset_sessions', []):
+                        session = AssetSession(
+                            dt.get_time_as_seconds(s.get('start_time')),
+                            dt.get_time_as_seconds(s.get('last_action_time')),
+                            self._load_seconds(s)
+                        )
+                        self._add_asset_session(day.date, project, ps, session)
+
+    @staticmethod
+    def _load_seconds(session: dict):
+        seconds = session.get('total_seconds')
+        if seconds == None:
+            # schema version 1
+            seconds = dt.get_time_as_seconds(session.get('total_time'))
+        return seconds
+
+    def _add_day(self, date: int):
+        day = self.day_index.get(date)
+        if day == None:
+            day = Day(date)
+            self.days.append(day)
+            self.day_index[date] = day
+        return day
+
+    def _add_project(self, day: Day, project_name: str):
+        key = (day.date, project_name)
+        project = self.projects.get(key)
+        if project == None:
+            project = Project(project_name, day)
+            day.projects.append(project)
+            self.projects[key] = project
+        return project
+
+    def _add_project_session(self, date: int, project: Project, asset_name: str, department: str):
+        key = (date, project.project_name, asset_name, department)
+        ps = self.project_sessions.get(key)
+        if ps == None:
+            ps = ProjectSession(asset_name, department, project)
+            project.project_sessions.append(ps)
+            self.project_sessions[key] = ps
+        return ps
+
+    def _add_asset_session(self, date: int, project: Project, ps: ProjectSession, session: AssetSession):
+        key = (date, project.project_name, ps.asset_name, ps.department, session.start)
+        # latest session wins, as the old reversed() lookups did
+        self.asset_sessions[key] = session
+        ps.asset_sessions.append(session)
+        self._add_seconds(ps, session.seconds)
+        return session
+
+    def _add_seconds(self, ps: ProjectSession, delta: int):
+        '''
+        Add the delta of an asset session to the totals of its ancestors.
+        '''
+        if delta == 0:
+            return
+        project = ps.project
+        day = project.day
+        ps.seconds += delta
+        project.seconds += delta
+        day.seconds += delta
+        day.departments[ps.department] = day.departments.get(ps.department, 0) + delta
+        self.seconds += delta
+        self.project_totals[project.project_name] = self.project_totals.get(project.project_name, 0) + delta
+        self.department_totals[ps.department] = self.department_totals.get(ps.department, 0) + delta
+
+    @staticmethod
+    def project_session_key(date: int, entity: dict):
+        '''
+        Return the index key of the project session of the entity at the given date.
+
+        :param date: int, day number
+        :param entity: dict
+        :return: tuple
+        '''
+        return (date, entity.get('project_name'), entity.get('asset_name'), entity.get('department'))
+
+    def has_day(self, date: int):
+        '''
+        Checks if the given date exists in the data
+
+        :param date: int, day number
+        :return: bool
+        '''
+        return date in self.day_index
+
+    def get_project_session(self, date: int, entity: dict):
+        '''
+        :param date: int, day number
+        :param entity: dict
+        :return: ProjectSession or None
+        '''
+        return self.project_sessions.get(self.project_session_key(date, entity))
+
+    def get_asset_session(self, date: int, entity: dict, start: int):
+        '''
+        :param date: int, day number
+        :param entity: dict
+        :param start: int, seconds since midnight when the session was opened
+        :return: AssetSession or None
+        '''
+        return self.asset_sessions.get(self.project_session_key(date, entity) + (start,))
+
+    def get_or_create_session(self, date: int, entity: dict, start: int):
+        '''
+        Return the project session and the asset session of the entity.
+        Create the day, the project, the project session and the asset session if needed.
+
+        :param date: int, day number
+        :param entity: dict
+        :param start: int, seconds since midnight when the session was opened
+        :return: tuple (ProjectSession, AssetSession)
+        '''
+        ps_key = self.project_session_key(date, entity)
+        session = self.asset_sessions.get(ps_key + (start,))
+        if session != None:
+            return self.project_sessions[ps_key], session
+
+        ps = self.project_sessions.get(ps_key)
+        project = self.projects.get(ps_key[:2])
+        if ps == None:
+            if project == None:
+                project = self._add_project(self._add_day(date), entity.get('project_name'))
+            ps = self._add_project_session(date, project, entity.get('asset_name'), entity.get('department'))
+        session = self._add_asset_session(date, project, ps, AssetSession(start))
+        return ps, session
+
+    def set_session_time(self, ps: ProjectSession, session: AssetSession, seconds: int, last: int):
+        '''
+        Set the time spent in an asset session and keep the project session total up to date.
+
+        :param ps: ProjectSession, parent of the session
+        :param session: AssetSession
+        :param seconds: int, time spent in the session
+        :param last: int, seconds since midnight of the last action
+        '''
+        self._add_seconds(ps, seconds - session.seconds)
+        session.seconds = seconds
+        session.last = last
+
+    def get_week_total(self):
+        '''
+        :return: int, seconds spent in the week
+        '''
+        return self.seconds
+
+    def get_day_total(self, date: int):
+        '''
+        :param date: int, day number
+        :return: int, seconds spent in the day
+        '''
+        day = self.day_index.get(date)
+        return day.seconds if day != None else 0
+
+    def get_project_total(self, project_name: str, date: int = None):
+        '''
+        :param project_name: str
+        :param date: int, day number, None for the week
+        :return: int, seconds spent on the project
+        '''
+        if date == None:
+            return self.project_totals.get(project_name, 0)
+        project = self.projects.get((date, project_name))
+        return project.seconds if project != None else 0
+
+    def get_department_total(self, department: str, date: int = None):
+        '''
+        :param department: str
+        :param date: int, day number, None for the week
+        :return: int, seconds spent in the department
+        '''
+        if date == None:
+            return self.department_totals.get(department, 0)
+        day = self.day_index.get(date)
+        return day.departments.get(department, 0) if day != None else 0
+
+    def set_header(self, user_id: str, year: str, week: str, week_description: str):
+        '''
+        Set the week information of the data.
+        '''
+        self.header['user_id'] = user_id
+        self.header['year'] = year
+        self.header['week'] = week
+        self.header['week_description'] = week_description
+
+    def get(self, key: str, default=None):
+        '''
+        Get a week information, like a dict.
+        '''
+        return self.header.get(key, default)
+
+    def as_dict(self):
+        '''
+        Return the tracker data in the hours.json schema.
+
+        :return: dict
+        '''
+        data = {'days': [d.as_dict() for d in self.days]}
+        data.update(self.header)
+        data['total_seconds'] = self.seconds
+        data['project_totals'] = dict(self.project_totals)
+        data['department_totals'] = dict(self.department_totals)
+        data['version'] = SCHEMA_VERSION
+        return data
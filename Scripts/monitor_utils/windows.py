@@ -1,22 +1,22 @@
 '''
 For Menhir FX
+
+All the interactions with the operating system, through the backend of monitor_utils.backends.
+
 author: Angele Sionneau asionneau@artfx.fr
 '''
-import win32gui
-import win32process
-import win32api
-import re
-import time
-import ctypes
 import traceback
-import win32com.client
 import ast
-from pathlib import Path
+from threading import Lock
+from functools import lru_cache
 
-from monitor_utils.config.mhfx_path import file_template, file_template_bonus
+from monitor_utils.backends import get_backend
 import monitor_utils.config.monitor as monitor
 from monitor_utils.mhfx_log import log
+import monitor_utils.clock as clock
+from monitor_utils.metrics import metrics
 
+@metrics.timed('stage_seconds', stage='get_current_window')
 def get_current_window():
     '''
     Get the current active window and return it as a dict.
@@ -24,101 +24,46 @@ def get_current_window():
     :return: dict {'path':str, 'pid':int, 'title':str, 'name':str}
     '''
     try:
-        active_window = win32gui.GetForegroundWindow()
-        _, pid = win32process.GetWindowThreadProcessId(active_window)
-
-        MAX_PATH = 260
-        path_buffer = ctypes.create_unicode_buffer(MAX_PATH)
-        h_process = ctypes.windll.kernel32.OpenProcess(1040, False, pid)
-
-        if h_process:
-            ctypes.windll.psapi.GetModuleFileNameExW(h_process, None, path_buffer, MAX_PATH)
-            ctypes.windll.kernel32.CloseHandle(h_process)
-            file_path = path_buffer.value
-        else:
-            return {'path': None, 'pid': None, 'title': None, 'name': None}
-
-        title = win32gui.GetWindowText(active_window)
-        name = file_path.split('\\')[-1]
-
-        return {'path': file_path, 'pid': pid, 'title': title, 'name': name}
+        return get_backend().get_current_window()
     except:
-        log(traceback.format_exc())
+        log.error(traceback.format_exc())
 
-def convert_file_to_data(filename, template):
-    '''
-    Function used by get_entity to convert a filename to a dict.
-    
-    :param filename: str or Path object
-    '''
-    data = {}
-    try : 
-        template_parts = re.findall(r'{(.*?)}', template)
-
-        regex_pattern = template
-        regex_pattern = regex_pattern.replace('{', r'(?P<').replace('}', r'>.*?)')
+_visible_pids = frozenset()
+_visible_pids_time = None
+_visible_pids_lock = Lock()
 
-        matches = re.match(regex_pattern, str(filename))
-        if matches:
-            for template_part in template_parts:
-                data[template_part] = matches.group(template_part)
-        
-        return data
-    except Exception as e:
-        log(traceback.format_exc())
-
-def get_entity(filename):
+def get_visible_pids(max_age=None):
     '''
-    Convert a filename to a dict with info the monitor needs.
+    Get the pids of all the processes with a visible window.
+    Windows are enumerated once and the result is shared by all the checks for max_age seconds.
 
-    :param filename: str or Path object
-    :return: dict
+    :param max_age: float, by default monitor.liveness_cache_sec. 0 forces a new enumeration.
+    :return: frozenset of int
     '''
-    filename = str(filename).replace('\\', '/')
-    try :
-        data = convert_file_to_data(filename, file_template)
-
-        try:
-            data.get('asset_subtype').lower()
-        except:
-            if monitor.debug_mode:
-                log("using bonus template")
-            data = convert_file_to_data(filename, file_template_bonus)
-            data['asset_subtype'] = data.get('asset_type')
-            try:
-                data.get('asset_subtype').lower()
-            except:
-                if monitor.debug_mode:
-                    log("No template work for this asset")
-                filename_path = Path(filename)
-                data = {
-                    'asset_type': 'unknown',
-                    'asset_subtype': '',
-                    'department': '',
-                    'task': '',
-                    'asset_name': str(filename_path.name),
-                    'project_name': str(filename_path.stem)
-                }
-
-        entity ={
-            'name': filename,
-            'department': data.get('task'),
-            'asset_type': data.get('asset_type').lower(),
-            'project_name': data.get('project_name')
-        }
-
-        if "shot" in entity.get('asset_type'):
-            entity['asset_name'] = f"{data.get('asset_subtype')} {data.get('asset_name')}"
-        else:
-            entity['asset_name'] = data.get('asset_name')
-        
-        return entity
-    
-    except:
-        log(traceback.format_exc())
-        log("seems your file can't be convert to object, please verify you're in pipe")
-
+    global _visible_pids, _visible_pids_time
+    if max_age == None:
+        max_age = monitor.liveness_cache_sec
+
+    with _visible_pids_lock:
+        now = clock.monotonic()
+        if _visible_pids_time != None and now - _visible_pids_time < max_age:
+            return _visible_pids
+
+        pids = get_backend().get_visible_pids()
+        metrics.inc('window_enumerations_total')
+        _visible_pids = frozenset(pids)
+        _visible_pids_time = clock.monotonic()
+        return _visible_pids
+
+def invalidate_visible_pids():
+    '''
+    Force the next get_visible_pids to enumerate the windows.
+    '''
+    global _visible_pids_time
+    with _visible_pids_lock:
+        _visible_pids_time = None
 
+@metrics.timed('stage_seconds', stage='does_process_exists')
 def does_process_exists(pid):
     '''
     Verify if the process still exists in windows and has an active window.
@@ -129,26 +74,13 @@ def does_process_exists(pid):
     try:
         pid = int(pid)  # Make sure pid is an integer
 
-        def callback(hwnd, hwnds):
-            '''
-            Callback function for win32gui.EnumWindows. It's called for each window handle and 
-            adds the handle to the list if the associated process has the target pid.
-            '''
-            _, process_id = win32process.GetWindowThreadProcessId(hwnd)
-            if process_id == pid and win32gui.IsWindowVisible(hwnd):
-                hwnds.append(hwnd)
-            return True
-
-        # Get all window handles associated with the target process
-        hwnds = []
-        win32gui.EnumWindows(callback, hwnds)
-
-        # If there's at least one window handle, the process is an application process
+        # If there's at least one visible window, the process is an application process
+        exists = pid in get_visible_pids()
         if monitor.debug_mode:
-            log(f"checking if process {pid} exists : {bool(hwnds)}")
-        return bool(hwnds)
+            log(f"checking if process {pid} exists : {exists}")
+        return exists
     except Exception as e:
-        print(str(e))
+        log.error(traceback.format_exc())
         return False
 
 def get_windows_username():
@@ -159,59 +91,119 @@ def get_windows_username():
     username (str): The username of the currently logged-in user.
     '''
     try:
-        username = win32api.GetUserName()
+        username = get_backend().get_username()
         return username
     except:
         return "Username unknown"
 
+class ProcessTable(object):
+    '''
+    class ProcessTable, a snapshot of the running processes with an index executable name -> pids.
+    The snapshot is taken by the backend, with CreateToolhelp32Snapshot on Windows.
+    The previous snapshot is kept to find the processes started since.
+    '''
+    def __init__(self):
+        self.processes = {}
+        self.by_exe = {}
+        self.previous_pids = None
+        self.creation_times = {}
+
+    def refresh(self):
+        '''
+        Take a new snapshot of the running processes.
+        '''
+        processes = get_backend().list_processes()
+
+        by_exe = {}
+        for pid, exe in processes.items():
+            by_exe.setdefault(exe.lower(), set()).add(pid)
+
+        if self.processes:
+            self.previous_pids = set(self.processes)
+        self.processes = processes
+        self.by_exe = by_exe
+        # forget the creation times of the closed processes, pids are reused
+        self.creation_times = {pid: t for pid, t in self.creation_times.items() if pid in processes}
+
+    def get_pids(self, process_names: list):
+        '''
+        :param process_names: list of executable names
+        :return: set of int, pids of the processes with one of the names
+        '''
+        pids = set()
+        for name in process_names:
+            pids.update(self.by_exe.get(name.lower(), ()))
+        return pids
+
+    def is_new(self, pid: int):
+        '''
+        :return: bool, True if the process started since the previous snapshot
+        '''
+        return self.previous_pids != None and pid not in self.previous_pids
+
+    def get_creation_time(self, pid: int):
+        '''
+        :param pid: int
+        :return: int, creation time of the process, 0 if unknown
+        '''
+        creation_time = self.creation_times.get(pid)
+        if creation_time == None:
+            creation_time = get_backend().get_creation_time(pid)
+            self.creation_times[pid] = creation_time
+        return creation_time
+
+process_table = ProcessTable()
+
+@lru_cache(maxsize=64)
+def parse_executable(executable: str):
+    '''
+    Convert the executable of a process infos, like this "['maya.exe']", to a tuple.
+
+    :param executable: string
+    :return: tuple of string
+    '''
+    return tuple(ast.literal_eval(executable))
+
 def get_pid_by_process_name(process_names: list, monitor_processes: dict):
     '''
     Somehow thanks to the process names, get the pid of the new process opened.
+    The candidates are the processes with one of the names that aren't monitored yet.
+    A process started since the previous snapshot is preferred, then the most recently created.
 
     :param process_names: list
     :param monitor_processes: dict
 
     :return: pid of the process (int) or None if not found.
     '''
-    # remove the process from the list if not right monitor neither right executable
     try:
-        monitor_processes_copy = monitor_processes.copy()
-        for pid, infos in monitor_processes_copy.items():
-            if process_names[0] not in ast.literal_eval(infos.get('executable')) or not does_process_exists(pid):
-                monitor_processes.pop(pid)
-
-        found = False
-        incr = 0
-        timeout = monitor.wait_sec
-        pids = []
-
-        while found == False and incr < timeout:
+        # pids already monitored with the same executable
+        monitored = set()
+        for pid, infos in monitor_processes.items():
+            if process_names[0] in parse_executable(infos.get('executable')) and does_process_exists(pid):
+                monitored.add(int(pid))
+
+        deadline = clock.monotonic() + monitor.wait_sec
+        while True:
             try:
-                wmi = win32com.client.GetObject("winmgmts:")
-                processes = wmi.InstancesOf("Win32_Process")
-                for process in processes:
-                    proc_name = process.Properties_("Name").Value
-                    if proc_name in process_names:
-                        pids.append(process.Properties_("ProcessId").Value)
+                process_table.refresh()
+                candidates = process_table.get_pids(process_names) - monitored
+                if len(candidates) > 0:
+                    new_candidates = [pid for pid in candidates if process_table.is_new(pid)]
+                    if len(new_candidates) > 0:
+                        candidates = new_candidates
+                    return max(candidates, key=process_table.get_creation_time)
             except Exception as e:
-                log(traceback.format_exc())
-
-            if len(pids) > len(monitor_processes) and len(pids) > 0:
-                found = True
-            else:
-                time.sleep(1)
-                incr += 1
-        if len(pids) > len(monitor_processes):
-            keys = monitor_processes.keys()
-            keys_int = [int(num) for num in keys]
-            diff = set(pids) - set(keys_int)
-            return list(diff)[0]
-        
+                log.error(traceback.format_exc())
+
+            if clock.monotonic() >= deadline:
+                break
+            clock.sleep(monitor.process_poll_sec)
+
         if monitor.debug_mode:
             log(f"No pid associated with this process.")
         return None
     except:
-        log(traceback.format_exc())
+        log.error(traceback.format_exc())
 
 def is_user_afk(afk_time: int):
     '''
@@ -224,17 +216,30 @@ def is_user_afk(afk_time: int):
     is_afk (bool): True if the user is inactive, False otherwise.
     '''
     try:
-        # Get when the last input event happened
-        last_input_time = win32api.GetLastInputInfo()
-
-        # Get the current time
-        current_time = win32api.GetTickCount()
-
-        # Calculate the elapsed time
-        elapsed_time = (current_time - last_input_time) / 1000
+        # Elapsed time since the last input event
+        elapsed_time = get_backend().get_idle_seconds()
         if monitor.debug_mode:
             log(f"Last user input happened {elapsed_time} seconds ago. max allowed = {afk_time}")
         
         return elapsed_time >= afk_time
     except:
-        log(traceback.format_exc())
\ No newline at end of file
+        log.error(traceback.format_exc())
+
+def get_user_idle_seconds():
+    '''
+    :return: float, seconds since the last user input, 0 if unknown
+    '''
+    try:
+        return get_backend().get_idle_seconds()
+    except:
+        log.error(traceback.format_exc())
+        return 0
+
+def watch_foreground(callback):
+    '''
+    Call callback(pid) each time the foreground window changes.
+
+    :param callback: function int or None -> None, called from another thread
+    :return: function without parameter that stops the watch
+    '''
+    return get_backend().watch_foreground(callback)
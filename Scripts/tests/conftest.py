@@ -0,0 +1,118 @@
+'''
+For Menhir FX
+
+The user data of the tests goes to a temporary folder and the fake backend is used,
+the U: drive and the operating system are never touched.
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import os
+import sys
+import glob
+import shutil
+import tempfile
+from datetime import datetime
+
+# before the first import of monitor_utils: its paths and backend are chosen at import
+os.environ['HOURSTRACKER_DATA_DIR'] = tempfile.mkdtemp(prefix='hourstracker_tests_')
+os.environ['HOURSTRACKER_BACKEND'] = 'fake'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from monitor_utils.config import mhfx_path
+
+ENTITY = {'project_name': 'ProjA', 'asset_name': 'Bob', 'department': 'FX'}
+NOW = datetime(2026, 10, 12, 15, 0, 0)
+
+
+@pytest.fixture
+def user_data():
+    '''
+    An empty user data folder for each test.
+    '''
+    import monitor_utils.data_management as dm
+    for path in glob.glob(os.path.join(mhfx_path.user_data_dir, '*')):
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+    os.makedirs(mhfx_path.user_tmp_processes_dir, exist_ok=True)
+    os.makedirs(mhfx_path.user_data_backup, exist_ok=True)
+    dm.data_store.invalidate()
+    yield mhfx_path.user_data_dir
+
+@pytest.fixture
+def backend():
+    '''
+    A FakeBackend in place of the operating system, scripted by the test.
+    '''
+    from monitor_utils.backends import get_backend, set_backend
+    from monitor_utils.backends.fake import FakeBackend
+    from monitor_utils.windows import invalidate_visible_pids
+    previous = get_backend()
+    backend = FakeBackend()
+    set_backend(backend)
+    invalidate_visible_pids()
+    yield backend
+    set_backend(previous)
+    invalidate_visible_pids()
+
+@pytest.fixture
+def storage(user_data, monkeypatch):
+    '''
+    storage(name), restart on the json, sqlite or days storage: the store of the previous one is closed.
+    Back to the json storage after the test.
+    '''
+    import monitor_utils.config.monitor as monitor
+    import monitor_utils.partitions as partitions
+    import monitor_utils.sqlite_store as sqlite_store
+    def use_storage(name: str):
+        if sqlite_store._store != None:
+            sqlite_store._store.close()
+        monkeypatch.setattr(sqlite_store, '_store', None)
+        monkeypatch.setattr(partitions, '_partitions', None)
+        monkeypatch.setattr(monitor, 'storage', name)
+    yield use_storage
+    use_storage('json')
+
+@pytest.fixture
+def entity():
+    '''
+    The entity of the sessions of the tests, a shot of ProjA.
+    '''
+    return dict(ENTITY)
+
+@pytest.fixture
+def now():
+    '''
+    When the sessions of the tests are used, a monday of week 42 of 2026.
+    '''
+    return NOW
+
+@pytest.fixture
+def record():
+    '''
+    record(time, second=0, first='14:00:00', entity=ENTITY), a journal record like journal.create_record,
+    written second seconds after NOW.
+    '''
+    def create_record(time: int, second: int = 0, first: str = '14:00:00', entity: dict = ENTITY):
+        return {'ts': NOW.timestamp() + second, 'pid': '100', 'entity': dict(entity), 'first': first, 'time': time}
+    return create_record
+
+@pytest.fixture
+def session_seconds():
+    '''
+    session_seconds(entity=ENTITY, date=NOW), the time of a project session in hours.json, None if there is none.
+    '''
+    from monitor_utils.file import get_data
+    from monitor_utils.tracker_data import TrackerData
+    def get_session_seconds(entity: dict = ENTITY, date: datetime = NOW):
+        data = TrackerData(get_data(mhfx_path.user_data_json))
+        ps = data.project_sessions.get((date.toordinal(), entity['project_name'], entity['asset_name'], entity['department']))
+        return ps.seconds if ps != None else None
+    return get_session_seconds
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(os.environ['HOURSTRACKER_DATA_DIR'], ignore_errors=True)
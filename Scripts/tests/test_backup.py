@@ -0,0 +1,111 @@
+'''
+For Menhir FX
+
+Archive of the week at the rollover.
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import os
+import json
+import glob
+
+import monitor_utils.file as file
+from monitor_utils.backup import archive, get_view_path
+from monitor_utils.config import mhfx_path
+
+WEEK = {'user_id': 'bob', 'year': '2026', 'week': '41', 'week_description': 'Du 05/10/26 au 11/10/26', 'days': []}
+
+
+def write_log(path: str, content: str):
+    with open(path, 'w', encoding='utf-8') as log_file:
+        log_file.write(content)
+
+
+def test_archived_log_includes_rotated_files(user_data):
+    write_log(mhfx_path.user_log + '.2', 'monday ')
+    write_log(mhfx_path.user_log + '.1', 'wednesday ')
+    write_log(mhfx_path.user_log, 'friday ')
+
+    file.backup_data(WEEK)
+
+    assert archive.read_week('41', '2026').get('log').startswith('monday wednesday friday ')
+    # the next week starts without the log of this one
+    assert file.get_rotated_logs() == []
+
+
+def read_js(path: str):
+    with open(path, 'r', encoding='utf-8') as js_file:
+        content = js_file.read()
+    assert content.startswith('var data = ') and content.endswith(';\n')
+    return json.loads(content[len('var data = '):-2])
+
+
+def test_backups_list_every_archived_week(user_data):
+    for week in range(31, 42):
+        file.backup_data(dict(WEEK, week=str(week), week_description="Semaine d'octobre"))
+    # a view removed by hand is written again at the next rollover
+    os.remove(get_view_path('31', '2026'))
+    file.backup_data(dict(WEEK, week_description="Semaine d'octobre"))
+
+    backups = read_js(mhfx_path.user_list_backup_js).get('backups')
+    assert [b.get('week') for b in backups] == [str(week) for week in range(41, 30, -1)]
+    assert backups[0].get('week_description') == "Semaine d'octobre"
+    # hours.html can open every week of the list
+    assert all(os.path.exists(get_view_path(b.get('week'), b.get('year'))) for b in backups)
+
+
+def test_legacy_views_are_converted(user_data):
+    path = get_view_path('39', '2026')
+    write_log(path, "var data = '" + json.dumps(dict(WEEK, week='39')) + "'")
+
+    assert archive.convert_legacy_views() == 1
+    assert read_js(path).get('week') == '39'
+
+
+def test_reset_removes_rotated_logs(user_data):
+    write_log(mhfx_path.user_log + '.1', 'last week')
+
+    file.reset_user_data()
+
+    assert not os.path.exists(mhfx_path.user_log + '.1')
+
+
+def test_reset_prunes_metrics_of_closed_processes(user_data, backend):
+    backend.start_process(1111, 'houdini.exe')
+    os.makedirs(mhfx_path.user_metrics_dir, exist_ok=True)
+    for pid in (1111, 2222):
+        write_log(os.path.join(mhfx_path.user_metrics_dir, f'{pid}.prom'), '')
+
+    file.reset_user_data()
+
+    assert sorted(os.listdir(mhfx_path.user_metrics_dir)) == ['1111.prom']
+
+
+def test_corrupted_index_is_rebuilt(user_data):
+    file.backup_data(dict(WEEK, week='40'))
+    file.backup_data(WEEK)
+    # index.json half-synced from the network share
+    with open(mhfx_path.user_backup_index, 'r+') as index_file:
+        index_file.truncate(10)
+
+    assert [e.get('week') for e in archive.entries()] == ['41', '40']
+    file.backup_data(dict(WEEK, week='42'))
+
+    assert [e.get('week') for e in archive.entries()] == ['42', '41', '40']
+    assert archive.get_hours('40', '2026').get('week') == '40'
+    assert len(glob.glob(glob.escape(mhfx_path.user_backup_index) + '.*.corrupted')) == 1
+
+
+def test_rollover_summarizes_without_process_pool(user_data, monkeypatch):
+    import monitor_utils.history as history
+    def no_pool(*args, **kwargs):
+        raise AssertionError('process pool started in the DCC')
+    monkeypatch.setattr(history, 'ProcessPoolExecutor', no_pool)
+    # the first rollover after the deployment migrates the weeks backed up before the archive
+    for week in range(30, 30 + history.PARALLEL_MIN_WEEKS):
+        with open(f"{mhfx_path.user_data_backup}{week}_2026_hours.json", 'w') as json_file:
+            json.dump(dict(WEEK, week=str(week)), json_file)
+
+    file.backup_data(WEEK)
+
+    assert len(history.history_index.load().get('weeks')) == history.PARALLEL_MIN_WEEKS + 1
@@ -0,0 +1,83 @@
+'''
+For Menhir FX
+
+Re-election of the tracker daemon when the DCC that hosts it exits.
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import os
+
+import monitor_utils.daemon as daemon
+from monitor_utils.config import mhfx_path
+from monitor_utils.daemon import TrackerDaemon, DaemonClient
+from monitor_utils.data_management import get_processes, push_processes
+
+
+class StubMonitor(object):
+    '''
+    The interface of Monitor used by the daemon, without the monitor thread.
+    '''
+    def __init__(self, monitor_id: str):
+        self.id = monitor_id
+        self.is_running = False
+        self.opened = []
+
+    def add_process(self, filename, executable, pid):
+        self.opened.append((str(filename), pid))
+        return pid
+
+    def start_thread(self):
+        self.is_running = True
+
+    def saveClosedProcess(self, save=True):
+        pass
+
+
+def get_info_path():
+    return os.path.join(mhfx_path.user_tmp_dir, 'daemon.json')
+
+
+def test_new_daemon_adopts_processes(user_data):
+    info_path = get_info_path()
+    previous = TrackerDaemon(info_path, StubMonitor('host_a'))
+    previous.start()
+    push_processes({'1111': {'filename': 'bob_fx_v001.hip', 'monitor_id': 'host_a', 'status': 'ACTIVE'}}, 'host_a')
+    # the DCC of the daemon exits
+    previous.shutdown()
+
+    elected = TrackerDaemon(info_path, StubMonitor('host_b'))
+    elected.start()
+    try:
+        assert get_processes('host_a') == {}
+        assert get_processes('host_b')['1111']['monitor_id'] == 'host_b'
+        # the monitor saves the time of the adopted processes
+        assert elected.monitor.is_running == True
+    finally:
+        elected.shutdown()
+
+
+def test_heartbeat_elects_a_new_daemon(user_data, monkeypatch):
+    info_path = get_info_path()
+    previous = TrackerDaemon(info_path, StubMonitor('host_a'))
+    previous.start()
+    client = DaemonClient(info_path)
+    assert client.connect() == True
+    client.opened['bob_fx_v001.hip'] = (['houdini.exe'], 2222)
+
+    elected = []
+    def host_daemon(path):
+        elected.append(TrackerDaemon(path, StubMonitor('host_b')))
+        elected[0].start()
+        return True
+    monkeypatch.setattr(daemon, 'host_daemon', host_daemon)
+
+    previous.shutdown()
+    try:
+        # one beat of the heartbeat
+        assert client.request({'cmd': 'hello'}).get('monitor_id') == 'host_b'
+        assert elected[0].monitor.opened == [('bob_fx_v001.hip', 2222)]
+        assert client.id == 'host_b'
+    finally:
+        client.close()
+        for tracker_daemon in elected:
+            tracker_daemon.shutdown()
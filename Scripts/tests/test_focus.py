@@ -0,0 +1,50 @@
+'''
+For Menhir FX
+
+Time given by the FocusTracker to the foreground windows, with the fake backend.
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import os
+
+from monitor_utils.focus import FocusTracker
+
+
+class ManualClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_focus_back_to_own_process(backend):
+    # the monitor runs inside the DCC: its own pid is the DCC
+    own_pid = os.getpid()
+    backend.start_process(own_pid, 'maya.exe', title='scene.ma')
+    backend.start_process(4321, 'chrome.exe', title='reference')
+    clock = ManualClock()
+    tracker = FocusTracker(clock)
+    backend.set_foreground(4321)
+    tracker.start()
+    try:
+        clock.now += 60
+        backend.set_foreground(own_pid)
+        clock.now += 300
+        assert tracker.drain() == {4321: 60, own_pid: 300}
+    finally:
+        tracker.stop()
+
+def test_fractions_are_kept_for_the_next_drain(backend):
+    backend.start_process(1234, 'houdini.exe')
+    clock = ManualClock()
+    tracker = FocusTracker(clock)
+    backend.set_foreground(1234)
+    tracker.start()
+    try:
+        clock.now += 10.6
+        assert tracker.drain() == {1234: 10}
+        clock.now += 0.5
+        assert tracker.drain() == {1234: 1}
+    finally:
+        tracker.stop()
@@ -0,0 +1,82 @@
+'''
+For Menhir FX
+
+Queries over the archived weeks, from the summary index.
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+from datetime import date, datetime
+
+from monitor_utils.backup import archive
+from monitor_utils.data_management import push_data, update_data
+from monitor_utils.history import HistoryIndex, history_index
+
+ROBOT = {'project_name': 'ProjB', 'asset_name': 'Robot', 'department': 'ANIM'}
+
+
+def get_week(sessions: list):
+    '''
+    :param sessions: list of tuple (datetime, entity, seconds), in the same week
+    :return: dict, tracker data of the week
+    '''
+    data = {}
+    for now, entity, seconds in sessions:
+        data = update_data(data, entity, seconds, '09:00:00', now)
+    return data
+
+def query(**kwargs):
+    return history_index.query(workers=1, **kwargs)
+
+def archive_weeks(entity: dict):
+    # week 41, ProjA only, and week 42
+    archive.add_week(get_week([(datetime(2026, 10, 5, 10), entity, 600), (datetime(2026, 10, 11, 10), entity, 900)]))
+    archive.add_week(get_week([(datetime(2026, 10, 12, 10), entity, 1200), (datetime(2026, 10, 13, 10), ROBOT, 300)]))
+
+
+def test_date_range_includes_its_bounds(user_data, entity):
+    archive_weeks(entity)
+
+    assert query(start=date(2026, 10, 11), end=date(2026, 10, 12), group_by=('date',)) == {('2026-10-11',): 900, ('2026-10-12',): 1200}
+    assert query(start=date(2026, 10, 13), group_by=('year_week',)) == {('2026_42',): 300}
+    assert query(end=date(2026, 10, 5), group_by=('year_week',)) == {('2026_41',): 600}
+    assert query(start=date(2026, 10, 6), end=date(2026, 10, 10)) == {}
+
+
+def test_filters_skip_the_weeks_without_a_match(user_data, entity, monkeypatch):
+    archive_weeks(entity)
+    matched = []
+    matches = HistoryIndex.matches
+    def recorded(summary, start, end, filters):
+        result = matches(summary, start, end, filters)
+        if result:
+            matched.append(history_index.key(summary.get('week'), summary.get('year')))
+        return result
+    monkeypatch.setattr(HistoryIndex, 'matches', staticmethod(recorded))
+
+    for filters in ({'projects': 'ProjB'}, {'assets': ['Robot']}, {'departments': ('ANIM', 'LIGHT')}):
+        matched.clear()
+        assert query(group_by=('year_week', 'project_name'), **filters) == {('2026_42', 'ProjB'): 300}
+        assert matched == ['2026_42']
+
+    assert query(projects='ProjA', departments='FX', group_by=('year_week',)) == {('2026_41',): 1500, ('2026_42',): 1200}
+    assert query(projects='ProjC') == {}
+
+
+def test_include_current_week(user_data, entity):
+    archive_weeks(entity)
+    push_data(get_week([(datetime(2026, 10, 19, 10), ROBOT, 60)]))
+
+    assert query(group_by=('year_week',)) == {('2026_41',): 1500, ('2026_42',): 1500}
+    assert query(projects='ProjB', group_by=('year_week',), include_current=True) == {('2026_42',): 300, ('2026_43',): 60}
+
+
+def test_week_archived_again_replaces_its_summary(user_data, entity):
+    archive_weeks(entity)
+    assert history_index.sync(workers=1) == 2
+
+    archive.add_week(get_week([(datetime(2026, 10, 12, 10), entity, 2400)]))
+
+    assert history_index.sync(workers=1) == 1
+    assert history_index.sync(workers=1) == 0
+    assert query(group_by=('year_week', 'project_name')) == {('2026_41', 'ProjA'): 1500, ('2026_42', 'ProjA'): 2400}
+    assert len(history_index.load().get('weeks')) == 2
@@ -0,0 +1,85 @@
+'''
+For Menhir FX
+
+Replay and compaction of the journal of the session times.
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import os
+import glob
+
+from monitor_utils.config import mhfx_path
+from monitor_utils.file import reset_user_data
+import monitor_utils.journal as journal
+
+
+def claimed_journals():
+    return glob.glob(f"{glob.escape(mhfx_path.user_tmp_journal)}.*{journal.COMPACTING_EXT}")
+
+
+def test_last_record_of_a_session_wins(user_data, record, session_seconds):
+    journal.append_records([record(60, 0), record(120, 30), record(90, 60)])
+    journal.compact()
+    assert session_seconds() == 90
+    assert not os.path.exists(mhfx_path.user_tmp_journal)
+
+def test_replay_is_idempotent(user_data, record, session_seconds):
+    records = [record(60, 0), record(300, 30)]
+    journal.append_records(records)
+    journal.compact()
+    # a crash after hours.json is written but before the journal is removed replays the same records
+    journal.append_records(records)
+    journal.compact()
+    assert session_seconds() == 300
+
+def test_sessions_are_kept_apart(user_data, record, session_seconds):
+    other = {'project_name': 'ProjA', 'asset_name': 'Bob', 'department': 'Modeling'}
+    journal.append_records([record(60, 0), record(45, 0, entity=other), record(120, 30, first='14:30:00')])
+    journal.compact()
+    # two sessions of the same entity opened at different times are added
+    assert session_seconds() == 60 + 120
+    assert session_seconds(other) == 45
+
+def test_compaction_of_a_claimed_journal(user_data, record, session_seconds):
+    # a compaction claimed this journal and crashed before writing hours.json
+    journal.append_records([record(60, 0), record(600, 30)])
+    claimed = journal.claim_journal()
+    assert len(claimed) == 1 and not os.path.exists(mhfx_path.user_tmp_journal)
+    # records appended since go to a new journal, they are more recent
+    journal.append_records([record(900, 60)])
+
+    journal.compact()
+    assert session_seconds() == 900
+    assert claimed_journals() == []
+    assert not os.path.exists(mhfx_path.user_tmp_journal)
+
+def test_journal_kept_when_the_data_is_not_written(user_data, monkeypatch, record, session_seconds):
+    journal.append_records([record(60, 0)])
+    monkeypatch.setattr(journal, 'apply_records', lambda records: False)
+    journal.compact()
+    assert len(claimed_journals()) == 1
+
+    monkeypatch.undo()
+    journal.compact()
+    assert session_seconds() == 60
+    assert claimed_journals() == []
+
+def test_torn_record_is_ignored(user_data, record, session_seconds):
+    journal.append_records([record(60, 0)])
+    with open(mhfx_path.user_tmp_journal, 'a') as journal_file:
+        journal_file.write('{"ts": 1, "pid": "1", "enti')
+    assert len(journal.read_records(mhfx_path.user_tmp_journal)) == 1
+    journal.compact()
+    assert session_seconds() == 60
+
+def test_reset_removes_the_claimed_journals(user_data, record, session_seconds):
+    journal.append_records([record(60)])
+    # claimed by a compaction that didn't finish
+    journal.claim_journal()
+    journal.append_records([record(120, 30)])
+
+    reset_user_data()
+    journal.compact()
+
+    assert claimed_journals() == []
+    assert session_seconds() == None
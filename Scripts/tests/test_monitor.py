@@ -0,0 +1,34 @@
+'''
+For Menhir FX
+
+Processes of a monitor, with the fake backend.
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+from pathlib import Path
+
+from Monitor import Monitor
+from Process import Process, Status
+from monitor_utils.data_management import get_processes, push_processes
+from monitor_utils.windows import invalidate_visible_pids
+
+SCENE = Path('P:/ProjA/03_Production/Assets/Characters/Bob/Scenefiles/FX/Sim/bob_fx_v001.hip')
+
+
+def test_closed_process_stays_old(user_data, backend):
+    monitor = Monitor()
+    backend.start_process(1111, 'houdini.exe', title='bob_fx_v001.hip')
+    backend.start_process(2222, 'houdini.exe', title='bob_fx_v002.hip')
+    processes = {}
+    for pid in (1111, 2222):
+        processes.update(Process(SCENE, 'houdini.exe', pid, monitor.id).as_dict())
+    push_processes(processes, monitor.id)
+
+    backend.close_process(2222)
+    invalidate_visible_pids()
+    assert monitor.check_processes() == True
+
+    # the next wakeup of the monitor reads its processes again
+    processes = get_processes(monitor.id)
+    assert processes['2222']['status'] == Status.OLD.name
+    assert processes['1111']['status'] != Status.OLD.name
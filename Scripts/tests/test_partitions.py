@@ -0,0 +1,84 @@
+'''
+For Menhir FX
+
+Days storage of the tracker data, one file per day.
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import os
+
+import monitor_utils.data_management as dm
+import monitor_utils.file as file
+from monitor_utils.config import mhfx_path
+from monitor_utils.data_management import apply_records
+from monitor_utils.partitions import DayPartitions, get_partitions
+from monitor_utils.tracker_data import TrackerData
+
+DAY = 86400
+
+
+def record_writes(monkeypatch):
+    '''
+    :return: list, the names of the files written from now on
+    '''
+    written = []
+    write_to_file = file.write_to_file
+    def recorded(content, filename):
+        written.append(os.path.basename(filename))
+        return write_to_file(content, filename)
+    monkeypatch.setattr('monitor_utils.partitions.write_to_file', recorded)
+    monkeypatch.setattr('monitor_utils.persistence.write_to_file', recorded)
+    return written
+
+
+def test_compaction_writes_the_days_of_its_records(storage, record, monkeypatch):
+    storage('days')
+    assert apply_records([record(60), record(600, DAY), record(900, 2 * DAY)])
+    written = record_writes(monkeypatch)
+
+    assert apply_records([record(1200, DAY)])
+
+    assert sorted(written) == ['day_261013.js', 'day_261013.json', 'manifest.js']
+    assert not os.path.exists(mhfx_path.user_data_json)
+
+
+def test_week_is_rebuilt_from_the_days(storage, record):
+    storage('days')
+    assert apply_records([record(60), record(120, 10, first='15:00:00'), record(600, DAY), record(900, 2 * DAY)])
+    partitions = get_partitions()
+
+    data = partitions.as_dict()
+
+    assert [d.get('date') for d in data.get('days')] == ['12/10/26', '13/10/26', '14/10/26']
+    assert data.get('week') == '42' and data.get('total_seconds') == 1680
+    assert data.get('project_totals') == {'ProjA': 1680}
+    assert [d.get('total_seconds') for d in data.get('days')] == [180, 600, 900]
+    assert data == TrackerData(data).as_dict()
+    assert partitions.as_dict(sessions=False).get('days') == [{'date': '12/10/26'}, {'date': '13/10/26'}, {'date': '14/10/26'}]
+
+
+def test_switch_to_json_keeps_the_days_until_hours_json_is_written(storage, record, session_seconds, monkeypatch):
+    storage('days')
+    assert apply_records([record(60), record(600, DAY)])
+    storage('json')
+    # hours.json can't be written, the days are still the reference
+    with monkeypatch.context() as patch:
+        patch.setattr(dm.data_store, 'flush', lambda data: False)
+        assert not apply_records([record(120)])
+    assert DayPartitions(mhfx_path.user_week_dir).exists()
+
+    assert apply_records([record(180)])
+
+    assert not os.path.exists(mhfx_path.user_week_dir)
+    assert file.get_data(mhfx_path.user_data_json).get('total_seconds') == 780
+    assert session_seconds() == 180
+
+
+def test_record_that_fails_does_not_drop_the_others(storage, record):
+    storage('days')
+    broken = dict(record(300), entity=None)
+
+    assert apply_records([record(60), broken, record(120, 10, first='15:00:00'), dict(broken, ts=broken.get('ts') + DAY)])
+
+    assert get_partitions().as_dict().get('total_seconds') == 180
+    assert get_partitions().list_dates() == ['12/10/26']
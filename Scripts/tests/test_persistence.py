@@ -0,0 +1,112 @@
+'''
+For Menhir FX
+
+hours.json and the split report of hours.html.
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import os
+import json
+from datetime import datetime
+
+import monitor_utils.file as file
+from monitor_utils.data_management import update_data
+from monitor_utils.persistence import MANIFEST_PREFIX, MANIFEST_SUFFIX, DataStore
+
+
+def get_week(sessions: list):
+    '''
+    :param sessions: list of tuple (datetime, seconds) of the entity
+    :return: dict, tracker data of the week
+    '''
+    data = {}
+    for now, seconds in sessions:
+        data = update_data(data, {'project_name': 'ProjA', 'asset_name': 'Bob', 'department': 'FX'}, seconds, '09:00:00', now)
+    return data
+
+def get_store(directory):
+    return DataStore(str(directory / 'hours.json'), str(directory / 'report'))
+
+def record_writes(monkeypatch):
+    '''
+    :return: list, the names of the files written from now on
+    '''
+    written = []
+    write_to_file = file.write_to_file
+    def recorded(content, filename):
+        written.append(os.path.basename(filename))
+        return write_to_file(content, filename)
+    monkeypatch.setattr('monitor_utils.persistence.write_to_file', recorded)
+    return written
+
+def read_manifest(store: DataStore):
+    with open(store.manifest_path, 'r') as manifest_file:
+        content = manifest_file.read()
+    assert content.startswith(MANIFEST_PREFIX) and content.endswith(MANIFEST_SUFFIX)
+    return json.loads(content[len(MANIFEST_PREFIX):-len(MANIFEST_SUFFIX)])
+
+def read_day_report(store: DataStore, date: str):
+    with open(os.path.join(store.report_dir, store.day_filename(date)), 'r') as day_file:
+        content = day_file.read()
+    prefix = f'hoursReport.days["{date}"] = '
+    assert content.startswith(prefix) and content.endswith(';\n')
+    return json.loads(content[len(prefix):-2])
+
+
+def test_unchanged_data_is_not_written(tmp_path, monkeypatch):
+    store = get_store(tmp_path)
+    data = get_week([(datetime(2026, 10, 12, 10), 600)])
+    assert store.flush(data)
+    written = record_writes(monkeypatch)
+
+    assert store.flush(json.loads(json.dumps(data)))
+    assert written == []
+
+    # hours.json written by the monitor of another DCC
+    with open(store.json_path, 'w') as json_file:
+        json.dump(get_week([(datetime(2026, 10, 12, 10), 60)]), json_file)
+    assert store.flush(data)
+
+    assert written == ['manifest.js', 'hours.json']
+    assert file.get_data(store.json_path) == data
+
+
+def test_report_is_a_manifest_and_a_file_per_day(tmp_path, monkeypatch):
+    store = get_store(tmp_path)
+    data = get_week([(datetime(2026, 10, 12, 10), 600), (datetime(2026, 10, 13, 10), 900)])
+    assert store.flush(data)
+
+    report = read_manifest(store)
+    assert report.get('days') == {}
+    manifest = report.get('manifest')
+    assert manifest.get('total_seconds') == 1500 and manifest.get('week') == '42'
+    assert [(d.get('date'), d.get('file')) for d in manifest.get('days')] == [('12/10/26', 'day_261012.js'), ('13/10/26', 'day_261013.js')]
+    assert [read_day_report(store, d.get('date')) for d in manifest.get('days')] == data.get('days')
+
+    # a save of today writes the file of today only
+    written = record_writes(monkeypatch)
+    data = get_week([(datetime(2026, 10, 12, 10), 600), (datetime(2026, 10, 13, 10), 1200)])
+    assert store.flush(data)
+    assert sorted(written) == ['day_261013.js', 'hours.json', 'manifest.js']
+    assert read_day_report(store, '13/10/26') == data.get('days')[1]
+
+    # the file of a day gone from the data is removed
+    assert store.flush(get_week([(datetime(2026, 10, 13, 10), 1200)]))
+    assert sorted(os.listdir(store.report_dir)) == ['day_261013.js', 'manifest.js']
+
+
+def test_days_written_one_by_one_keep_the_others(tmp_path):
+    store = get_store(tmp_path)
+    data = get_week([(datetime(2026, 10, 12, 10), 600), (datetime(2026, 10, 13, 10), 900)])
+    header = {key: value for key, value in data.items() if key != 'days'}
+    monday, tuesday = data.get('days')
+    assert store.flush_days(header, {'12/10/26': DataStore.serialize(monday)}, ['12/10/26'])
+    assert store.missing_days(['12/10/26', '13/10/26']) == ['13/10/26']
+
+    # another monitor writes tuesday, the manifest keeps monday
+    other = get_store(tmp_path)
+    assert other.flush_days(header, {'13/10/26': DataStore.serialize(tuesday)}, ['12/10/26', '13/10/26'])
+
+    assert store.missing_days(['12/10/26', '13/10/26']) == []
+    assert [read_day_report(store, date) for date in ('12/10/26', '13/10/26')] == [monday, tuesday]
+    assert not os.path.exists(store.json_path)
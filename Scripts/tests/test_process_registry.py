@@ -0,0 +1,82 @@
+'''
+For Menhir FX
+
+Cached process registries shared by the monitors of the DCCs.
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import os
+
+import monitor_utils.process_registry as process_registry
+from monitor_utils.process_registry import ProcessRegistry, ShardedProcessRegistry
+
+
+def add_process(pid: str, title: str = ''):
+    return lambda processes: dict(processes, **{pid: {'title': title}})
+
+def count_reads(monkeypatch):
+    '''
+    :return: list, the paths of the files parsed by the registries from now on
+    '''
+    reads = []
+    get_data = process_registry.get_data
+    def recorded(path):
+        reads.append(os.path.basename(path))
+        return get_data(path)
+    monkeypatch.setattr(process_registry, 'get_data', recorded)
+    return reads
+
+
+def test_cache_is_read_again_when_another_monitor_writes(tmp_path, monkeypatch):
+    path = str(tmp_path / 'last_process.json')
+    # the registries of two DCCs
+    houdini = ProcessRegistry(path)
+    maya = ProcessRegistry(path)
+    houdini.change(add_process('100'))
+    assert list(maya.read()) == ['100']
+    reads = count_reads(monkeypatch)
+
+    assert list(maya.read()) == ['100']
+    assert reads == []
+
+    maya.change(add_process('200'))
+
+    assert sorted(houdini.read()) == ['100', '200']
+    assert reads == ['last_process.json']
+
+
+def test_pending_changes_are_applied_on_the_file_of_another_monitor(tmp_path):
+    path = str(tmp_path / 'last_process.json')
+    houdini = ProcessRegistry(path)
+    maya = ProcessRegistry(path)
+
+    with houdini.batch():
+        houdini.change(add_process('100'))
+        houdini.change(add_process('100', 'shot_010'))
+        # written while the changes of houdini are pending
+        maya.change(add_process('200'))
+
+    assert ProcessRegistry(path).read() == {'100': {'title': 'shot_010'}, '200': {'title': ''}}
+    assert houdini.read() == maya.read()
+
+
+def test_read_all_parses_the_shards_written_by_the_other_monitors(tmp_path, monkeypatch):
+    directory = str(tmp_path)
+    houdini = ShardedProcessRegistry(directory)
+    maya = ShardedProcessRegistry(directory)
+    houdini.shard('houdini').change(add_process('100'))
+    maya.shard('maya').change(add_process('200'))
+    assert sorted(houdini.read_all()) == ['100', '200']
+    reads = count_reads(monkeypatch)
+
+    maya.shard('maya').change(add_process('201'))
+
+    assert sorted(houdini.read_all()) == ['100', '200', '201']
+    # the shard of houdini didn't change
+    assert reads == ['maya.json']
+
+    # maya is closed, its shard is removed with its last process
+    maya.shard('maya').change(lambda processes: {})
+
+    assert list(houdini.read_all()) == ['100']
+    assert houdini.shard_ids() == ['houdini']
@@ -0,0 +1,118 @@
+'''
+For Menhir FX
+
+SQLite storage of the tracker data.
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import os
+
+import monitor_utils.sqlite_store as sqlite_store
+from monitor_utils.config import mhfx_path
+from monitor_utils.data_management import apply_records
+from monitor_utils.file import get_data, reset_user_data
+from monitor_utils.sqlite_store import SqliteStore, get_store
+
+
+def get_journal_mode(store: SqliteStore):
+    return store.query('PRAGMA journal_mode')[0][0]
+
+
+def test_wal_on_a_local_disk(user_data, backend):
+    store = SqliteStore(os.path.join(user_data, 'hours.db'))
+    try:
+        assert get_journal_mode(store) == 'wal'
+    finally:
+        store.close()
+
+
+def test_no_wal_on_a_network_share(user_data, backend, monkeypatch):
+    monkeypatch.setattr(backend, 'is_network_path', lambda path: True)
+    store = SqliteStore(os.path.join(user_data, 'hours.db'))
+    try:
+        assert get_journal_mode(store) == 'delete'
+    finally:
+        store.close()
+
+
+def test_switch_back_to_sqlite_imports_json(storage, record):
+    storage('sqlite')
+    assert apply_records([record(60)])
+    # a few sessions with the json storage, hours.db isn't written
+    storage('json')
+    assert apply_records([record(600)])
+    storage('sqlite')
+    assert get_store().get_total('week') == 600
+    # the export doesn't overwrite hours.json with the data of the database before the switch
+    assert apply_records([])
+    assert get_data(mhfx_path.user_data_json).get('total_seconds') == 600
+
+def test_reset_clears_database_of_another_storage(storage, record):
+    storage('sqlite')
+    assert apply_records([record(60)])
+    storage('json')
+    reset_user_data()
+    store = SqliteStore(mhfx_path.user_data_db)
+    try:
+        assert store.is_empty()
+    finally:
+        store.close()
+
+
+def get_sums(store: SqliteStore):
+    '''
+    The rollups summed from the project sessions, as rows of the totals table.
+    '''
+    sums = {}
+    for (date, project_name, department), seconds in store.totals(('date', 'project_name', 'department')).items():
+        for key in (('project', date, project_name), ('project', 0, project_name), ('department', date, department),
+                    ('department', 0, department), ('day', date, ''), ('week', 0, '')):
+            sums[key] = sums.get(key, 0) + seconds
+    return sums
+
+def get_totals(store: SqliteStore):
+    return {key: store.get_total(key[0], key[2], key[1] or None) for key in get_sums(store)}
+
+
+def test_update_of_a_session_applies_its_delta(user_data, backend, now, entity):
+    date = now.toordinal()
+    store = SqliteStore(os.path.join(user_data, 'hours.db'))
+    try:
+        store.set_session(date, entity, 36000, 600, 36600)
+        store.set_session(date, dict(entity, department='ANIM'), 39600, 300, 39900)
+        store.set_session(date, entity, 36000, 660, 36660)
+        # the same time set again, as a replay of the journal
+        store.set_session(date, entity, 36000, 660, 36660)
+
+        assert store.get_total('week') == 960
+        assert store.get_total('department', 'FX', date) == 660
+        assert store.get_total('project', 'ProjA') == 960
+        assert get_totals(store) == get_sums(store)
+    finally:
+        store.close()
+
+
+def test_totals_rebuilt_at_the_upgrade_of_a_version_1_database(user_data, backend, now, entity):
+    date = now.toordinal()
+    path = os.path.join(user_data, 'hours.db')
+    store = SqliteStore(path)
+    try:
+        store.set_session(date, entity, 36000, 600, 36600)
+        store.set_session(date, dict(entity, department='ANIM'), 39600, 300, 39900)
+        store.set_session(date - 1, dict(entity, project_name='ProjB'), 36000, 900, 36900)
+        # a database of the version 1: no totals table, no rollup
+        store.connect().executescript('DROP TRIGGER project_session_rollup; DROP TABLE totals; PRAGMA user_version=1;')
+    finally:
+        store.close()
+
+    store = SqliteStore(path)
+    try:
+        assert store.query('PRAGMA user_version') == [(sqlite_store.SCHEMA_VERSION,)]
+        assert store.get_total('week') == 1800
+        assert get_totals(store) == get_sums(store)
+        # the rollups keep up with the sessions after the upgrade
+        store.set_session(date, entity, 36000, 1200, 37200)
+        assert store.get_total('week') == 2400
+        assert get_totals(store) == get_sums(store)
+    finally:
+        store.close()
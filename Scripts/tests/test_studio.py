@@ -0,0 +1,67 @@
+'''
+For Menhir FX
+
+Studio rollup of the data folders of the artists.
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+import os
+import json
+from datetime import datetime
+
+from monitor_utils.backup import BackupArchive
+from monitor_utils.data_management import update_data
+from monitor_utils.studio import StudioStore
+
+
+def get_week(entity: dict, now: datetime, seconds: int, user_id: str = 'bob'):
+    data = update_data({}, entity, seconds, '09:00:00', now)
+    data['user_id'] = user_id
+    return data
+
+def write_current(user_dir: str, data: dict):
+    with open(os.path.join(user_dir, 'hours.json'), 'w') as json_file:
+        json.dump(data, json_file)
+
+def archive_week(user_dir: str, data: dict):
+    backup_dir = os.path.join(user_dir, 'backup')
+    os.makedirs(backup_dir, exist_ok=True)
+    BackupArchive(os.path.join(backup_dir, 'hours_archive.gz'), os.path.join(backup_dir, 'index.json')).add_week(data)
+
+def get_store(user_data: str):
+    return StudioStore(os.path.join(user_data, 'studio.db'))
+
+
+def test_reset_week_keeps_the_user(user_data, tmp_path, entity):
+    user_dir = str(tmp_path / 'bob')
+    os.makedirs(user_dir)
+    # week 41 archived and hours.json reset, as after a rollover
+    archive_week(user_dir, get_week(entity, datetime(2026, 10, 5, 10), 3600))
+    write_current(user_dir, {})
+    store = get_store(user_data)
+    try:
+        store.scan([user_dir], workers=1)
+        write_current(user_dir, get_week(entity, datetime(2026, 10, 12, 10), 1800))
+        store.scan([user_dir], workers=1)
+
+        assert store.totals(('user', 'year_week')) == {('bob', '2026_41'): 3600, ('bob', '2026_42'): 1800}
+    finally:
+        store.close()
+
+
+def test_rows_move_to_the_user_id(user_data, tmp_path, entity):
+    user_dir = str(tmp_path / 'bob')
+    os.makedirs(user_dir)
+    write_current(user_dir, get_week(entity, datetime(2026, 10, 12, 10), 1800, user_id=''))
+    store = get_store(user_data)
+    try:
+        store.scan([user_dir], workers=1)
+        assert list(store.totals(('user',))) == [(os.path.normpath(os.path.join(user_dir, '')),)]
+
+        write_current(user_dir, get_week(entity, datetime(2026, 10, 12, 11), 2400))
+        store.scan([user_dir], workers=1)
+
+        assert store.totals(('user',)) == {('bob',): 2400}
+        assert store.query('SELECT user FROM users') == [('bob',)]
+    finally:
+        store.close()
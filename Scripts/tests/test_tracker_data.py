@@ -0,0 +1,78 @@
+'''
+For Menhir FX
+
+Rollups of the totals of the tracker data.
+
+author: Angele Sionneau - asionneau@artfx.fr
+'''
+from monitor_utils.tracker_data import TrackerData
+
+ANIM = {'project_name': 'ProjA', 'asset_name': 'Bob', 'department': 'ANIM'}
+ROBOT = {'project_name': 'ProjB', 'asset_name': 'Robot', 'department': 'FX'}
+
+
+def get_totals(data: TrackerData, date: int):
+    return (
+        data.get_week_total(),
+        data.get_day_total(date),
+        data.get_project_total('ProjA'), data.get_project_total('ProjA', date), data.get_project_total('ProjB'),
+        data.get_department_total('FX'), data.get_department_total('FX', date), data.get_department_total('ANIM')
+    )
+
+def get_sums(data: TrackerData, date: int):
+    '''
+    The totals summed from the asset sessions, in the order of get_totals.
+    '''
+    def total(day: int = None, project: str = None, department: str = None):
+        seconds = 0
+        for (session_date, project_name, _, session_department, _), session in data.asset_sessions.items():
+            if day in (None, session_date) and project in (None, project_name) and department in (None, session_department):
+                seconds += session.seconds
+        return seconds
+    return (
+        total(), total(date),
+        total(project='ProjA'), total(date, 'ProjA'), total(project='ProjB'),
+        total(department='FX'), total(date, department='FX'), total(department='ANIM')
+    )
+
+def test_update_applies_its_delta(now, entity):
+    date = now.toordinal()
+    data = TrackerData()
+    ps, session = data.get_or_create_session(date, entity, 36000)
+    data.set_session_time(ps, session, 600, 36600)
+    ps, session = data.get_or_create_session(date, ANIM, 39600)
+    data.set_session_time(ps, session, 300, 39900)
+    ps, session = data.get_or_create_session(date - 1, ROBOT, 36000)
+    data.set_session_time(ps, session, 900, 36900)
+
+    ps, session = data.get_or_create_session(date, entity, 36000)
+    data.set_session_time(ps, session, 660, 36660)
+
+    assert get_totals(data, date) == (1860, 960, 960, 960, 900, 1560, 660, 300)
+    assert get_totals(data, date) == get_sums(data, date)
+
+def test_same_time_is_not_counted_twice(now, entity):
+    date = now.toordinal()
+    data = TrackerData()
+    for _ in range(3):
+        ps, session = data.get_or_create_session(date, entity, 36000)
+        data.set_session_time(ps, session, 600, 36600)
+
+    assert get_totals(data, date) == (600, 600, 600, 600, 0, 600, 600, 0)
+    assert ps.seconds == 600
+
+def test_totals_are_rebuilt_from_the_sessions(now, entity):
+    date = now.toordinal()
+    data = TrackerData()
+    for start, seconds in ((36000, 600), (39600, 1200)):
+        ps, session = data.get_or_create_session(date, entity, start)
+        data.set_session_time(ps, session, seconds, start + seconds)
+    ps, session = data.get_or_create_session(date - 1, ROBOT, 36000)
+    data.set_session_time(ps, session, 900, 36900)
+    saved = data.as_dict()
+    # the totals of a hours.json edited by hand are not read
+    saved['total_seconds'] = 1
+
+    loaded = TrackerData(saved)
+
+    assert get_totals(loaded, date) == get_totals(data, date) == (2700, 1800, 1800, 1800, 900, 2700, 1800, 0)